@@ -0,0 +1,141 @@
+"""Calendário de agendamentos em memória com capacidade diária por operação.
+
+Para cada tipo de operação o calendário guarda quantos agendamentos existem
+por dia e, para os tipos com capacidade configurada, a lista ordenada dos
+intervalos de dias lotados ([início, fim] em ordinais de data, sem
+sobreposição). Verificar um dia é uma consulta a dicionário e a próxima data
+disponível sai de uma busca binária nos intervalos, sem sondar o banco dia a
+dia.
+"""
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+
+
+class CalendarioAgendamentos:
+    def __init__(self, capacidades=None):
+        self.capacidades = dict(capacidades or {})  # tipo -> limite diário (None = sem limite)
+        self._contagens = defaultdict(lambda: defaultdict(int))  # tipo -> ordinal -> total
+        self._lotados = defaultdict(list)                        # tipo -> [[inicio, fim], ...]
+        self._lock = threading.RLock()
+
+    @classmethod
+    def carregar(cls, db, a_partir=None):
+        """Monta o calendário a partir das tabelas (só datas de ``a_partir`` em diante)"""
+        calendario = cls(db.consultar(
+            "SELECT tipo_operacao, limite_diario FROM capacidade_operacoes"))
+        a_partir = (a_partir or date.today()).isoformat()
+        # Totais por dia já mantidos pelos triggers de resumo_agendamentos; a
+        # capacidade é do terminal, então soma os agendamentos de todas as empresas
+        for tipo, data, total in db.iterar("""SELECT tipo_operacao, data_agendamento, SUM(total)
+                                              FROM resumo_agendamentos
+                                              WHERE data_agendamento >= ? AND total > 0
+                                              GROUP BY tipo_operacao, data_agendamento""",
+                                           (a_partir,)):
+            calendario._contagens[tipo][date.fromisoformat(data).toordinal()] = total
+        for tipo in calendario.capacidades:
+            calendario._recalcular_lotados(tipo)
+        return calendario
+
+    # Intervalos de dias lotados
+
+    def _recalcular_lotados(self, tipo):
+        limite = self.capacidades.get(tipo)
+        intervalos = []
+        if limite is not None:
+            for dia in sorted(d for d, total in self._contagens[tipo].items() if total >= limite):
+                if intervalos and intervalos[-1][1] == dia - 1:
+                    intervalos[-1][1] = dia
+                else:
+                    intervalos.append([dia, dia])
+        self._lotados[tipo] = intervalos
+
+    def _intervalo_com(self, intervalos, dia):
+        """Índice do intervalo que contém ``dia`` ou -1"""
+        i = bisect_right(intervalos, [dia, float('inf')]) - 1
+        return i if i >= 0 and intervalos[i][1] >= dia else -1
+
+    def _marcar_lotado(self, intervalos, dia):
+        i = bisect_right(intervalos, [dia, float('inf')])
+        junta_anterior = i > 0 and intervalos[i - 1][1] == dia - 1
+        junta_posterior = i < len(intervalos) and intervalos[i][0] == dia + 1
+        if junta_anterior and junta_posterior:
+            intervalos[i - 1][1] = intervalos[i][1]
+            del intervalos[i]
+        elif junta_anterior:
+            intervalos[i - 1][1] = dia
+        elif junta_posterior:
+            intervalos[i][0] = dia
+        else:
+            intervalos.insert(i, [dia, dia])
+
+    def _desmarcar_lotado(self, intervalos, dia):
+        i = self._intervalo_com(intervalos, dia)
+        if i < 0:
+            return
+        inicio, fim = intervalos[i]
+        if inicio == fim:
+            del intervalos[i]
+        elif dia == inicio:
+            intervalos[i][0] = dia + 1
+        elif dia == fim:
+            intervalos[i][1] = dia - 1
+        else:
+            intervalos[i][1] = dia - 1
+            intervalos.insert(i + 1, [dia + 1, fim])
+
+    # Consultas e atualização
+
+    def registrar(self, tipo, data, quantidade=1):
+        """Soma ``quantidade`` (negativa na remoção) ao total de ``tipo`` em ``data``"""
+        dia = data.toordinal()
+        with self._lock:
+            contagens = self._contagens[tipo]
+            anterior = contagens[dia]
+            contagens[dia] = max(0, anterior + quantidade)
+            if not contagens[dia]:
+                del contagens[dia]
+
+            limite = self.capacidades.get(tipo)
+            if limite is None:
+                return
+            estava_lotado, esta_lotado = anterior >= limite, contagens.get(dia, 0) >= limite
+            if esta_lotado and not estava_lotado:
+                self._marcar_lotado(self._lotados[tipo], dia)
+            elif estava_lotado and not esta_lotado:
+                self._desmarcar_lotado(self._lotados[tipo], dia)
+
+    def total(self, tipo, data):
+        with self._lock:
+            return self._contagens[tipo].get(data.toordinal(), 0)
+
+    def vagas(self, tipo, data):
+        """Agendamentos ainda aceitos no dia (None quando não há limite)"""
+        limite = self.capacidades.get(tipo)
+        if limite is None:
+            return None
+        return max(0, limite - self.total(tipo, data))
+
+    def disponivel(self, tipo, data):
+        return self.vagas(tipo, data) != 0
+
+    def proxima_data(self, tipo, a_partir):
+        """Primeiro dia a partir de ``a_partir`` com vaga para ``tipo``, ou None"""
+        limite = self.capacidades.get(tipo)
+        if limite is not None and limite <= 0:
+            return None
+        dia = a_partir.toordinal()
+        with self._lock:
+            intervalos = self._lotados.get(tipo, [])
+            i = self._intervalo_com(intervalos, dia)
+            # Intervalos nunca são adjacentes, então o dia seguinte ao fim está livre
+            return date.fromordinal(intervalos[i][1] + 1 if i >= 0 else dia)
+
+    def definir_capacidade(self, tipo, limite):
+        with self._lock:
+            if limite is None:
+                self.capacidades.pop(tipo, None)
+            else:
+                self.capacidades[tipo] = limite
+            self._recalcular_lotados(tipo)
@@ -0,0 +1,339 @@
+"""API HTTP/JSON local sobre o ServicoContainers (somente biblioteca padrão).
+
+Rotas (exceto POST /sessoes, exigem o cabeçalho "Authorization: Bearer <token>"):
+    POST   /sessoes               {"cnpj": ..., "senha": ...} -> {"token": ..., "expira_em": ...}
+    DELETE /sessoes
+    GET    /containers            ?apos=&limite=&texto=&prefixo_id=&status=...
+    POST   /containers            {"id": ..., "tipo_container": ..., ...}
+    GET    /containers/<id>
+    PUT    /containers/<id>       {"tipo_container": ..., "status": ..., ...}
+    GET    /containers/<id>/eventos  ?de=&ate= (timestamps Unix)
+    GET    /containers/<id>/arquivo  agendamentos e eventos arquivados
+    DELETE /containers/<id>       ?cascata=1
+    GET    /agendamentos          ?apos=&limite=&container_id=
+    POST   /agendamentos          {"container_id": ..., "data": ..., "tipo_operacao": ...}
+    POST   /agendamentos/lote     {"container_ids": [...], "data": ..., "tipo_operacao": ..., "ajustar": false}
+    POST   /agendamentos/recorrentes  {"tipo_operacao": ..., "inicio": ..., "fim": ..., "intervalo_dias": ...,
+                                   "status": ..., "tipo_container": ...}
+    GET    /agendamentos/proxima-data  ?tipo_operacao=&a_partir=
+    DELETE /agendamentos/<id>
+    POST   /agendamentos/<id>/conclusao
+    GET    /painel                ?dias=14
+    POST   /sincronizacao         {"origem": ..., "alteracoes": [{"ts": ..., "tabela": ..., ...}]}
+    GET    /sincronizacao         ?apos=&limite=&origem=
+
+Cada token só enxerga os containers e agendamentos da empresa (CNPJ) que o
+obteve. A capacidade diária das operações é do terminal e não é exposta
+aqui: é definida pela administração (cli.py capacidade). As rotas /sincronizacao recebem e distribuem as alterações dos
+terminais que trabalham com banco próprio (ver sincronizacao.py).
+"""
+import json
+import re
+import sqlite3
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from exportacao import COLUNAS
+from filtros import FiltroContainers
+from servicos import Conflito, Empresas, NaoAutenticado, NaoEncontrado
+from sincronizacao import ler_mudanca, ler_registro, mesclar
+from validacao import OperacaoInvalida
+
+LIMITE_MAXIMO = 1000
+
+
+def _como_dict(tabela, linha):
+    return dict(zip(COLUNAS[tabela], linha))
+
+
+def _pagina(tabela, linhas):
+    return {'itens': [_como_dict(tabela, linha) for linha in linhas],
+            'proximo': linhas[-1][0] if linhas else None}
+
+
+def _texto(corpo, campo):
+    """Campo de texto do corpo (ausente vale ''); outro tipo JSON é 422, não um erro interno"""
+    valor = corpo.get(campo)
+    if valor is None:
+        return ''
+    if not isinstance(valor, str):
+        raise OperacaoInvalida(f"{campo} deve ser texto")
+    return valor
+
+
+def _inteiro(corpo, campo):
+    valor = corpo.get(campo)
+    if valor is None:
+        return 0
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise OperacaoInvalida(f"{campo} deve ser um número inteiro")
+    return valor
+
+
+class ManipuladorApi(BaseHTTPRequestHandler):
+    # Conexões persistentes: clientes de alto volume reaproveitam o socket.
+    # Sem o algoritmo de Nagle, cabeçalho e corpo escritos separadamente não
+    # ficam retidos esperando o ACK atrasado do cliente (~40 ms por resposta)
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    ROTAS = (
+        ('POST', r'/sessoes', 'iniciar_sessao'),
+        ('DELETE', r'/sessoes', 'encerrar_sessao'),
+        ('GET', r'/containers', 'listar_containers'),
+        ('POST', r'/containers', 'adicionar_container'),
+        ('GET', r'/containers/(?P<chave>[^/]+)', 'obter_container'),
+        ('PUT', r'/containers/(?P<chave>[^/]+)', 'atualizar_container'),
+        ('DELETE', r'/containers/(?P<chave>[^/]+)', 'remover_container'),
+        ('GET', r'/containers/(?P<chave>[^/]+)/eventos', 'historico_container'),
+        ('GET', r'/containers/(?P<chave>[^/]+)/arquivo', 'consultar_arquivo'),
+        ('GET', r'/agendamentos', 'listar_agendamentos'),
+        ('POST', r'/agendamentos', 'criar_agendamento'),
+        ('POST', r'/agendamentos/lote', 'agendar_em_lote'),
+        ('POST', r'/agendamentos/recorrentes', 'agendar_recorrente'),
+        ('GET', r'/agendamentos/proxima-data', 'proxima_data_disponivel'),
+        ('DELETE', r'/agendamentos/(?P<chave>\d+)', 'remover_agendamento'),
+        ('POST', r'/agendamentos/(?P<chave>\d+)/conclusao', 'concluir_agendamento'),
+        ('GET', r'/painel', 'resumo_painel'),
+        ('POST', r'/sincronizacao', 'receber_alteracoes'),
+        ('GET', r'/sincronizacao', 'enviar_alteracoes'),
+    )
+    ROTAS_PUBLICAS = {'iniciar_sessao'}
+    usuario = None
+
+    @property
+    def servico(self):
+        """Serviço da empresa autenticada; antes da autenticação, o central"""
+        if self.usuario is None:
+            return self.server.servico
+        return self.server.empresas.servico(self.usuario[1])
+
+    def do_GET(self):
+        self._despachar('GET')
+
+    def do_POST(self):
+        self._despachar('POST')
+
+    def do_PUT(self):
+        self._despachar('PUT')
+
+    def do_DELETE(self):
+        self._despachar('DELETE')
+
+    def log_message(self, formato, *args):
+        if self.server.verboso:
+            super().log_message(formato, *args)
+
+    def _despachar(self, metodo):
+        url = urlsplit(self.path)
+        self.query = {nome: valores[-1] for nome, valores in parse_qs(url.query).items()}
+        corpo = self._ler_corpo()
+        # O manipulador atende várias requisições na mesma conexão
+        self.usuario = None
+
+        for metodo_rota, padrao, nome in self.ROTAS:
+            encontrada = re.fullmatch(padrao, url.path)
+            if metodo_rota != metodo or not encontrada:
+                continue
+            argumentos = {k: unquote(v) for k, v in encontrada.groupdict().items()}
+            inicio = time.perf_counter()
+            try:
+                if nome not in self.ROTAS_PUBLICAS:
+                    # Validação do token: consulta em memória, sem recalcular o hash
+                    self.usuario = self.servico.usuario_da_sessao(self._token())
+                if metodo in ('POST', 'PUT'):
+                    if not isinstance(corpo, dict):
+                        raise OperacaoInvalida("Corpo da requisição deve ser um objeto JSON")
+                    argumentos['corpo'] = corpo
+                status, resposta = getattr(self, nome)(**argumentos)
+            except NaoAutenticado as e:
+                status, resposta = HTTPStatus.UNAUTHORIZED, {'erro': str(e)}
+            except NaoEncontrado as e:
+                status, resposta = HTTPStatus.NOT_FOUND, {'erro': str(e)}
+            except Conflito as e:
+                status, resposta = HTTPStatus.CONFLICT, {'erro': str(e)}
+            except (OperacaoInvalida, ValueError) as e:
+                status, resposta = HTTPStatus.UNPROCESSABLE_ENTITY, {'erro': str(e)}
+            except sqlite3.Error as e:
+                status, resposta = HTTPStatus.SERVICE_UNAVAILABLE, {'erro': str(e)}
+            self._responder(status, resposta)
+            if self.server.metricas is not None:
+                self.server.metricas.registrar('handler', f"{metodo} {padrao}",
+                                               (time.perf_counter() - inicio) * 1000)
+            return
+
+        self._responder(HTTPStatus.NOT_FOUND, {'erro': "Rota não encontrada"})
+
+    def _token(self):
+        autorizacao = self.headers.get('Authorization', '')
+        tipo, _, token = autorizacao.partition(' ')
+        return token.strip() if tipo.lower() == 'bearer' else None
+
+    def _ler_corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if not tamanho:
+            # Corpo vazio equivale a um objeto sem campos
+            return {}
+        try:
+            return json.loads(self.rfile.read(tamanho))
+        except ValueError:
+            return None
+
+    def _responder(self, status, resposta):
+        dados = json.dumps(resposta, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _limite(self):
+        return max(1, min(int(self.query.get('limite', 200)), LIMITE_MAXIMO))
+
+    # Sessões
+
+    def iniciar_sessao(self, corpo):
+        token, expira_em = self.servico.iniciar_sessao(_texto(corpo, 'cnpj'),
+                                                       _texto(corpo, 'senha'))
+        return HTTPStatus.CREATED, {'token': token, 'expira_em': int(expira_em)}
+
+    def encerrar_sessao(self):
+        self.servico.encerrar_sessao(self._token())
+        return HTTPStatus.OK, {}
+
+    # Containers
+
+    def listar_containers(self):
+        filtro = FiltroContainers(**{campo: self.query.get(campo)
+                                     for campo in FiltroContainers.CAMPOS})
+        linhas = self.servico.listar_containers(filtro, apos=self.query.get('apos'),
+                                                limite=self._limite())
+        return HTTPStatus.OK, _pagina('containers', linhas)
+
+    def adicionar_container(self, corpo):
+        alteracoes = self.servico.adicionar_container(corpo)
+        return HTTPStatus.CREATED, _como_dict('containers', alteracoes[0].linha)
+
+    def obter_container(self, chave):
+        return HTTPStatus.OK, _como_dict('containers', self.servico.obter_container(chave))
+
+    def atualizar_container(self, chave, corpo):
+        alteracoes = self.servico.atualizar_container(chave, corpo)
+        return HTTPStatus.OK, _como_dict('containers', alteracoes[0].linha)
+
+    def historico_container(self, chave):
+        de, ate = self.query.get('de'), self.query.get('ate')
+        eventos = self.servico.historico_container(chave, int(de) if de else None,
+                                                   int(ate) if ate else None)
+        return HTTPStatus.OK, {'itens': [e._asdict() for e in eventos]}
+
+    def consultar_arquivo(self, chave):
+        agendamentos, eventos = self.servico.consultar_arquivo(chave)
+        return HTTPStatus.OK, {'agendamentos': [_como_dict('agendamentos', linha)
+                                                for linha in agendamentos],
+                               'eventos': [e._asdict() for e in eventos]}
+
+    def remover_container(self, chave):
+        cascata = self.query.get('cascata', '').lower() in ('1', 'true', 'sim')
+        alteracoes = self.servico.remover_container(chave, cascata=cascata)
+        return HTTPStatus.OK, {'removidos': len(alteracoes)}
+
+    # Agendamentos
+
+    def listar_agendamentos(self):
+        apos = self.query.get('apos')
+        linhas = self.servico.listar_agendamentos(
+            container_id=self.query.get('container_id'),
+            apos=int(apos) if apos else None, limite=self._limite())
+        return HTTPStatus.OK, _pagina('agendamentos', linhas)
+
+    def criar_agendamento(self, corpo):
+        alteracoes = self.servico.criar_agendamento(
+            _texto(corpo, 'container_id'), _texto(corpo, 'data'), _texto(corpo, 'tipo_operacao'))
+        return HTTPStatus.CREATED, _como_dict('agendamentos', alteracoes[0].linha)
+
+    def agendar_em_lote(self, corpo):
+        container_ids = corpo.get('container_ids')
+        if not isinstance(container_ids, list) or not all(isinstance(c, str)
+                                                          for c in container_ids):
+            raise OperacaoInvalida("container_ids deve ser uma lista de textos")
+        alteracoes, rejeitados = self.servico.agendar_em_lote(
+            container_ids, _texto(corpo, 'data'), _texto(corpo, 'tipo_operacao'),
+            ajustar=bool(corpo.get('ajustar')))
+        return HTTPStatus.CREATED, {
+            'criados': [_como_dict('agendamentos', a.linha) for a in alteracoes],
+            'rejeitados': [{'container_id': c, 'erro': motivo} for c, motivo in rejeitados]}
+
+    def agendar_recorrente(self, corpo):
+        filtro = FiltroContainers(status=_texto(corpo, 'status'),
+                                  tipo_container=_texto(corpo, 'tipo_container'))
+        resultado = self.servico.agendar_recorrente(
+            _texto(corpo, 'tipo_operacao'), _texto(corpo, 'inicio'), _texto(corpo, 'fim'),
+            _inteiro(corpo, 'intervalo_dias'), filtro)
+        return HTTPStatus.CREATED, resultado._asdict()
+
+    def proxima_data_disponivel(self):
+        data = self.servico.proxima_data_disponivel(self.query.get('tipo_operacao'),
+                                                    self.query.get('a_partir'))
+        return HTTPStatus.OK, {'data': data}
+
+    def remover_agendamento(self, chave):
+        self.servico.remover_agendamento(int(chave))
+        return HTTPStatus.OK, {'removidos': 1}
+
+    def concluir_agendamento(self, chave, corpo):
+        self.servico.concluir_agendamento(int(chave))
+        return HTTPStatus.OK, {'concluidos': 1}
+
+    # Painel
+
+    def resumo_painel(self):
+        resumo = self.servico.resumo_painel(dias=max(1, min(int(self.query.get('dias', 14)), 366)))
+        return HTTPStatus.OK, {
+            'total_containers': resumo['total_containers'],
+            **{dimensao: dict(resumo[dimensao])
+               for dimensao in ('status', 'tipo_container', 'origem', 'destino')},
+            'operacoes': [{'data': data, 'tipo_operacao': tipo, 'total': total}
+                          for data, tipo, total in resumo['operacoes']]}
+
+    # Sincronização
+
+    def receber_alteracoes(self, corpo):
+        origem, alteracoes = corpo.get('origem'), corpo.get('alteracoes')
+        if not origem or not isinstance(alteracoes, list):
+            raise OperacaoInvalida("Informe origem e a lista de alteracoes")
+        if len(alteracoes) > LIMITE_MAXIMO:
+            raise OperacaoInvalida(f"No máximo {LIMITE_MAXIMO} alterações por requisição")
+        try:
+            mudancas = [ler_mudanca(item) for item in alteracoes]
+        except (KeyError, TypeError, AttributeError, ValueError):
+            raise OperacaoInvalida("Alteração mal formada")
+        resultados = mesclar(self.servico.sem_fila(), mudancas, origem=str(origem))
+        return HTTPStatus.OK, {'resultados': [{'resultado': resultado, 'erro': erro,
+                                               'atual': atual}
+                                              for resultado, erro, atual in resultados]}
+
+    def enviar_alteracoes(self):
+        mudancas, proximo = ler_registro(self.servico.db, self.servico.cnpj,
+                                         int(self.query.get('apos', 0)),
+                                         self.query.get('origem'), self._limite())
+        return HTTPStatus.OK, {'alteracoes': [m._asdict() for m in mudancas],
+                               'proximo': proximo}
+
+
+def criar_servidor(servico, host='127.0.0.1', porta=8080, verboso=False, empresas=None,
+                   metricas=None):
+    """Cria o servidor HTTP (uma thread por conexão) sem iniciá-lo.
+
+    ``empresas`` fornece o serviço de cada CNPJ; por padrão, visões do banco
+    de ``servico``. Com ``metricas`` cada rota registra o tempo de resposta.
+    """
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorApi)
+    servidor.daemon_threads = True
+    servidor.servico = servico
+    servidor.empresas = empresas or Empresas(servico)
+    servidor.verboso = verboso
+    servidor.metricas = metricas
+    return servidor
@@ -0,0 +1,211 @@
+"""Arquivamento dos agendamentos vencidos e do histórico dos containers removidos.
+
+As tabelas do dia a dia só crescem: o agendamento não concluído continua em
+agendamentos depois da data e o histórico de um container removido fica em
+eventos_container para sempre. arquivar() move, em lotes, os agendamentos
+com data anterior à retenção e os eventos dos containers removidos há mais
+tempo que ela para um arquivo SQLite separado (<banco>_arquivo.db), em
+blocos por container compactados com zlib. consultar_arquivo() os lê de
+volta sob demanda.
+
+Cada lote passa por uma tabela temporária com os ids escolhidos e é copiado
+para o arquivo (anexado com ATTACH) e apagado do banco na mesma transação.
+Com WAL a transação não é atômica entre os dois arquivos: uma queda entre
+os dois commits pode repetir um lote no arquivo, e a leitura descarta as
+repetições pelo id.
+
+As páginas liberadas voltam ao sistema com PRAGMA incremental_vacuum
+(compactar). Bancos criados antes do auto_vacuum incremental precisam de
+um VACUUM completo uma única vez; como ele pode renumerar o rowid dos
+containers, o índice FTS é reconstruído em seguida.
+"""
+import json
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+from datetime import date, timedelta
+from urllib.parse import quote
+
+from eventos import Evento, REMOVIDO
+
+DIAS_RETENCAO = 90
+TAMANHO_LOTE = 5000
+AUTO_VACUUM_INCREMENTAL = 2
+
+ResultadoArquivamento = namedtuple('ResultadoArquivamento',
+                                   'agendamentos eventos paginas_liberadas')
+
+_SCHEMA_ARQUIVO = (
+    # dados: JSON compactado com as linhas do container, sem container_id/cnpj
+    '''CREATE TABLE IF NOT EXISTS arquivo.blocos (
+           id INTEGER PRIMARY KEY,
+           tabela TEXT NOT NULL,
+           container_id TEXT NOT NULL,
+           cnpj TEXT,
+           linhas INTEGER NOT NULL,
+           dados BLOB NOT NULL)''',
+    "CREATE INDEX IF NOT EXISTS arquivo.idx_blocos_container ON blocos(container_id, tabela)",
+)
+
+
+def caminho_arquivo(db):
+    base, _ = os.path.splitext(db.caminho)
+    return f"{base}_arquivo.db"
+
+
+def _gravar_blocos(db, tabela, linhas):
+    """Grava ``linhas`` (container_id, cnpj, *valores) em um bloco por container e empresa"""
+    blocos = {}
+    for container_id, cnpj, *valores in linhas:
+        blocos.setdefault((container_id, cnpj), []).append(valores)
+    db.executar_muitos(
+        "INSERT INTO arquivo.blocos (tabela, container_id, cnpj, linhas, dados) VALUES (?, ?, ?, ?, ?)",
+        [(tabela, container_id, cnpj, len(valores),
+          zlib.compress(json.dumps(valores, ensure_ascii=False, separators=(',', ':'))
+                        .encode('utf-8'), 9))
+         for (container_id, cnpj), valores in blocos.items()])
+
+
+def _arquivar_agendamentos(db, limite_data, tamanho_lote):
+    db.executar("CREATE TEMP TABLE IF NOT EXISTS arquivamento_agendamentos (id INTEGER PRIMARY KEY)")
+    total = ultimo_id = 0
+    try:
+        while True:
+            with db.transacao():
+                # Keyset pelo id: cada lote continua de onde o anterior parou
+                if not db.executar("""INSERT INTO arquivamento_agendamentos
+                                      SELECT id FROM agendamentos
+                                      WHERE id > ? AND data_agendamento < ?
+                                      ORDER BY id LIMIT ?""",
+                                   (ultimo_id, limite_data, tamanho_lote)).rowcount:
+                    break
+                linhas = db.consultar("""SELECT a.container_id, a.cnpj, a.id, a.data_agendamento,
+                                                a.tipo_operacao
+                                         FROM arquivamento_agendamentos l
+                                         JOIN agendamentos a ON a.id = l.id
+                                         ORDER BY a.container_id, a.id""")
+                _gravar_blocos(db, 'agendamentos', linhas)
+                db.executar("""DELETE FROM agendamentos
+                               WHERE id IN (SELECT id FROM arquivamento_agendamentos)""")
+                ultimo_id = db.consultar_um("SELECT MAX(id) FROM arquivamento_agendamentos")[0]
+                db.executar("DELETE FROM arquivamento_agendamentos")
+            total += len(linhas)
+    finally:
+        db.executar("DELETE FROM arquivamento_agendamentos")
+    return total
+
+
+def _arquivar_eventos(db, limite_ts, tamanho_lote):
+    db.executar("""CREATE TEMP TABLE IF NOT EXISTS arquivamento_containers
+                   (id TEXT PRIMARY KEY) WITHOUT ROWID""")
+    total, ultimo = 0, ''
+    try:
+        # Removidos (não existem mais e o último evento é anterior à retenção);
+        # um ID cadastrado de novo continua com o histórico todo no banco
+        db.executar("""INSERT INTO arquivamento_containers
+                       SELECT container_id FROM eventos_container e
+                       WHERE NOT EXISTS (SELECT 1 FROM containers c WHERE c.id = e.container_id)
+                       GROUP BY container_id
+                       HAVING max(ts) < ? AND max(tipo = ?)""", (limite_ts, REMOVIDO))
+        while True:
+            with db.transacao():
+                limite = db.consultar_um("""SELECT MAX(id) FROM (
+                                                SELECT id FROM arquivamento_containers
+                                                WHERE id > ? ORDER BY id LIMIT ?)""",
+                                         (ultimo, tamanho_lote))[0]
+                if limite is None:
+                    break
+                linhas = db.consultar("""SELECT e.container_id, e.cnpj, e.id, e.ts, e.tipo,
+                                                e.valor, e.detalhe
+                                         FROM arquivamento_containers a
+                                         JOIN eventos_container e ON e.container_id = a.id
+                                         WHERE a.id > ? AND a.id <= ?
+                                         ORDER BY e.container_id, e.ts, e.id""", (ultimo, limite))
+                _gravar_blocos(db, 'eventos_container', linhas)
+                db.executar("""DELETE FROM eventos_container WHERE container_id IN
+                                   (SELECT id FROM arquivamento_containers
+                                    WHERE id > ? AND id <= ?)""", (ultimo, limite))
+            total += len(linhas)
+            ultimo = limite
+    finally:
+        db.executar("DELETE FROM arquivamento_containers")
+    return total
+
+
+def arquivar(db, dias=DIAS_RETENCAO, tamanho_lote=TAMANHO_LOTE, vacuum_completo=False):
+    """Arquiva o que ficou mais de ``dias`` para trás e compacta o banco.
+
+    ``tamanho_lote`` é o número de agendamentos (ou de containers removidos)
+    por transação. Não deve ser chamado dentro de uma transação (ATTACH e
+    VACUUM exigem). O calendário em memória de um ServicoContainers passa a
+    contar agendamentos que não existem mais: chame invalidar_caches().
+    """
+    limite_data = (date.today() - timedelta(days=dias)).isoformat()
+    limite_ts = int(time.time()) - dias * 86400
+    with db.conexao() as conn:
+        conn.execute("ATTACH DATABASE ? AS arquivo", (caminho_arquivo(db),))
+        try:
+            for comando in _SCHEMA_ARQUIVO:
+                conn.execute(comando)
+            agendamentos = _arquivar_agendamentos(db, limite_data, tamanho_lote)
+            eventos = _arquivar_eventos(db, limite_ts, tamanho_lote)
+        finally:
+            conn.execute("DETACH DATABASE arquivo")
+        return ResultadoArquivamento(agendamentos, eventos, compactar(db, vacuum_completo))
+
+
+def compactar(db, completo=False):
+    """Devolve ao sistema as páginas livres e retorna quantas foram liberadas.
+
+    Sem auto_vacuum incremental (bancos antigos) só ``completo`` libera
+    espaço: o VACUUM reescreve o arquivo inteiro e ativa o modo incremental.
+    """
+    with db.conexao() as conn:
+        antes = conn.execute("PRAGMA page_count").fetchone()[0]
+        if completo:
+            conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+            # O VACUUM pode renumerar o rowid dos containers (chave TEXT), usado pelo FTS
+            conn.execute("INSERT INTO containers_fts(containers_fts) VALUES ('rebuild')")
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            # executescript roda o PRAGMA até o fim; execute liberaria uma página por passo
+            conn.executescript("PRAGMA incremental_vacuum")
+        return antes - conn.execute("PRAGMA page_count").fetchone()[0]
+
+
+def consultar_arquivo(db, container_id, cnpj=None):
+    """Agendamentos e eventos arquivados do container: (agendamentos, eventos).
+
+    Os agendamentos vêm como as linhas de agendamentos (id, container_id,
+    data, tipo_operacao) e os eventos como Evento, em ordem cronológica.
+    Com ``cnpj`` só os registrados para a empresa.
+    """
+    caminho = caminho_arquivo(db)
+    if not os.path.exists(caminho):
+        return [], []
+    params = [container_id]
+    empresa = ''
+    if cnpj is not None:
+        empresa = 'AND cnpj = ?'
+        params.append(cnpj)
+    conn = sqlite3.connect(f"file:{quote(caminho)}?mode=ro", uri=True)
+    try:
+        blocos = conn.execute(f"""SELECT tabela, cnpj, dados FROM blocos
+                                  WHERE container_id = ? {empresa}""", params).fetchall()
+    finally:
+        conn.close()
+
+    # Indexados pelo id: descarta os lotes repetidos (ver docstring do módulo)
+    agendamentos, eventos = {}, {}
+    for tabela, cnpj_bloco, dados in blocos:
+        for valores in json.loads(zlib.decompress(dados)):
+            if tabela == 'agendamentos':
+                agendamento_id, data, tipo_operacao = valores
+                agendamentos[agendamento_id] = (agendamento_id, container_id, data, tipo_operacao)
+            else:
+                evento_id, ts, tipo, valor, detalhe = valores
+                eventos[evento_id] = Evento(container_id, ts, tipo, valor, detalhe, cnpj_bloco)
+    return ([agendamentos[i] for i in sorted(agendamentos)],
+            [eventos[i] for i in sorted(eventos, key=lambda i: (eventos[i].ts, i))])
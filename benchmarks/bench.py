@@ -0,0 +1,358 @@
+"""Benchmarks dos caminhos críticos da camada de dados e da atualização da interface.
+
+Cria, para cada tamanho de pátio pedido, um banco temporário com o schema de
+Database.inicializar_schema (o mesmo do init_database da aplicação), povoa
+containers e agendamentos sintéticos e mede cada operação. O resultado é um
+JSON comparável entre commits:
+
+    python benchmarks/bench.py --tamanhos 10000 100000 1000000 --saida base.json
+    python benchmarks/bench.py --tamanhos 10000 100000 --comparar base.json
+
+Com um display disponível (por exemplo sob Xvfb) a população da lista usa um
+ttk.Treeview real; sem display, um Treeview falso em memória com a mesma
+interface usada por TreeviewPaginada.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from filtros import FiltroContainers
+from patio import Bloco, replanejar_patio, salvar_bloco
+from seguranca import gerar_hash
+from servicos import ServicoContainers, Conflito
+from validacao import STATUS_CONTAINER, TIPOS_CONTAINER, TIPOS_OPERACAO
+from widgets import TreeviewPaginada
+
+TAMANHOS_PADRAO = (10000, 100000, 1000000)
+PORTOS = ('Santos', 'Paranaguá', 'Itajaí', 'Rotterdam', 'Hamburgo', 'Xangai',
+          'Singapura', 'Roterdã', 'Antuérpia', 'Buenos Aires')
+CNPJ = '00.000.000/0001-00'
+SENHA = 'benchmark'
+
+
+class TreeviewFalso:
+    """Substituto mínimo do ttk.Treeview para medições sem display"""
+
+    def __init__(self):
+        self._itens = []
+        self._valores = {}
+        self._topo = 0.0
+        self.yscrollcommand = None
+
+    def configure(self, yscrollcommand=None, **kwargs):
+        self.yscrollcommand = yscrollcommand
+
+    def get_children(self, item=''):
+        return tuple(self._itens)
+
+    def insert(self, parent, index, iid=None, values=()):
+        if index == 'end':
+            self._itens.append(iid)
+        else:
+            self._itens.insert(index, iid)
+        self._valores[iid] = values
+        return iid
+
+    def delete(self, *iids):
+        removidos = set(iids)
+        self._itens = [iid for iid in self._itens if iid not in removidos]
+        for iid in iids:
+            del self._valores[iid]
+
+    def item(self, iid, values=None, **kwargs):
+        if values is not None:
+            self._valores[iid] = values
+        return {'values': self._valores[iid]}
+
+    def exists(self, iid):
+        return iid in self._valores
+
+    def index(self, iid):
+        return self._itens.index(iid)
+
+    def yview(self):
+        return (self._topo, min(1.0, self._topo + 0.05))
+
+    def yview_moveto(self, fracao):
+        self._topo = fracao
+
+    def after_idle(self, funcao):
+        funcao()
+        return 'idle'
+
+    def after_cancel(self, identificador):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+
+class ScrollbarFalsa:
+    def set(self, primeiro, ultimo):
+        pass
+
+
+def criar_treeview():
+    """Treeview real quando há display; caso contrário o falso"""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return TreeviewFalso(), ScrollbarFalsa(), 'falso'
+    colunas = ('ID', 'Tipo', 'Altura', 'Largura', 'Comprimento', 'Status', 'Origem', 'Destino')
+    tree = ttk.Treeview(root, columns=colunas, show='headings')
+    scrollbar = ttk.Scrollbar(root, orient='vertical', command=tree.yview)
+    return tree, scrollbar, 'tk'
+
+
+def povoar(db, tamanho, semente=42):
+    """Cria um pátio sintético com ``tamanho`` containers e metade em agendamentos"""
+    aleatorio = random.Random(semente)
+    hoje = date.today()
+    lote = 50000
+
+    with db.transacao():
+        db.executar("INSERT INTO usuarios VALUES (?, ?, ?)",
+                    ('Benchmark', CNPJ, gerar_hash(SENHA)))
+        for inicio in range(0, tamanho, lote):
+            db.executar_muitos(
+                """INSERT INTO containers (id, tipo_container, altura, largura, comprimento,
+                                          status, origem, destino, data_entrada, cnpj)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(f"BNCU{numero:07d}", aleatorio.choice(TIPOS_CONTAINER),
+                  2.59, 2.44, aleatorio.choice((6.06, 12.19)),
+                  aleatorio.choice(STATUS_CONTAINER),
+                  aleatorio.choice(PORTOS), aleatorio.choice(PORTOS),
+                  (hoje - timedelta(days=aleatorio.randrange(730))).isoformat(), CNPJ)
+                 for numero in range(inicio, min(inicio + lote, tamanho))])
+
+        for inicio in range(0, tamanho // 2, lote):
+            db.executar_muitos(
+                """INSERT OR IGNORE INTO agendamentos (container_id, data_agendamento,
+                                                      tipo_operacao, cnpj)
+                   VALUES (?, ?, ?, ?)""",
+                [(f"BNCU{aleatorio.randrange(tamanho):07d}",
+                  (hoje + timedelta(days=aleatorio.randrange(1, 365))).isoformat(),
+                  aleatorio.choice(TIPOS_OPERACAO), CNPJ)
+                 for _ in range(inicio, min(inicio + lote, tamanho // 2))])
+
+        # Um bloco com 10% de folga: 6 fileiras (2 energizadas) e 5 níveis por baia
+        salvar_bloco(db, Bloco('A', tamanho * 11 // 300 + 1, 6, 5, 2, 12.2, 2.5, 14.5))
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        'repeticoes': repeticoes,
+        'min_ms': round(tempos[0], 3),
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+    }
+
+
+def operacoes(db, servico, tamanho, repeticoes):
+    """Gera (nome, função, repetições) para cada caminho crítico medido"""
+    aleatorio = random.Random(7)
+    tree, scrollbar, tipo_tree = criar_treeview()
+    pager = TreeviewPaginada(tree, scrollbar,
+                             lambda **kw: servico.listar_containers(**kw))
+
+    def primeira_pagina():
+        pager.recarregar()
+        tree.update_idletasks()
+
+    def rolar_ate_o_fim_da_janela():
+        pager.recarregar()
+        for _ in range(10):
+            pager._carregar_posteriores()
+        tree.update_idletasks()
+
+    # Serviço à parte: a recarga a cada medição não afeta o índice do autocompletar
+    servico_ids = ServicoContainers(db).da_empresa(servico.cnpj)
+
+    def lista_ids():
+        # A carga que a interface faz ao abrir e ao atualizar a lista (consulta e IndiceIds)
+        servico_ids.invalidar_ids()
+        len(servico_ids.ids_containers)
+
+    def autocompletar():
+        servico.buscar_ids(f"BNCU{aleatorio.randrange(tamanho):07d}"[:8])
+
+    def conflito_agendamento():
+        container_id = f"BNCU{aleatorio.randrange(tamanho):07d}"
+        data = (date.today() + timedelta(days=aleatorio.randrange(1, 365))).isoformat()
+        db.consultar_um("SELECT 1 FROM agendamentos WHERE container_id=? AND data_agendamento=?",
+                        (container_id, data))
+
+    def criar_agendamento():
+        container_id = f"BNCU{aleatorio.randrange(tamanho):07d}"
+        data = (date.today() + timedelta(days=aleatorio.randrange(400, 4000))).isoformat()
+        try:
+            servico.criar_agendamento(container_id, data, 'Carregamento')
+        except Conflito:
+            pass
+
+    def login():
+        servico.autenticar(CNPJ, SENHA)
+
+    token, _ = servico.iniciar_sessao(CNPJ, SENHA)
+
+    def validar_sessao():
+        servico.usuario_da_sessao(token)
+
+    def pagina_filtrada():
+        servico.listar_containers(FiltroContainers(status='Em uso', tipo_container='Reefer'))
+
+    def busca_texto():
+        servico.listar_containers(FiltroContainers(texto='itajai'))
+
+    # Capacidade baixa o bastante para haver longas sequências de dias lotados
+    # (a capacidade é do terminal: definida pelo serviço sem empresa)
+    ServicoContainers(db).definir_capacidade('Manutenção', max(1, tamanho // 6000))
+    servico.invalidar_caches()
+
+    def proxima_data():
+        servico.proxima_data_disponivel('Manutenção')
+
+    def painel():
+        servico.resumo_painel()
+
+    def planejar_patio():
+        replanejar_patio(db)
+
+    # Cada repetição usa uma janela nova de datas: 4 ocorrências por container
+    janelas = iter(range(5000, 100000, 200))
+
+    def agendamento_recorrente():
+        inicio = date.today() + timedelta(days=next(janelas))
+        servico.agendar_recorrente('Descarregamento', inicio.isoformat(),
+                                   (inicio + timedelta(days=90)).isoformat(), 30)
+
+    return tipo_tree, [
+        ('carregar_containers.primeira_pagina', primeira_pagina, repeticoes),
+        ('carregar_containers.rolagem_10_paginas', rolar_ate_o_fim_da_janela, max(3, repeticoes // 5)),
+        ('atualizar_lista_containers', lista_ids, max(3, repeticoes // 10)),
+        ('autocompletar.prefixo', autocompletar, repeticoes * 10),
+        ('criar_agendamento.checagem_conflito', conflito_agendamento, repeticoes * 10),
+        ('criar_agendamento', criar_agendamento, repeticoes),
+        ('login', login, repeticoes),
+        ('login.validar_sessao', validar_sessao, repeticoes * 10),
+        ('pesquisa.filtro_status_tipo', pagina_filtrada, repeticoes),
+        ('pesquisa.texto_livre', busca_texto, repeticoes),
+        ('agenda.proxima_data', proxima_data, repeticoes * 10),
+        ('painel.resumo', painel, repeticoes),
+        ('replanejar_patio', planejar_patio, max(1, repeticoes // 20)),
+        ('agendar_recorrente.4_por_container', agendamento_recorrente, max(1, repeticoes // 20)),
+    ]
+
+
+def versao_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(tamanhos, repeticoes, diretorio=None):
+    resultados = []
+    tipo_tree = None
+    with tempfile.TemporaryDirectory(dir=diretorio) as temporario:
+        for tamanho in tamanhos:
+            caminho = os.path.join(temporario, f"bench_{tamanho}.db")
+            db = Database(caminho)
+            db.inicializar_schema()
+
+            inicio = time.perf_counter()
+            povoar(db, tamanho)
+            resultados.append({'operacao': 'povoar', 'tamanho': tamanho,
+                               'total_ms': round((time.perf_counter() - inicio) * 1000, 1)})
+            print(f"[{tamanho}] banco povoado", file=sys.stderr)
+
+            servico = ServicoContainers(db).da_empresa(CNPJ)
+            tipo_tree, medicoes = operacoes(db, servico, tamanho, repeticoes)
+            for nome, funcao, vezes in medicoes:
+                resultado = {'operacao': nome, 'tamanho': tamanho}
+                resultado.update(medir(funcao, vezes))
+                resultados.append(resultado)
+                print(f"[{tamanho}] {nome}: mediana {resultado['mediana_ms']} ms",
+                      file=sys.stderr)
+            db.fechar()
+
+    return {
+        'commit': versao_git(),
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'treeview': tipo_tree,
+        'resultados': resultados,
+    }
+
+
+def comparar(atual, base, tolerancia):
+    """Lista as operações cuja mediana piorou mais que ``tolerancia`` (fração)"""
+    anteriores = {(r['operacao'], r['tamanho']): r for r in base['resultados']
+                  if 'mediana_ms' in r}
+    regressoes = []
+    for resultado in atual['resultados']:
+        anterior = anteriores.get((resultado['operacao'], resultado['tamanho']))
+        if anterior is None or 'mediana_ms' not in resultado:
+            continue
+        if resultado['mediana_ms'] > anterior['mediana_ms'] * (1 + tolerancia):
+            regressoes.append((resultado['operacao'], resultado['tamanho'],
+                               anterior['mediana_ms'], resultado['mediana_ms']))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS_PADRAO)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--saida', help="grava o JSON neste arquivo em vez do stdout")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help="piora relativa da mediana aceita antes de acusar regressão")
+    parser.add_argument('--diretorio', help="onde criar os bancos temporários")
+    args = parser.parse_args(argv)
+
+    atual = executar(args.tamanhos, args.repeticoes, args.diretorio)
+    texto = json.dumps(atual, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(atual, json.load(arquivo), args.tolerancia)
+        for operacao, tamanho, antes, depois in regressoes:
+            print(f"REGRESSÃO {operacao} [{tamanho}]: {antes} ms -> {depois} ms",
+                  file=sys.stderr)
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
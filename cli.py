@@ -0,0 +1,328 @@
+"""Rotinas do sistema de containers executáveis sem interface gráfica.
+
+Uso:
+    python cli.py importar manifesto.csv [--atualizar] [--cnpj ...]
+    python cli.py exportar containers saida.csv.gz [--cnpj ...] [--status ...] [--de ...] [--ate ...]
+    python cli.py servidor [--host 127.0.0.1] [--porta 8080] [--diretorio-empresas dir] [--central]
+                           [--metricas metricas.json] [--sql-lento-ms 100]
+    python cli.py bloco-patio A --baias 40 --fileiras 6 --niveis 5 [--energizadas 2]
+    python cli.py planejar-patio
+    python cli.py capacidade Carregamento 40 | --sem-limite
+    python cli.py atribuir-empresa 12.345.678/0001-90
+    python cli.py agendar-recorrente Manutenção --inicio 01/07/2025 --fim 31/12/2025 --intervalo 30
+                                     [--status ...] [--tipo ...] [--cnpj ...]
+    python cli.py sincronizar --central http://servidor:8080 --cnpj ... [--continuo [--intervalo 10]]
+    python cli.py arquivar [--dias 90] [--lote 5000] [--vacuum-completo]
+    python cli.py consultar-arquivo ABCU1234560 [--cnpj ...]
+"""
+import argparse
+import getpass
+import logging
+import sys
+import time
+
+from api import criar_servidor
+from arquivamento import DIAS_RETENCAO, TAMANHO_LOTE, arquivar, caminho_arquivo
+from database import DB_PATH, Database, data_para_exibicao
+from eventos import descrever
+from exportacao import FORMATOS, exportar
+from filtros import FiltroContainers
+from importacao import importar_manifesto
+from metricas import Metricas
+from patio import Bloco, replanejar_patio, salvar_bloco
+from servicos import Empresas, ServicoContainers
+from sincronizacao import (ClienteCentral, Sincronizador, fila_do_banco, marcar_central,
+                           sincronizado)
+from validacao import (OperacaoInvalida, STATUS_CONTAINER, TIPOS_CONTAINER,
+                       TIPOS_OPERACAO)
+
+
+def comando_importar(db, args):
+    inicio = time.perf_counter()
+    resultado = importar_manifesto(db, args.arquivo, atualizar=args.atualizar, cnpj=args.cnpj,
+                                   fila=fila_do_banco(db))
+    duracao = time.perf_counter() - inicio
+
+    for linha, mensagem in resultado.erros:
+        print(f"linha {linha}: {mensagem}", file=sys.stderr)
+    print(f"{resultado.lidos} registros lidos, {resultado.gravados} gravados, "
+          f"{resultado.ignorados} já existentes, {len(resultado.erros)} com erro "
+          f"({duracao:.2f}s)")
+    return 1 if resultado.erros else 0
+
+
+def comando_exportar(db, args):
+    inicio = time.perf_counter()
+    total = exportar(db, args.tabela, args.arquivo, formato=args.formato,
+                     compactar=args.gzip or None, tamanho_lote=args.lote,
+                     status=args.status, tipo_container=args.tipo,
+                     tipo_operacao=args.operacao, cnpj=args.cnpj,
+                     data_inicio=args.de, data_fim=args.ate)
+    print(f"{total} registros exportados para {args.arquivo} "
+          f"({time.perf_counter() - inicio:.2f}s)")
+    return 0
+
+
+def comando_servidor(db, args):
+    metricas = None
+    if args.metricas:
+        # Comandos lentos vão para o stderr com o plano de execução
+        logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(name)s %(message)s')
+        metricas = db.metricas = Metricas(args.sql_lento_ms)
+    def criar_fila(db):
+        # O banco central registra as escritas para distribuí-las aos terminais
+        if args.central:
+            marcar_central(db)
+        return fila_do_banco(db)
+
+    servico = ServicoContainers(db, fila=criar_fila(db))
+    empresas = Empresas(servico, args.diretorio_empresas, criar_fila=criar_fila)
+    servidor = criar_servidor(servico, args.host, args.porta, verboso=args.verboso,
+                              empresas=empresas, metricas=metricas)
+    print(f"API disponível em http://{args.host}:{args.porta}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        empresas.fechar()
+        if metricas is not None:
+            print(f"{metricas.salvar(args.metricas)} métricas gravadas em {args.metricas}")
+    return 0
+
+
+def comando_bloco_patio(db, args):
+    if args.energizadas > args.fileiras:
+        raise ValueError("Fileiras energizadas excedem o total de fileiras")
+    salvar_bloco(db, Bloco(args.nome, args.baias, args.fileiras, args.niveis, args.energizadas,
+                           args.comprimento_max, args.largura_max,
+                           args.altura_max or args.niveis * 2.9))
+    print(f"Bloco {args.nome}: {args.baias * args.fileiras * args.niveis} posições")
+    return 0
+
+
+def comando_planejar_patio(db, args):
+    inicio = time.perf_counter()
+    plano = replanejar_patio(db)
+    duracao = time.perf_counter() - inicio
+
+    for nome, (ocupados, capacidade, percentual) in plano.utilizacao.items():
+        print(f"{nome}: {ocupados}/{capacidade} posições ({percentual:.1f}%)")
+    if plano.nao_alocados:
+        print(f"{len(plano.nao_alocados)} containers sem posição compatível", file=sys.stderr)
+    print(f"{len(plano.alocacoes)} containers alocados ({duracao:.2f}s)")
+    return 1 if plano.nao_alocados else 0
+
+
+def comando_capacidade(db, args):
+    if args.limite is None and not args.sem_limite:
+        raise ValueError("Informe o limite diário ou --sem-limite")
+    if sincronizado(db):
+        raise OperacaoInvalida("Terminal sincronizado: a capacidade é definida no banco central")
+    ServicoContainers(db, fila=fila_do_banco(db)).definir_capacidade(
+        args.tipo_operacao, None if args.sem_limite else args.limite)
+    print(f"{args.tipo_operacao}: "
+          f"{'sem limite' if args.sem_limite else f'{args.limite} por dia'}")
+    return 0
+
+
+def comando_atribuir_empresa(db, args):
+    total = ServicoContainers(db, fila=fila_do_banco(db)).atribuir_sem_empresa(args.cnpj)
+    print(f"{total} containers sem empresa atribuídos a {args.cnpj}")
+    return 0
+
+
+def comando_agendar_recorrente(db, args):
+    servico = ServicoContainers(db, fila=fila_do_banco(db))
+    if args.cnpj:
+        servico = servico.da_empresa(args.cnpj)
+    inicio = time.perf_counter()
+    resultado = servico.agendar_recorrente(
+        args.tipo_operacao, args.inicio, args.fim, args.intervalo,
+        FiltroContainers(status=args.status, tipo_container=args.tipo))
+    print(f"{resultado.ocorrencias} ocorrências: {resultado.criados} agendadas, "
+          f"{resultado.conflitos} já existentes, {resultado.sem_vaga} sem vaga "
+          f"({time.perf_counter() - inicio:.2f}s)")
+    return 0
+
+
+def comando_sincronizar(db, args):
+    servico = ServicoContainers(db, fila=fila_do_banco(db, terminal=True)).da_empresa(args.cnpj)
+    senha = args.senha or getpass.getpass("Senha no servidor central: ")
+    sincronizador = Sincronizador(servico, ClienteCentral(args.central), senha)
+    while True:
+        try:
+            resultado = sincronizador.sincronizar()
+        except OSError as e:
+            if not args.continuo:
+                raise
+            # Sem conexão: as alterações ficam na fila até a próxima rodada
+            print(f"Central indisponível: {e}", file=sys.stderr)
+        else:
+            print(f"{resultado.enviadas} alterações enviadas, {resultado.recebidas} recebidas, "
+                  f"{resultado.conflitos} conflitos")
+            if not args.continuo:
+                return 1 if resultado.conflitos else 0
+        try:
+            time.sleep(args.intervalo)
+        except KeyboardInterrupt:
+            return 0
+
+
+def comando_arquivar(db, args):
+    inicio = time.perf_counter()
+    resultado = arquivar(db, args.dias, args.lote, vacuum_completo=args.vacuum_completo)
+    print(f"{resultado.agendamentos} agendamentos e {resultado.eventos} eventos arquivados em "
+          f"{caminho_arquivo(db)}; {resultado.paginas_liberadas} páginas liberadas "
+          f"({time.perf_counter() - inicio:.2f}s)")
+    if db.consultar_um("PRAGMA auto_vacuum")[0] == 0:
+        print("O banco não tem auto_vacuum incremental: rode uma vez com --vacuum-completo "
+              "para devolver o espaço ao sistema", file=sys.stderr)
+    return 0
+
+
+def comando_consultar_arquivo(db, args):
+    servico = ServicoContainers(db)
+    if args.cnpj:
+        servico = servico.da_empresa(args.cnpj)
+    agendamentos, eventos = servico.consultar_arquivo(args.container_id)
+    for _, _, data, tipo_operacao in agendamentos:
+        print(f"{data_para_exibicao(data)}  agendamento: {tipo_operacao}")
+    for evento in eventos:
+        print('  '.join(parte for parte in descrever(evento) if parte))
+    if not agendamentos and not eventos:
+        print(f"Nada arquivado para {args.container_id}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Sistema de Gestão de Containers")
+    parser.add_argument('--db', default=DB_PATH, help="arquivo do banco SQLite")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    parser_importar = subparsers.add_parser('importar', help="importa um manifesto CSV/JSON")
+    parser_importar.add_argument('arquivo', help="manifesto .csv, .json, .jsonl ou .ndjson")
+    parser_importar.add_argument('--atualizar', action='store_true',
+                                 help="atualiza containers já existentes em vez de ignorá-los")
+    parser_importar.add_argument('--cnpj', help="empresa dona dos containers importados")
+    parser_importar.set_defaults(funcao=comando_importar)
+
+    parser_exportar = subparsers.add_parser('exportar', help="exporta para CSV ou JSON Lines")
+    parser_exportar.add_argument('tabela', choices=('containers', 'agendamentos'))
+    parser_exportar.add_argument('arquivo', help="destino .csv ou .jsonl (com .gz para compactar)")
+    parser_exportar.add_argument('--formato', choices=FORMATOS)
+    parser_exportar.add_argument('--gzip', action='store_true', help="compacta a saída com gzip")
+    parser_exportar.add_argument('--status', choices=STATUS_CONTAINER)
+    parser_exportar.add_argument('--tipo', choices=TIPOS_CONTAINER, help="tipo de container")
+    parser_exportar.add_argument('--operacao', choices=TIPOS_OPERACAO,
+                                 help="tipo de operação (apenas agendamentos)")
+    parser_exportar.add_argument('--de', help="data inicial (DD/MM/AAAA ou AAAA-MM-DD)")
+    parser_exportar.add_argument('--ate', help="data final (DD/MM/AAAA ou AAAA-MM-DD)")
+    parser_exportar.add_argument('--lote', type=int, default=1000,
+                                 help="linhas lidas do banco por vez")
+    parser_exportar.add_argument('--cnpj', help="somente os registros da empresa")
+    parser_exportar.set_defaults(funcao=comando_exportar)
+
+    parser_servidor = subparsers.add_parser('servidor', help="inicia a API HTTP/JSON")
+    parser_servidor.add_argument('--host', default='127.0.0.1')
+    parser_servidor.add_argument('--porta', type=int, default=8080)
+    parser_servidor.add_argument('--verboso', action='store_true',
+                                 help="registra cada requisição no stderr")
+    parser_servidor.add_argument('--diretorio-empresas',
+                                 help="um arquivo SQLite por empresa neste diretório")
+    parser_servidor.add_argument('--central', action='store_true',
+                                 help="este é o banco central da sincronização dos terminais")
+    parser_servidor.add_argument('--metricas',
+                                 help="registra latências e grava o resumo neste arquivo ao sair")
+    parser_servidor.add_argument('--sql-lento-ms', type=float, default=100.0,
+                                 help="com --metricas, registra no log os comandos acima deste tempo")
+    parser_servidor.set_defaults(funcao=comando_servidor)
+
+    parser_bloco = subparsers.add_parser('bloco-patio', help="cadastra ou altera um bloco do pátio")
+    parser_bloco.add_argument('nome')
+    parser_bloco.add_argument('--baias', type=int, required=True)
+    parser_bloco.add_argument('--fileiras', type=int, required=True)
+    parser_bloco.add_argument('--niveis', type=int, required=True, help="containers por pilha")
+    parser_bloco.add_argument('--energizadas', type=int, default=0,
+                              help="fileiras com tomada para reefers (as primeiras de cada baia)")
+    parser_bloco.add_argument('--comprimento-max', type=float, default=12.2)
+    parser_bloco.add_argument('--largura-max', type=float, default=2.5)
+    parser_bloco.add_argument('--altura-max', type=float,
+                              help="altura máxima da pilha em metros (padrão: 2,9 m por nível)")
+    parser_bloco.set_defaults(funcao=comando_bloco_patio)
+
+    parser_planejar = subparsers.add_parser('planejar-patio',
+                                            help="realoca todos os containers nos blocos do pátio")
+    parser_planejar.set_defaults(funcao=comando_planejar_patio)
+
+    parser_capacidade = subparsers.add_parser('capacidade',
+                                              help="define a capacidade diária de uma operação")
+    parser_capacidade.add_argument('tipo_operacao', choices=TIPOS_OPERACAO)
+    parser_capacidade.add_argument('limite', type=int, nargs='?', help="agendamentos por dia")
+    parser_capacidade.add_argument('--sem-limite', action='store_true')
+    parser_capacidade.set_defaults(funcao=comando_capacidade)
+
+    parser_atribuir = subparsers.add_parser(
+        'atribuir-empresa', help="atribui a uma empresa os registros anteriores à separação por CNPJ")
+    parser_atribuir.add_argument('cnpj')
+    parser_atribuir.set_defaults(funcao=comando_atribuir_empresa)
+
+    parser_recorrente = subparsers.add_parser(
+        'agendar-recorrente', help="agenda uma operação a cada N dias para os containers do filtro")
+    parser_recorrente.add_argument('tipo_operacao', choices=TIPOS_OPERACAO)
+    parser_recorrente.add_argument('--inicio', required=True,
+                                   help="primeira data (DD/MM/AAAA ou AAAA-MM-DD)")
+    parser_recorrente.add_argument('--fim', required=True, help="última data possível")
+    parser_recorrente.add_argument('--intervalo', type=int, required=True, help="dias entre as datas")
+    parser_recorrente.add_argument('--status', choices=STATUS_CONTAINER)
+    parser_recorrente.add_argument('--tipo', choices=TIPOS_CONTAINER, help="tipo de container")
+    parser_recorrente.add_argument('--cnpj', help="somente os containers da empresa")
+    parser_recorrente.set_defaults(funcao=comando_agendar_recorrente)
+
+    parser_sincronizar = subparsers.add_parser(
+        'sincronizar', help="troca as alterações da empresa com o banco central")
+    parser_sincronizar.add_argument('--central', required=True, help="URL da API do banco central")
+    parser_sincronizar.add_argument('--cnpj', required=True)
+    parser_sincronizar.add_argument('--senha', help="senha no central (pedida se omitida)")
+    parser_sincronizar.add_argument('--continuo', action='store_true',
+                                    help="repete a sincronização até ser interrompido")
+    parser_sincronizar.add_argument('--intervalo', type=float, default=10.0,
+                                    help="segundos entre as rodadas com --continuo")
+    parser_sincronizar.set_defaults(funcao=comando_sincronizar)
+
+    parser_arquivar = subparsers.add_parser(
+        'arquivar', help="arquiva agendamentos vencidos e o histórico de containers removidos")
+    parser_arquivar.add_argument('--dias', type=int, default=DIAS_RETENCAO,
+                                 help="retenção no banco principal, em dias")
+    parser_arquivar.add_argument('--lote', type=int, default=TAMANHO_LOTE,
+                                 help="registros movidos por transação")
+    parser_arquivar.add_argument('--vacuum-completo', action='store_true',
+                                 help="reescreve o banco (necessário uma vez em bancos antigos)")
+    parser_arquivar.set_defaults(funcao=comando_arquivar)
+
+    parser_consultar_arquivo = subparsers.add_parser(
+        'consultar-arquivo', help="mostra os agendamentos e eventos arquivados de um container")
+    parser_consultar_arquivo.add_argument('container_id')
+    parser_consultar_arquivo.add_argument('--cnpj', help="somente os registros da empresa")
+    parser_consultar_arquivo.set_defaults(funcao=comando_consultar_arquivo)
+
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    db = Database(args.db)
+    try:
+        db.inicializar_schema()
+        return args.funcao(db, args)
+    except (OperacaoInvalida, OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.fechar()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,53 @@
+import logging
+import os
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-import sqlite3
-from datetime import datetime
-import re
+from tkinter import ttk, messagebox, filedialog
+from functools import partial
+
+from arquivamento import DIAS_RETENCAO, arquivar
+from database import Database, REMOVER, data_para_exibicao
+from eventos import descrever
+from exportacao import exportar
+from filtros import FiltroContainers
+from importacao import importar_manifesto
+from metricas import Metricas
+from patio import replanejar_patio
+from servicos import Empresas, ServicoContainers, PossuiAgendamentos
+from sincronizacao import ClienteCentral, Sincronizador, fila_do_banco
+from tarefas import ExecutorTarefas
+from validacao import (CAMPOS_CONTAINER, TIPOS_CONTAINER, STATUS_CONTAINER,
+                       TIPOS_OPERACAO, OperacaoInvalida)
+from widgets import AutocompletarCombobox, TreeviewPaginada
+
+# Referência para os tempos do log de inicialização (após os imports)
+INICIO = time.perf_counter()
+LOG_INICIALIZACAO = os.environ.get('CONTAINERERP_LOG_INICIALIZACAO', 'inicializacao.log')
+log_inicializacao = logging.getLogger('containererp.inicializacao')
+# Com um diretório, cada empresa (CNPJ) usa o próprio arquivo de banco
+DIRETORIO_EMPRESAS = os.environ.get('CONTAINERERP_DIRETORIO_EMPRESAS')
+# Comandos SQL acima do limite vão para o log com o plano de execução; com
+# CONTAINERERP_METRICAS as métricas são gravadas nesse arquivo ao sair
+SQL_LENTO_MS = float(os.environ.get('CONTAINERERP_SQL_LENTO_MS', '100'))
+ARQUIVO_METRICAS = os.environ.get('CONTAINERERP_METRICAS')
+# Com a URL da API central as alterações locais vão para a fila de
+# sincronização, trocada com o central em segundo plano (o sistema continua
+# funcionando offline); sem ela não há fila
+SERVIDOR_CENTRAL = os.environ.get('CONTAINERERP_SERVIDOR_CENTRAL')
+INTERVALO_SINCRONIZACAO_MS = int(float(os.environ.get('CONTAINERERP_INTERVALO_SINCRONIZACAO',
+                                                      '15')) * 1000)
+# Sem resposta do central o intervalo dobra a cada falha, até este limite
+INTERVALO_MAXIMO_SINCRONIZACAO_MS = 5 * 60 * 1000
+log_sincronizacao = logging.getLogger('containererp.sincronizacao')
 
 class ContainerManagementSystem:
+    # Ações disparadas diretamente pelo usuário que trabalham na thread da
+    # interface. As que só submetem uma tarefa (login, cadastros, agendamentos,
+    # painel...) são medidas pela categoria 'resposta' de ExecutorTarefas, do
+    # envio até a tela atualizada; instrumentá-las aqui mediria só o envio.
+    # Métodos também chamados internamente (atualizar_painel) ficam de fora.
+    HANDLERS = ('ativar_aba', 'preencher_formulario', 'aplicar_filtro', 'limpar_filtro')
+
     def __init__(self, root):
         self.root = root
         self.root.title("Sistema de Gestão de Containers")
@@ -16,8 +59,30 @@ class ContainerManagementSystem:
         self.style.configure('TButton', font=('Arial', 10))
         self.style.configure('Header.TLabel', font=('Arial', 12, 'bold'))
         
+        # Métricas de handlers, tarefas e SQL (menu Diagnóstico)
+        self.metricas = Metricas(SQL_LENTO_MS)
+        for nome in self.HANDLERS:
+            setattr(self, nome, self.metricas.instrumentar(getattr(self, nome)))
+        
         # Inicializar banco de dados
+        self.db = Database(metricas=self.metricas)
         self.init_database()
+        criar_fila = partial(fila_do_banco, terminal=bool(SERVIDOR_CENTRAL))
+        self.servico = ServicoContainers(self.db, fila=criar_fila(self.db))
+        self.empresas = Empresas(self.servico, DIRETORIO_EMPRESAS, criar_fila=criar_fila)
+        self.sincronizador = None
+        self.espera_sincronizacao = INTERVALO_SINCRONIZACAO_MS
+        log_inicializacao.info("schema verificado: %.1f ms", (time.perf_counter() - INICIO) * 1000)
+        self.root.protocol("WM_DELETE_WINDOW", self.fechar)
+        
+        # Barra de status com indicador de processamento
+        self.status_frame = ttk.Frame(root, padding=(10, 2))
+        self.status_frame.pack(side='bottom', fill='x')
+        self.progresso = ttk.Progressbar(self.status_frame, mode='indeterminate', length=120)
+        
+        # Consultas ao banco rodam fora da thread da interface
+        self.tarefas = ExecutorTarefas(root, ao_mudar_ocupado=self.indicar_ocupado,
+                                       metricas=self.metricas)
         
         # Frame de login
         self.login_frame = ttk.Frame(root, padding="20")
@@ -51,8 +116,27 @@ class ContainerManagementSystem:
         ttk.Button(button_frame, text="Login", command=self.login, width=15).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cadastrar", command=self.cadastrar, width=15).pack(side=tk.LEFT, padx=5)
         
-        # Frame principal (inicialmente oculto)
-        self.main_frame = ttk.Frame(root, padding="10")
+        # Frame principal e abas só são construídos após o login; cada aba
+        # na primeira vez que é ativada
+        self.main_frame = None
+        self.container_pager = None
+        self.agendamento_pager = None
+        self.abas_construidas = set()
+        self.etapas_registradas = set()
+        
+        self.registrar_etapa("janela de login construída")
+        self.root.after_idle(partial(self.registrar_etapa, "login interativo"))
+
+    def registrar_etapa(self, etapa):
+        """Registra no log de inicialização o tempo decorrido até a etapa (uma vez)"""
+        if etapa in self.etapas_registradas:
+            return
+        self.etapas_registradas.add(etapa)
+        log_inicializacao.info("%s: %.1f ms", etapa, (time.perf_counter() - INICIO) * 1000)
+
+    def construir_janela_principal(self):
+        """Cria o notebook com as abas vazias; o conteúdo vem em ativar_aba"""
+        self.main_frame = ttk.Frame(self.root, padding="10")
         
         # Notebook para as abas
         self.notebook = ttk.Notebook(self.main_frame)
@@ -61,42 +145,87 @@ class ContainerManagementSystem:
         # Configurar abas
         self.containers_frame = ttk.Frame(self.notebook, padding="10")
         self.agendamentos_frame = ttk.Frame(self.notebook, padding="10")
+        self.painel_frame = ttk.Frame(self.notebook, padding="10")
         
         self.notebook.add(self.containers_frame, text='Gestão de Containers')
         self.notebook.add(self.agendamentos_frame, text='Agendamentos')
+        self.notebook.add(self.painel_frame, text='Painel')
+        
+        # aba -> (nome, construir, carregar dados)
+        self.abas = {
+            str(self.containers_frame): ('containers', self.setup_containers_tab,
+                                         self.carregar_containers),
+            str(self.agendamentos_frame): ('agendamentos', self.setup_agendamentos_tab,
+                                           self.carregar_agendamentos),
+            str(self.painel_frame): ('painel', self.setup_painel_tab, self.atualizar_painel),
+        }
+        self.notebook.bind('<<NotebookTabChanged>>', self.ativar_aba)
+        self.main_frame.pack(expand=True, fill='both')
+        self.ativar_aba()
+
+    def ativar_aba(self, event=None):
+        """Constrói a aba na primeira ativação e dispara a carga dos seus dados"""
+        nome, construir, carregar = self.abas[self.notebook.select()]
+        if nome in self.abas_construidas:
+            # Containers e agendamentos se mantêm pelas alterações; o painel recarrega
+            if nome == 'painel':
+                self.atualizar_painel()
+            return
         
-        self.setup_containers_tab()
-        self.setup_agendamentos_tab()
+        inicio = time.perf_counter()
+        construir()
+        self.abas_construidas.add(nome)
+        log_inicializacao.info("aba %s construída em %.1f ms", nome,
+                               (time.perf_counter() - inicio) * 1000)
+        # A carga roda em segundo plano (ExecutorTarefas)
+        carregar()
+
+    def criar_menu(self):
+        """Cria a barra de menus exibida após o login"""
+        menubar = tk.Menu(self.root)
+        arquivo_menu = tk.Menu(menubar, tearoff=0)
+        arquivo_menu.add_command(label="Importar manifesto...", command=self.importar_containers)
+        arquivo_menu.add_command(label="Exportar containers...",
+                                 command=partial(self.exportar_tabela, 'containers'))
+        arquivo_menu.add_command(label="Exportar agendamentos...",
+                                 command=partial(self.exportar_tabela, 'agendamentos'))
+        arquivo_menu.add_command(label="Arquivar histórico antigo...",
+                                 command=self.arquivar_historico)
+        arquivo_menu.add_separator()
+        arquivo_menu.add_command(label="Sair", command=self.fechar)
+        menubar.add_cascade(label="Arquivo", menu=arquivo_menu)
+
+        patio_menu = tk.Menu(menubar, tearoff=0)
+        patio_menu.add_command(label="Replanejar pátio", command=self.replanejar_patio)
+        menubar.add_cascade(label="Pátio", menu=patio_menu)
+
+        diagnostico_menu = tk.Menu(menubar, tearoff=0)
+        diagnostico_menu.add_command(label="Métricas de desempenho...",
+                                     command=self.mostrar_metricas)
+        menubar.add_cascade(label="Diagnóstico", menu=diagnostico_menu)
+        self.root.config(menu=menubar)
 
     def init_database(self):
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
-        
         # Create tables with correct schema
-        c.execute('''CREATE TABLE IF NOT EXISTS usuarios
-                    (razao_social TEXT, cnpj TEXT PRIMARY KEY, senha TEXT)''')
-        
-        # Updated container table schema with tipo_container
-        c.execute('''CREATE TABLE IF NOT EXISTS containers
-                    (id TEXT PRIMARY KEY,
-                     tipo_container TEXT,
-                     altura REAL,
-                     largura REAL,
-                     comprimento REAL,
-                     status TEXT,
-                     origem TEXT,
-                     destino TEXT,
-                     data_entrada TEXT)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS agendamentos
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     container_id TEXT,
-                     data_agendamento TEXT,
-                     tipo_operacao TEXT,
-                     FOREIGN KEY(container_id) REFERENCES containers(id))''')
-        
-        conn.commit()
-        conn.close()
+        self.db.inicializar_schema()
+
+    def fechar(self):
+        """Fecha as conexões do banco e encerra a aplicação"""
+        self.tarefas.encerrar()
+        if ARQUIVO_METRICAS:
+            self.metricas.salvar(ARQUIVO_METRICAS)
+        self.empresas.fechar()
+        self.db.fechar()
+        self.root.destroy()
+
+    def indicar_ocupado(self, ocupado):
+        """Exibe o indicador de processamento enquanto há tarefas pendentes"""
+        if ocupado:
+            self.progresso.pack(side='right')
+            self.progresso.start(15)
+        else:
+            self.progresso.stop()
+            self.progresso.pack_forget()
 
     def setup_containers_tab(self):
         # Frame para entrada de dados
@@ -122,11 +251,11 @@ class ContainerManagementSystem:
             
             if label == 'Status':
                 status_combo = ttk.Combobox(input_frame, textvariable=var, state='readonly')
-                status_combo['values'] = ('Disponível', 'Em uso', 'Necessita manutenção')
+                status_combo['values'] = STATUS_CONTAINER
                 status_combo.grid(row=row, column=1, padx=5, pady=5, sticky='w')
             elif label == 'Tipo de Container':
                 tipo_combo = ttk.Combobox(input_frame, textvariable=var, state='readonly')
-                tipo_combo['values'] = ('Dry', 'Reefer', 'Open Top', 'Flat Rack', 'Tank')
+                tipo_combo['values'] = TIPOS_CONTAINER
                 tipo_combo.grid(row=row, column=1, padx=5, pady=5, sticky='w')
             else:
                 ttk.Entry(input_frame, textvariable=var).grid(row=row, column=1, padx=5, pady=5, sticky='w')
@@ -139,8 +268,14 @@ class ContainerManagementSystem:
         
         ttk.Button(button_frame, text="Adicionar Container", 
                   command=self.adicionar_container).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Atualizar Container",
+                   command=self.atualizar_container).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Remover Container", 
                   command=self.remover_container).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Histórico",
+                   command=self.mostrar_historico).pack(side=tk.LEFT, padx=5)
+        
+        self.setup_filtros_containers()
         
         # Treeview para listar containers
         self.container_tree = ttk.Treeview(self.containers_frame, 
@@ -153,12 +288,79 @@ class ContainerManagementSystem:
             self.container_tree.column(col, width=100)
         
         self.container_tree.pack(fill='both', expand=True, padx=5, pady=5)
+        self.container_tree.bind('<<TreeviewSelect>>', self.preencher_formulario)
         
         # Adicionar scrollbar
         scrollbar = ttk.Scrollbar(self.containers_frame, orient="vertical", 
                                 command=self.container_tree.yview)
         scrollbar.pack(side='right', fill='y')
-        self.container_tree.configure(yscrollcommand=scrollbar.set)
+        
+        # Lista virtual: apenas a janela visível é buscada no banco
+        self.container_pager = TreeviewPaginada(
+            self.container_tree, scrollbar, self.buscar_containers,
+            executor=self.tarefas, formatar=self.formatar_container,
+            ao_recarregar=partial(self.registrar_etapa, "containers: primeira página exibida"),
+            ordem=lambda chave: self.filtro_containers.ordem(chave))
+
+    def setup_filtros_containers(self):
+        """Barra de pesquisa sobre a lista de containers"""
+        filtro_frame = ttk.LabelFrame(self.containers_frame, text="Pesquisar", padding="10")
+        filtro_frame.pack(fill="x", padx=5, pady=5)
+        
+        self.filtro_containers = FiltroContainers()
+        self._filtro_agendado = None
+        self.filtro_vars = {campo: tk.StringVar() for campo in FiltroContainers.CAMPOS}
+        
+        campos = [('Busca:', 'texto', None), ('ID começa com:', 'prefixo_id', None),
+                  ('Tipo:', 'tipo_container', ('',) + TIPOS_CONTAINER),
+                  ('Status:', 'status', ('',) + STATUS_CONTAINER),
+                  ('Origem:', 'origem', None), ('Destino:', 'destino', None),
+                  ('Entrada de:', 'entrada_de', None), ('até:', 'entrada_ate', None)]
+        
+        for indice, (label, campo, valores) in enumerate(campos):
+            row, column = divmod(indice, 4)
+            ttk.Label(filtro_frame, text=label).grid(row=row, column=column * 2,
+                                                     padx=5, pady=2, sticky='e')
+            if valores:
+                # Seleção em combobox filtra imediatamente
+                widget = ttk.Combobox(filtro_frame, textvariable=self.filtro_vars[campo],
+                                      values=valores, state='readonly', width=18)
+                widget.bind('<<ComboboxSelected>>', lambda e: self.aplicar_filtro())
+            else:
+                # Digitação é agrupada (debounce) antes de consultar o banco
+                widget = ttk.Entry(filtro_frame, textvariable=self.filtro_vars[campo], width=20)
+                widget.bind('<KeyRelease>', self.agendar_filtro)
+            widget.grid(row=row, column=column * 2 + 1, padx=5, pady=2, sticky='w')
+        
+        ttk.Button(filtro_frame, text="Limpar", 
+                  command=self.limpar_filtro).grid(row=0, column=8, rowspan=2, padx=5)
+
+    def agendar_filtro(self, event=None):
+        """Aplica o filtro só depois de uma pausa na digitação"""
+        if self._filtro_agendado is not None:
+            self.root.after_cancel(self._filtro_agendado)
+        self._filtro_agendado = self.root.after(300, self.aplicar_filtro)
+
+    def aplicar_filtro(self):
+        self._filtro_agendado = None
+        try:
+            filtro = FiltroContainers(**{campo: var.get() for campo, var in self.filtro_vars.items()})
+        except ValueError:
+            # Data ainda incompleta: aguardar o restante da digitação
+            return
+        
+        if vars(filtro) != vars(self.filtro_containers):
+            self.filtro_containers = filtro
+            self.carregar_containers()
+
+    def limpar_filtro(self):
+        for var in self.filtro_vars.values():
+            var.set('')
+        self.aplicar_filtro()
+
+    def buscar_containers(self, **kwargs):
+        """Busca uma página de containers respeitando o filtro atual"""
+        return self.servico.listar_containers(self.filtro_containers, **kwargs)
 
     def setup_agendamentos_tab(self):
         # Frame para entrada de dados
@@ -172,8 +374,12 @@ class ContainerManagementSystem:
         
         # Campos de entrada
         ttk.Label(input_frame, text="ID do Container:").grid(row=0, column=0, padx=5, pady=5)
-        self.container_combo = ttk.Combobox(input_frame, textvariable=self.container_id_var, state='readonly')
+        self.container_combo = ttk.Combobox(input_frame, textvariable=self.container_id_var)
         self.container_combo.grid(row=0, column=1, padx=5, pady=5)
+        # Sugere apenas os IDs que começam com o texto digitado, sem consultar o
+        # banco nem esperar a recarga do índice (ver ServicoContainers.indice_ids)
+        AutocompletarCombobox(self.container_combo,
+                              partial(self.servico.buscar_ids, esperar=False))
         
         # Botão de atualizar lista de containers
         ttk.Button(input_frame, text="↻", width=3, 
@@ -183,10 +389,12 @@ class ContainerManagementSystem:
         self.data_entry = ttk.Entry(input_frame, textvariable=self.data_agendamento_var)
         self.data_entry.grid(row=1, column=1, padx=5, pady=5)
         self.data_entry.bind('<KeyRelease>', self.format_data)
+        ttk.Button(input_frame, text="Sugerir data",
+                   command=self.sugerir_data).grid(row=1, column=2, padx=2, pady=5)
         
         ttk.Label(input_frame, text="Tipo de Operação:").grid(row=2, column=0, padx=5, pady=5)
         operacao_combo = ttk.Combobox(input_frame, textvariable=self.tipo_operacao_var, state='readonly')
-        operacao_combo['values'] = ('Carregamento', 'Descarregamento', 'Manutenção')
+        operacao_combo['values'] = TIPOS_OPERACAO
         operacao_combo.grid(row=2, column=1, padx=5, pady=5)
         
         # Frame para botões
@@ -197,6 +405,10 @@ class ContainerManagementSystem:
                   command=self.criar_agendamento).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Remover Agendamento", 
                   command=self.remover_agendamento).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Concluir Operação",
+                   command=self.concluir_agendamento).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Agendamento Recorrente...",
+                   command=self.agendamento_recorrente).pack(side=tk.LEFT, padx=5)
         
         # Treeview para listar agendamentos
         self.agendamento_tree = ttk.Treeview(self.agendamentos_frame,
@@ -213,9 +425,14 @@ class ContainerManagementSystem:
         scrollbar = ttk.Scrollbar(self.agendamentos_frame, orient="vertical", 
                                 command=self.agendamento_tree.yview)
         scrollbar.pack(side='right', fill='y')
-        self.agendamento_tree.configure(yscrollcommand=scrollbar.set)
         
-        # Carregar lista inicial de containers
+        self.agendamento_pager = TreeviewPaginada(
+            self.agendamento_tree, scrollbar,
+            self.servico.listar_agendamentos, executor=self.tarefas,
+            formatar=self.formatar_agendamento,
+            ao_recarregar=partial(self.registrar_etapa, "agendamentos: primeira página exibida"))
+        
+        # Carregar o índice de IDs em segundo plano
         self.atualizar_lista_containers()
 
     def format_cnpj(self, event):
@@ -264,65 +481,136 @@ class ContainerManagementSystem:
         # Move cursor to end
         self.data_entry.icursor(len(formatted))
 
-    def validar_data(self, data_str):
-        try:
-            return datetime.strptime(data_str, '%d/%m/%Y')
-        except ValueError:
-            return None
+    def formatar_container(self, container):
+        """Valores exibidos na lista de containers (data em DD/MM/AAAA)"""
+        return container[:-1] + (data_para_exibicao(container[-1]),)
 
-    def carregar_containers(self):
-        # Limpar treeview
-        for item in self.container_tree.get_children():
-            self.container_tree.delete(item)
-            
-        # Carregar dados do banco
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
-        
-        c.execute("SELECT * FROM containers")
-        containers = c.fetchall()
+    def setup_painel_tab(self):
+        """Aba com os totais por status, tipo, porto e as próximas operações"""
+        self.total_containers_var = tk.StringVar()
+        ttk.Label(self.painel_frame, textvariable=self.total_containers_var,
+                  style='Header.TLabel').pack(anchor='w', padx=5, pady=5)
+        
+        resumos_frame = ttk.Frame(self.painel_frame)
+        resumos_frame.pack(fill='x')
+        self.painel_trees = {}
+        for coluna, (dimensao, titulo) in enumerate((('status', 'Status'),
+                                                     ('tipo_container', 'Tipo'),
+                                                     ('origem', 'Origens'),
+                                                     ('destino', 'Destinos'))):
+            frame = ttk.LabelFrame(resumos_frame, text=titulo, padding="5")
+            frame.grid(row=0, column=coluna, padx=5, pady=5, sticky='nsew')
+            resumos_frame.columnconfigure(coluna, weight=1)
+            tree = ttk.Treeview(frame, columns=('Valor', 'Total'), show='headings', height=8)
+            tree.heading('Valor', text=titulo)
+            tree.heading('Total', text='Total')
+            tree.column('Valor', width=140)
+            tree.column('Total', width=60, anchor='e')
+            tree.pack(fill='both', expand=True)
+            self.painel_trees[dimensao] = tree
+        
+        operacoes_frame = ttk.LabelFrame(self.painel_frame, text="Próximas operações (14 dias)",
+                                         padding="5")
+        operacoes_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        colunas = ('Data',) + TIPOS_OPERACAO + ('Total',)
+        self.operacoes_tree = ttk.Treeview(operacoes_frame, columns=colunas, show='headings')
+        for col in colunas:
+            self.operacoes_tree.heading(col, text=col)
+            self.operacoes_tree.column(col, width=120, anchor='w' if col == 'Data' else 'e')
+        self.operacoes_tree.pack(fill='both', expand=True)
+
+    def atualizar_painel(self):
+        """Recarrega o painel se ele estiver visível (leitura das tabelas de resumo)"""
+        if self.notebook.select() != str(self.painel_frame):
+            return
         
-        for container in containers:
-            self.container_tree.insert('', 'end', values=container)
+        def concluido(resumo):
+            self.total_containers_var.set(f"{resumo['total_containers']} containers no pátio")
+            for dimensao, tree in self.painel_trees.items():
+                tree.delete(*tree.get_children())
+                for valor, total in resumo[dimensao]:
+                    tree.insert('', 'end', values=(valor, total))
             
-        conn.close()
+            # Uma linha por dia, uma coluna por tipo de operação
+            por_dia = {}
+            for data, operacao, total in resumo['operacoes']:
+                por_dia.setdefault(data, {})[operacao] = total
+            self.operacoes_tree.delete(*self.operacoes_tree.get_children())
+            for data, totais in por_dia.items():
+                self.operacoes_tree.insert('', 'end', values=(
+                    data_para_exibicao(data),
+                    *(totais.get(operacao, 0) for operacao in TIPOS_OPERACAO),
+                    sum(totais.values())))
+        
+        self.tarefas.submeter(self.servico.resumo_painel, ao_concluir=concluido, chave='painel',
+                              ao_falhar=self.erro_banco("Erro ao carregar o painel"))
+
+    def formatar_agendamento(self, agendamento):
+        """Valores exibidos na lista de agendamentos (data em DD/MM/AAAA)"""
+        agendamento_id, container_id, data, operacao = agendamento
+        return (agendamento_id, container_id, data_para_exibicao(data), operacao)
+
+    def carregar_containers(self):
+        # Recarregar a partir da primeira página (se a aba já foi construída)
+        if self.container_pager:
+            self.container_pager.recarregar()
 
     def carregar_agendamentos(self):
-        # Limpar treeview
-        for item in self.agendamento_tree.get_children():
-            self.agendamento_tree.delete(item)
-            
-        # Carregar dados do banco
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
-        
-        c.execute("SELECT * FROM agendamentos")
-        agendamentos = c.fetchall()
-        for agendamento in agendamentos:
-            self.agendamento_tree.insert('', 'end', values=agendamento)
-            
-        conn.close()
+        if self.agendamento_pager:
+            self.agendamento_pager.recarregar()
 
     def atualizar_lista_containers(self):
-        """Atualiza a lista de containers disponíveis no combobox"""
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
+        """Recarrega, em segundo plano, o índice de IDs usado pelo autocompletar"""
+        def concluido(total):
+            # Se o container escolhido deixou de existir, limpar a seleção
+            if 'agendamentos' not in self.abas_construidas:
+                return
+            indice = self.servico.indice_ids(esperar=False)
+            if indice is not None and self.container_id_var.get() not in indice:
+                self.container_id_var.set('')
         
-        try:
-            # Buscar todos os IDs de containers cadastrados
-            c.execute("SELECT id FROM containers")
-            containers = c.fetchall()
+        self.servico.invalidar_ids()
+        self.tarefas.submeter(
+            lambda: len(self.servico.ids_containers),
+            ao_concluir=concluido, chave='lista_containers',
+            ao_falhar=self.erro_banco("Erro ao carregar containers"))
+
+    def aplicar_alteracoes(self, alteracoes):
+        """Aplica um conjunto de alterações pontuais às listas e ao combobox"""
+        pagers = {'containers': self.container_pager,
+                  'agendamentos': self.agendamento_pager}
+        
+        for alteracao in alteracoes:
+            # Abas ainda não construídas buscam os dados atuais ao serem abertas
+            if alteracao.tabela != 'containers':
+                if pagers[alteracao.tabela]:
+                    pagers[alteracao.tabela].aplicar(alteracao)
+                continue
+            if not self.container_pager:
+                continue
             
-            # Atualizar valores do combobox
-            self.container_combo['values'] = [container[0] for container in containers]
+            # Linha que não atende ao filtro atual não deve aparecer na lista
+            if (alteracao.operacao != REMOVER and
+                    not self.filtro_containers.aceita(alteracao.linha)):
+                self.container_pager.aplicar(alteracao._replace(operacao=REMOVER))
+            else:
+                self.container_pager.aplicar(alteracao)
             
-            # Se não houver containers, limpar a seleção atual
-            if not containers:
-                self.container_combo.set('')
+            # O índice de IDs do autocompletar já foi atualizado pelo serviço
+            if ('agendamentos' in self.abas_construidas and alteracao.operacao == REMOVER and
+                    alteracao.chave == self.container_id_var.get()):
                 self.container_id_var.set('')
-            
-        finally:
-            conn.close()
+        
+        self.atualizar_painel()
+
+    def erro_banco(self, contexto):
+        """Cria um callback que exibe a falha de uma tarefa em segundo plano"""
+        def exibir(erro):
+            if isinstance(erro, OperacaoInvalida):
+                messagebox.showerror("Erro", str(erro))
+            else:
+                messagebox.showerror("Erro", f"{contexto}: {str(erro)}")
+        return exibir
 
     def login(self):
         """Verifica credenciais e faz login no sistema"""
@@ -334,22 +622,49 @@ class ContainerManagementSystem:
             messagebox.showerror("Erro", "Todos os campos são obrigatórios")
             return
         
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
-        
-        try:
-            c.execute("SELECT * FROM usuarios WHERE cnpj=? AND senha=?", (cnpj, senha))
-            user = c.fetchone()
-            
-            if user:
-                self.login_frame.pack_forget()
-                self.main_frame.pack(expand=True, fill='both')
+        def concluido(sessao):
+            # Token da sessão: o hash da senha é verificado uma única vez
+            self.sessao, _ = sessao
+            self.usuario = self.servico.usuario_da_sessao(self.sessao)
+            # Daqui em diante a interface só enxerga os dados da empresa logada
+            self.servico = self.empresas.servico(self.usuario[1])
+            self.registrar_etapa("login concluído")
+            self.login_frame.pack_forget()
+            self.criar_menu()
+            self.construir_janela_principal()
+            self.root.after_idle(partial(self.registrar_etapa, "janela principal interativa"))
+            if SERVIDOR_CENTRAL:
+                self.sincronizador = Sincronizador(self.servico, ClienteCentral(SERVIDOR_CENTRAL),
+                                                   senha)
+                self.root.after(1000, self.sincronizar)
+        
+        self.tarefas.submeter(partial(self.servico.iniciar_sessao, cnpj, senha),
+                              ao_concluir=concluido, ao_falhar=self.erro_banco("Erro ao fazer login"))
+
+    def sincronizar(self):
+        """Troca as alterações com o banco central e reagenda a próxima rodada"""
+        def concluido(resultado):
+            self.espera_sincronizacao = INTERVALO_SINCRONIZACAO_MS
+            self.root.after(self.espera_sincronizacao, self.sincronizar)
+            if resultado.recebidas or resultado.conflitos:
+                # Alterações de outros terminais (ou agendamentos desfeitos)
                 self.carregar_containers()
                 self.carregar_agendamentos()
-            else:
-                messagebox.showerror("Erro", "Credenciais inválidas")
-        finally:
-            conn.close()
+                self.atualizar_lista_containers()
+                self.atualizar_painel()
+        
+        def falhou(erro):
+            # Sem conexão: as alterações continuam na fila para a próxima rodada
+            log_sincronizacao.warning("sincronização adiada: %s", erro)
+            if isinstance(erro, OSError):
+                self.espera_sincronizacao = min(self.espera_sincronizacao * 2,
+                                                INTERVALO_MAXIMO_SINCRONIZACAO_MS)
+            self.root.after(self.espera_sincronizacao, self.sincronizar)
+        
+        # A rede tem thread própria; só as gravações locais entram na fila de escrita
+        self.tarefas.submeter(partial(self.sincronizador.sincronizar, self.tarefas.escrever),
+                              chave='sincronizacao', rede=True,
+                              ao_concluir=concluido, ao_falhar=falhou)
 
     def cadastrar(self):
         """Cadastra novo usuário no sistema"""
@@ -357,86 +672,212 @@ class ContainerManagementSystem:
         cnpj = self.cnpj_var.get().strip()
         senha = self.senha_var.get().strip()
         
-        if not all([razao_social, cnpj, senha]):
-            messagebox.showerror("Erro", "Todos os campos são obrigatórios")
-            return
+        self.tarefas.submeter(
+            partial(self.servico.cadastrar_usuario, razao_social, cnpj, senha), escrita=True,
+            ao_concluir=lambda _: messagebox.showinfo("Sucesso", "Usuário cadastrado com sucesso"),
+            ao_falhar=self.erro_banco("Erro ao cadastrar"))
+
+    def adicionar_container(self):
+        """Adiciona novo container ao sistema"""
+        valores = dict(zip(CAMPOS_CONTAINER, (v.get() for v in self.container_vars.values())))
+        
+        def concluido(alteracoes):
+            messagebox.showinfo("Sucesso", "Container adicionado com sucesso")
             
-        # Validar formato do CNPJ
-        cnpj_limpo = re.sub(r'[^0-9]', '', cnpj)
-        if len(cnpj_limpo) != 14:
-            messagebox.showerror("Erro", "CNPJ inválido")
+            # Atualizar visualizações
+            self.aplicar_alteracoes(alteracoes)
+            
+            # Limpar campos
+            for var in self.container_vars.values():
+                var.set('')
+        
+        self.tarefas.submeter(partial(self.servico.adicionar_container, valores),
+                              escrita=True, ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao adicionar container"))
+
+    def preencher_formulario(self, event=None):
+        """Copia o container selecionado para os campos de edição"""
+        selection = self.container_tree.selection()
+        if not selection:
+            return
+        valores = self.container_tree.item(selection[0], 'values')
+        for var, valor in zip(self.container_vars.values(), valores):
+            var.set(valor)
+
+    def atualizar_container(self):
+        """Grava as alterações do formulário no container de mesmo ID"""
+        valores = dict(zip(CAMPOS_CONTAINER, (v.get() for v in self.container_vars.values())))
+        container_id = valores['id'].strip()
+        if not container_id:
+            messagebox.showwarning("Aviso", "Selecione um container para atualizar")
             return
         
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
+        def concluido(alteracoes):
+            self.aplicar_alteracoes(alteracoes)
+            messagebox.showinfo("Sucesso", "Container atualizado com sucesso")
         
-        try:
-            # Verificar se CNPJ já existe
-            c.execute("SELECT * FROM usuarios WHERE cnpj=?", (cnpj,))
-            if c.fetchone():
-                messagebox.showerror("Erro", "CNPJ já cadastrado")
-                return
-            
-            # Inserir novo usuário
-            c.execute("INSERT INTO usuarios VALUES (?, ?, ?)", 
-                     (razao_social, cnpj, senha))
-            conn.commit()
-            messagebox.showinfo("Sucesso", "Usuário cadastrado com sucesso")
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro", f"Erro ao cadastrar: {str(e)}")
-        finally:
-            conn.close()
+        self.tarefas.submeter(partial(self.servico.atualizar_container, container_id, valores),
+                              escrita=True, ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao atualizar container"))
 
-    def adicionar_container(self):
-        """Adiciona novo container ao sistema"""
-        # Validar campos
-        valores = {k: v.get().strip() for k, v in self.container_vars.items()}
+    def mostrar_historico(self):
+        """Abre uma janela com os eventos do container selecionado"""
+        selection = self.container_tree.selection()
+        container_id = selection[0] if selection else self.container_vars['ID do Container'].get().strip()
+        if not container_id:
+            messagebox.showwarning("Aviso", "Selecione um container")
+            return
         
-        if not all(valores.values()):
-            messagebox.showerror("Erro", "Todos os campos são obrigatórios")
+        def concluido(eventos):
+            janela = tk.Toplevel(self.root)
+            janela.title(f"Histórico - {container_id}")
+            janela.geometry("700x400")
+            colunas = ('Data/Hora', 'Evento', 'Detalhe')
+            tree = ttk.Treeview(janela, columns=colunas, show='headings')
+            for col, largura in zip(colunas, (150, 180, 350)):
+                tree.heading(col, text=col)
+                tree.column(col, width=largura)
+            scrollbar = ttk.Scrollbar(janela, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side='right', fill='y')
+            tree.pack(fill='both', expand=True, padx=5, pady=5)
+            for item in eventos:
+                tree.insert('', 'end', values=descrever(item))
+        
+        self.tarefas.submeter(partial(self.servico.historico_container, container_id),
+                              ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao carregar histórico"))
+
+    def mostrar_metricas(self):
+        """Abre o painel de diagnóstico com os histogramas de latência"""
+        janela = tk.Toplevel(self.root)
+        janela.title("Métricas de desempenho")
+        janela.geometry("950x450")
+        colunas = ('Categoria', 'Nome', 'Chamadas', 'Média (ms)', 'p50', 'p95', 'p99',
+                   'Máximo (ms)', 'Linhas')
+        campos = ('categoria', 'nome', 'total', 'media_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+                  'maximo_ms', 'linhas')
+        
+        botoes = ttk.Frame(janela, padding=5)
+        botoes.pack(side='bottom', fill='x')
+        tree = ttk.Treeview(janela, columns=colunas, show='headings')
+        for col, largura in zip(colunas, (80, 380, 70, 75, 55, 55, 55, 80, 70)):
+            tree.heading(col, text=col)
+            tree.column(col, width=largura, anchor='w' if col == 'Nome' else 'center')
+        scrollbar = ttk.Scrollbar(janela, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        tree.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        def atualizar():
+            tree.delete(*tree.get_children())
+            for item in self.metricas.resumo():
+                tree.insert('', 'end', values=tuple(item[campo] for campo in campos))
+        
+        def salvar():
+            caminho = filedialog.asksaveasfilename(
+                parent=janela, title="Salvar métricas", defaultextension='.json',
+                initialfile="metricas.json", filetypes=[("JSON", "*.json")])
+            if caminho:
+                total = self.metricas.salvar(caminho)
+                messagebox.showinfo("Métricas", f"{total} métricas salvas", parent=janela)
+        
+        def zerar():
+            self.metricas.zerar()
+            atualizar()
+        
+        ttk.Button(botoes, text="Atualizar", command=atualizar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(botoes, text="Salvar...", command=salvar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(botoes, text="Zerar", command=zerar).pack(side=tk.LEFT, padx=5)
+        atualizar()
+
+    def importar_containers(self):
+        """Importa containers de um manifesto CSV/JSON escolhido pelo usuário"""
+        caminho = filedialog.askopenfilename(
+            title="Importar manifesto",
+            filetypes=[("Manifestos", "*.csv *.json *.jsonl *.ndjson"),
+                       ("Todos os arquivos", "*.*")])
+        if not caminho:
             return
+        
+        def concluido(resultado):
+            # Importação em lote: recarregar as visualizações uma única vez
+            self.carregar_containers()
+            self.atualizar_lista_containers()
+            self.atualizar_painel()
             
-        try:
-            # Validar dimensões
-            for dim in ['Altura (m)', 'Largura (m)', 'Comprimento (m)']:
-                float(valores[dim])
-        except ValueError:
-            messagebox.showerror("Erro", "Dimensões devem ser números válidos")
+            mensagem = (f"{resultado.lidos} registros lidos\n"
+                        f"{resultado.gravados} containers importados\n"
+                        f"{resultado.ignorados} já existentes\n"
+                        f"{len(resultado.erros)} com erro")
+            if not resultado.erros:
+                messagebox.showinfo("Importação concluída", mensagem)
+                return
+            
+            detalhes = [f"Linha {linha}: {erro}" for linha, erro in resultado.erros[:20]]
+            if len(resultado.erros) > 20:
+                detalhes.append(f"... e mais {len(resultado.erros) - 20} erros")
+            messagebox.showwarning("Importação concluída",
+                                   mensagem + "\n\n" + "\n".join(detalhes))
+        
+        self.tarefas.submeter(partial(importar_manifesto, self.servico.db, caminho,
+                                      cnpj=self.servico.cnpj, fila=self.servico.fila),
+                              escrita=True, ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao importar manifesto"))
+
+    def exportar_tabela(self, tabela):
+        """Exporta a tabela para CSV/JSON Lines escolhido pelo usuário"""
+        caminho = filedialog.asksaveasfilename(
+            title=f"Exportar {tabela}", defaultextension='.csv',
+            initialfile=f"{tabela}.csv",
+            filetypes=[("CSV", "*.csv"), ("CSV compactado", "*.csv.gz"),
+                       ("JSON Lines", "*.jsonl"), ("JSON Lines compactado", "*.jsonl.gz")])
+        if not caminho:
             return
         
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
+        self.tarefas.submeter(
+            partial(exportar, self.servico.db, tabela, caminho, cnpj=self.servico.cnpj),
+            ao_concluir=lambda total: messagebox.showinfo(
+                "Exportação concluída", f"{total} registros exportados"),
+            ao_falhar=self.erro_banco(f"Erro ao exportar {tabela}"))
+
+    def arquivar_historico(self):
+        """Move agendamentos vencidos e o histórico de containers removidos para o arquivo"""
+        if not messagebox.askyesno(
+                "Arquivar histórico",
+                f"Arquivar os agendamentos com mais de {DIAS_RETENCAO} dias e o histórico "
+                f"dos containers removidos há mais tempo que isso?"):
+            return
         
-        try:
-            # Verificar se ID já existe
-            c.execute("SELECT id FROM containers WHERE id=?", (valores['ID do Container'],))
-            if c.fetchone():
-                messagebox.showerror("Erro", "Container ID já existe")
+        def concluido(resultado):
+            # Os agendamentos arquivados ainda constam do calendário em memória
+            self.servico.invalidar_caches()
+            self.carregar_agendamentos()
+            self.atualizar_painel()
+            messagebox.showinfo("Arquivamento concluído",
+                                f"{resultado.agendamentos} agendamentos e {resultado.eventos} "
+                                f"eventos arquivados\n"
+                                f"{resultado.paginas_liberadas} páginas liberadas no banco")
+        
+        self.tarefas.submeter(partial(arquivar, self.servico.db), ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao arquivar o histórico"),
+                              chave='arquivamento', escrita=True)
+
+    def replanejar_patio(self):
+        """Realoca todos os containers nos blocos do pátio e mostra a ocupação"""
+        def concluido(plano):
+            if not plano.utilizacao['total'][1]:
+                messagebox.showwarning("Aviso", "Nenhum bloco de pátio cadastrado")
                 return
-            
-            # Inserir container
-            c.execute("""INSERT INTO containers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                     (valores['ID do Container'], valores['Tipo de Container'],
-                      float(valores['Altura (m)']), float(valores['Largura (m)']),
-                      float(valores['Comprimento (m)']), valores['Status'],
-                      valores['Origem'], valores['Destino'],
-                      datetime.now().strftime('%d/%m/%Y')))
-            
-            conn.commit()
-            messagebox.showinfo("Sucesso", "Container adicionado com sucesso")
-            
-            # Atualizar visualizações
-            self.carregar_containers()
-            self.atualizar_lista_containers()
-            
-            # Limpar campos
-            for var in self.container_vars.values():
-                var.set('')
-                
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro", f"Erro ao adicionar container: {str(e)}")
-        finally:
-            conn.close()
+            linhas = [f"{nome}: {ocupados}/{capacidade} ({percentual:.1f}%)"
+                      for nome, (ocupados, capacidade, percentual) in plano.utilizacao.items()]
+            if plano.nao_alocados:
+                linhas.append(f"\n{len(plano.nao_alocados)} containers sem posição compatível")
+            messagebox.showinfo("Pátio replanejado", "\n".join(linhas))
+
+        self.tarefas.submeter(partial(replanejar_patio, self.servico.db), ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao replanejar o pátio"),
+                              chave='patio', escrita=True)
 
     def remover_container(self):
         """Remove container selecionado"""
@@ -448,37 +889,29 @@ class ContainerManagementSystem:
         if not messagebox.askyesno("Confirmar", "Deseja realmente remover o container?"):
             return
             
-        container_id = self.container_tree.item(selection[0])['values'][0]
-        
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
+        # O iid do item é o próprio ID do container
+        container_id = selection[0]
         
-        try:
-            # Verificar se há agendamentos
-            c.execute("SELECT * FROM agendamentos WHERE container_id=?", (container_id,))
-            if c.fetchone():
-                if not messagebox.askyesno("Aviso", 
-                    "Existem agendamentos para este container. Deseja removê-los também?"):
-                    return
-                
-                # Remover agendamentos
-                c.execute("DELETE FROM agendamentos WHERE container_id=?", (container_id,))
-            
-            # Remover container
-            c.execute("DELETE FROM containers WHERE id=?", (container_id,))
-            conn.commit()
-            
+        def removido(alteracoes):
             # Atualizar visualizações
-            self.carregar_containers()
-            self.carregar_agendamentos()
-            self.atualizar_lista_containers()
-            
+            self.aplicar_alteracoes(alteracoes)
             messagebox.showinfo("Sucesso", "Container removido com sucesso")
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro", f"Erro ao remover container: {str(e)}")
-        finally:
-            conn.close()
+        
+        def falhou(erro):
+            # Verificar se há agendamentos
+            if not isinstance(erro, PossuiAgendamentos):
+                self.erro_banco("Erro ao remover container")(erro)
+                return
+            if messagebox.askyesno("Aviso", 
+                "Existem agendamentos para este container. Deseja removê-los também?"):
+                remover(cascata=True)
+        
+        def remover(cascata=False):
+            self.tarefas.submeter(
+                partial(self.servico.remover_container, container_id, cascata=cascata),
+                escrita=True, ao_concluir=removido, ao_falhar=falhou)
+        
+        remover()
 
     def criar_agendamento(self):
         """Cria novo agendamento"""
@@ -486,56 +919,93 @@ class ContainerManagementSystem:
         data = self.data_agendamento_var.get().strip()
         operacao = self.tipo_operacao_var.get().strip()
         
-        if not all([container_id, data, operacao]):
-            messagebox.showerror("Erro", "Todos os campos são obrigatórios")
-            return
-            
-        # Validar data
-        data_obj = self.validar_data(data)
-        if not data_obj:
-            messagebox.showerror("Erro", "Data inválida")
-            return
-            
-        if data_obj.date() < datetime.now().date():
-            messagebox.showerror("Erro", "Data não pode ser no passado")
-            return
-        
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
-        
-        try:
-            # Verificar se container existe
-            c.execute("SELECT * FROM containers WHERE id=?", (container_id,))
-            if not c.fetchone():
-                messagebox.showerror("Erro", "Container não encontrado")
-                return
-            
-            # Verificar conflitos de agendamento
-            c.execute("""SELECT * FROM agendamentos 
-                        WHERE container_id=? AND data_agendamento=?""",
-                     (container_id, data))
-            
-            if c.fetchone():
-                messagebox.showerror("Erro", "Já existe um agendamento para este container nesta data")
-                return
-            
-            # Criar agendamento
-            c.execute("""INSERT INTO agendamentos (container_id, data_agendamento, tipo_operacao)
-                        VALUES (?, ?, ?)""", (container_id, data, operacao))
-            
-            conn.commit()
+        def concluido(alteracoes):
             messagebox.showinfo("Sucesso", "Agendamento criado com sucesso")
             
             # Atualizar visualização e limpar campos
-            self.carregar_agendamentos()
+            self.aplicar_alteracoes(alteracoes)
             self.container_id_var.set('')
             self.data_agendamento_var.set('')
             self.tipo_operacao_var.set('')
+        
+        self.tarefas.submeter(partial(self.servico.criar_agendamento, container_id, data, operacao),
+                              escrita=True, ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao criar agendamento"))
+
+    def sugerir_data(self):
+        """Preenche a data com o primeiro dia com vaga para a operação escolhida"""
+        operacao = self.tipo_operacao_var.get().strip()
+        if not operacao:
+            messagebox.showwarning("Aviso", "Selecione o tipo de operação")
+            return
+        a_partir = self.data_agendamento_var.get().strip() or None
+
+        def concluido(data):
+            if data is None:
+                messagebox.showwarning("Aviso", f"{operacao} está sem capacidade configurada")
+                return
+            self.data_agendamento_var.set(data_para_exibicao(data))
+
+        self.tarefas.submeter(partial(self.servico.proxima_data_disponivel, operacao, a_partir),
+                              ao_concluir=concluido, chave='sugerir_data',
+                              ao_falhar=self.erro_banco("Erro ao sugerir data"))
+
+    def agendamento_recorrente(self):
+        """Abre o diálogo de regra recorrente (operação a cada N dias por filtro)"""
+        janela = tk.Toplevel(self.root)
+        janela.title("Agendamento Recorrente")
+        janela.transient(self.root)
+        frame = ttk.Frame(janela, padding="10")
+        frame.pack(fill='both', expand=True)
+        
+        campos = {
+            'operacao': ("Tipo de Operação:", TIPOS_OPERACAO),
+            'inicio': ("Início (DD/MM/AAAA):", None),
+            'fim': ("Fim (DD/MM/AAAA):", None),
+            'intervalo': ("A cada (dias):", None),
+            'status': ("Status do container:", ('',) + STATUS_CONTAINER),
+            'tipo_container': ("Tipo de container:", ('',) + TIPOS_CONTAINER),
+        }
+        variaveis = {}
+        for linha, (chave, (rotulo, valores)) in enumerate(campos.items()):
+            ttk.Label(frame, text=rotulo).grid(row=linha, column=0, sticky='w', padx=5, pady=3)
+            variaveis[chave] = tk.StringVar()
+            if valores:
+                widget = ttk.Combobox(frame, textvariable=variaveis[chave], values=valores,
+                                      state='readonly')
+            else:
+                widget = ttk.Entry(frame, textvariable=variaveis[chave])
+            widget.grid(row=linha, column=1, padx=5, pady=3)
+        variaveis['intervalo'].set('30')
+        
+        def confirmar():
+            try:
+                intervalo = int(variaveis['intervalo'].get())
+            except ValueError:
+                messagebox.showerror("Erro", "Intervalo deve ser um número de dias", parent=janela)
+                return
+            filtro = FiltroContainers(status=variaveis['status'].get(),
+                                      tipo_container=variaveis['tipo_container'].get())
             
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro", f"Erro ao criar agendamento: {str(e)}")
-        finally:
-            conn.close()
+            def concluido(resultado):
+                janela.destroy()
+                # Inserção em massa: recarregar a lista em vez de aplicar linha a linha
+                self.carregar_agendamentos()
+                self.atualizar_painel()
+                messagebox.showinfo("Agendamento recorrente",
+                                    f"{resultado.criados} agendamentos criados\n"
+                                    f"{resultado.conflitos} já existentes na data\n"
+                                    f"{resultado.sem_vaga} sem vaga no dia")
+            
+            self.tarefas.submeter(
+                partial(self.servico.agendar_recorrente, variaveis['operacao'].get(),
+                        variaveis['inicio'].get().strip(), variaveis['fim'].get().strip(),
+                        intervalo, filtro),
+                escrita=True, ao_concluir=concluido,
+                ao_falhar=self.erro_banco("Erro ao criar agendamentos recorrentes"))
+        
+        ttk.Button(frame, text="Agendar", command=confirmar).grid(
+            row=len(campos), column=0, columnspan=2, pady=10)
 
     def remover_agendamento(self):
         """Remove agendamento selecionado"""
@@ -547,24 +1017,30 @@ class ContainerManagementSystem:
         if not messagebox.askyesno("Confirmar", "Deseja realmente remover o agendamento?"):
             return
             
-        agendamento_id = self.agendamento_tree.item(selection[0])['values'][0]
-        
-        conn = sqlite3.connect('container_system.db')
-        c = conn.cursor()
+        agendamento_id = int(selection[0])
         
-        try:
-            c.execute("DELETE FROM agendamentos WHERE id=?", (agendamento_id,))
-            conn.commit()
-            
-            self.carregar_agendamentos()
+        def concluido(alteracoes):
+            self.aplicar_alteracoes(alteracoes)
             messagebox.showinfo("Sucesso", "Agendamento removido com sucesso")
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro", f"Erro ao remover agendamento: {str(e)}")
-        finally:
-            conn.close()
+        
+        self.tarefas.submeter(partial(self.servico.remover_agendamento, agendamento_id),
+                              escrita=True, ao_concluir=concluido,
+                              ao_falhar=self.erro_banco("Erro ao remover agendamento"))
+
+    def concluir_agendamento(self):
+        """Dá baixa no agendamento selecionado como operação realizada"""
+        selection = self.agendamento_tree.selection()
+        if not selection:
+            messagebox.showwarning("Aviso", "Selecione um agendamento para concluir")
+            return
+        
+        self.tarefas.submeter(partial(self.servico.concluir_agendamento, int(selection[0])),
+                              escrita=True, ao_concluir=self.aplicar_alteracoes,
+                              ao_falhar=self.erro_banco("Erro ao concluir agendamento"))
 
 if __name__ == '__main__':
+    logging.basicConfig(filename=LOG_INICIALIZACAO, level=logging.INFO,
+                        format='%(asctime)s %(name)s %(message)s')
     root = tk.Tk()
     app = ContainerManagementSystem(root)
     root.mainloop()
\ No newline at end of file
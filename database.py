@@ -0,0 +1,638 @@
+"""Camada de acesso ao banco de dados SQLite do sistema de containers."""
+import sqlite3
+import threading
+import time
+import queue
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+DB_PATH = 'container_system.db'
+
+# Pragmas aplicados em toda conexão aberta pelo pool
+PRAGMAS = (
+    # Só vale para bancos novos (antes da primeira tabela e do WAL); nos
+    # antigos é ativado pelo VACUUM completo de arquivamento.compactar
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",       # ~20 MB de cache de páginas
+    "PRAGMA mmap_size=268435456",     # 256 MB mapeados em memória
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Migrações do schema, aplicadas em ordem. A versão atual do banco fica em
+# PRAGMA user_version: a migração N leva o banco da versão N-1 para N.
+MIGRACOES = (
+    # 1: schema original
+    (
+        '''CREATE TABLE IF NOT EXISTS usuarios
+           (razao_social TEXT, cnpj TEXT PRIMARY KEY, senha TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS containers
+           (id TEXT PRIMARY KEY,
+            tipo_container TEXT,
+            altura REAL,
+            largura REAL,
+            comprimento REAL,
+            status TEXT,
+            origem TEXT,
+            destino TEXT,
+            data_entrada TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS agendamentos
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            container_id TEXT,
+            data_agendamento TEXT,
+            tipo_operacao TEXT,
+            FOREIGN KEY(container_id) REFERENCES containers(id))''',
+    ),
+    # 2: datas de agendamento em ISO-8601, cascata na remoção do container e
+    # índice único (container_id, data_agendamento) para a checagem de conflito.
+    # Agendamentos órfãos ou duplicados (mesmo container e data) são descartados,
+    # mantendo o mais antigo.
+    (
+        '''CREATE TABLE agendamentos_v2
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+            data_agendamento TEXT NOT NULL,
+            tipo_operacao TEXT)''',
+        '''INSERT INTO agendamentos_v2 (id, container_id, data_agendamento, tipo_operacao)
+           SELECT id, container_id,
+                  CASE WHEN data_agendamento GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+                       THEN substr(data_agendamento, 7, 4) || '-' ||
+                            substr(data_agendamento, 4, 2) || '-' ||
+                            substr(data_agendamento, 1, 2)
+                       ELSE data_agendamento END,
+                  tipo_operacao
+           FROM agendamentos
+           WHERE container_id IN (SELECT id FROM containers)
+             AND id IN (SELECT MIN(id) FROM agendamentos
+                        GROUP BY container_id, data_agendamento)''',
+        "DROP TABLE agendamentos",
+        "ALTER TABLE agendamentos_v2 RENAME TO agendamentos",
+        '''CREATE UNIQUE INDEX idx_agendamentos_container_data
+           ON agendamentos(container_id, data_agendamento)''',
+        "CREATE INDEX idx_agendamentos_data ON agendamentos(data_agendamento)",
+    ),
+    # 3: data de entrada dos containers também em ISO-8601, para permitir
+    # filtros por intervalo de datas
+    (
+        """UPDATE containers
+           SET data_entrada = substr(data_entrada, 7, 4) || '-' ||
+                              substr(data_entrada, 4, 2) || '-' ||
+                              substr(data_entrada, 1, 2)
+           WHERE data_entrada GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'""",
+    ),
+    # 4: índices da barra de pesquisa. Os compostos terminam em id para que a
+    # paginação keyset (ORDER BY id) com filtro percorra só o trecho do índice.
+    # A busca livre por ID/origem/destino usa uma tabela FTS5 de conteúdo
+    # externo mantida por triggers.
+    (
+        "CREATE INDEX idx_containers_status ON containers(status, id)",
+        "CREATE INDEX idx_containers_tipo ON containers(tipo_container, id)",
+        "CREATE INDEX idx_containers_origem ON containers(origem COLLATE NOCASE, id)",
+        "CREATE INDEX idx_containers_destino ON containers(destino COLLATE NOCASE, id)",
+        "CREATE INDEX idx_containers_entrada ON containers(data_entrada)",
+        '''CREATE VIRTUAL TABLE containers_fts USING fts5(
+               id, origem, destino,
+               content='containers', content_rowid='rowid',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+        '''CREATE TRIGGER containers_fts_ai AFTER INSERT ON containers BEGIN
+               INSERT INTO containers_fts(rowid, id, origem, destino)
+               VALUES (new.rowid, new.id, new.origem, new.destino);
+           END''',
+        '''CREATE TRIGGER containers_fts_ad AFTER DELETE ON containers BEGIN
+               INSERT INTO containers_fts(containers_fts, rowid, id, origem, destino)
+               VALUES ('delete', old.rowid, old.id, old.origem, old.destino);
+           END''',
+        '''CREATE TRIGGER containers_fts_au AFTER UPDATE OF id, origem, destino ON containers BEGIN
+               INSERT INTO containers_fts(containers_fts, rowid, id, origem, destino)
+               VALUES ('delete', old.rowid, old.id, old.origem, old.destino);
+               INSERT INTO containers_fts(rowid, id, origem, destino)
+               VALUES (new.rowid, new.id, new.origem, new.destino);
+           END''',
+        "INSERT INTO containers_fts(containers_fts) VALUES ('rebuild')",
+    ),
+    # 5: pátio. Cada bloco tem baias x fileiras posições de chão e até
+    # ``niveis`` containers por pilha; alocacoes guarda o último plano
+    # gerado por patio.replanejar_patio.
+    (
+        '''CREATE TABLE patio_blocos (
+               nome TEXT PRIMARY KEY,
+               baias INTEGER NOT NULL CHECK (baias > 0),
+               fileiras INTEGER NOT NULL CHECK (fileiras > 0),
+               niveis INTEGER NOT NULL CHECK (niveis > 0),
+               fileiras_energizadas INTEGER NOT NULL DEFAULT 0,
+               comprimento_max REAL NOT NULL,
+               largura_max REAL NOT NULL,
+               altura_max REAL NOT NULL)''',
+        '''CREATE TABLE alocacoes (
+               container_id TEXT PRIMARY KEY REFERENCES containers(id) ON DELETE CASCADE,
+               bloco TEXT NOT NULL REFERENCES patio_blocos(nome) ON DELETE CASCADE,
+               baia INTEGER NOT NULL,
+               fileira INTEGER NOT NULL,
+               nivel INTEGER NOT NULL)''',
+        "CREATE UNIQUE INDEX idx_alocacoes_posicao ON alocacoes(bloco, baia, fileira, nivel)",
+    ),
+    # 6: capacidade diária por tipo de operação (sem linha = sem limite)
+    (
+        '''CREATE TABLE capacidade_operacoes (
+               tipo_operacao TEXT PRIMARY KEY,
+               limite_diario INTEGER NOT NULL CHECK (limite_diario >= 0))''',
+    ),
+    # 7: resumos do painel mantidos por triggers. Cada linha conta os
+    # containers com um valor de status/tipo/origem/destino, ou os
+    # agendamentos de um tipo em um dia; linhas zeradas são mantidas e
+    # filtradas na leitura.
+    (
+        '''CREATE TABLE resumo_containers (
+               dimensao TEXT NOT NULL,
+               valor TEXT,
+               total INTEGER NOT NULL,
+               PRIMARY KEY (dimensao, valor)) WITHOUT ROWID''',
+        '''CREATE TABLE resumo_agendamentos (
+               data_agendamento TEXT NOT NULL,
+               tipo_operacao TEXT NOT NULL,
+               total INTEGER NOT NULL,
+               PRIMARY KEY (data_agendamento, tipo_operacao)) WITHOUT ROWID''',
+        '''CREATE TRIGGER resumo_containers_ai AFTER INSERT ON containers BEGIN
+               INSERT INTO resumo_containers VALUES ('status', new.status, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES ('tipo_container', new.tipo_container, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES ('origem', new.origem, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES ('destino', new.destino, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER resumo_containers_ad AFTER DELETE ON containers BEGIN
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'status' AND valor = old.status;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'tipo_container' AND valor = old.tipo_container;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'origem' AND valor = old.origem;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'destino' AND valor = old.destino;
+           END''',
+        '''CREATE TRIGGER resumo_containers_au
+           AFTER UPDATE OF status, tipo_container, origem, destino ON containers BEGIN
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'status' AND valor = old.status;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'tipo_container' AND valor = old.tipo_container;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'origem' AND valor = old.origem;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE dimensao = 'destino' AND valor = old.destino;
+               INSERT INTO resumo_containers VALUES ('status', new.status, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES ('tipo_container', new.tipo_container, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES ('origem', new.origem, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES ('destino', new.destino, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER resumo_agendamentos_ai AFTER INSERT ON agendamentos BEGIN
+               INSERT INTO resumo_agendamentos VALUES (new.data_agendamento, new.tipo_operacao, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER resumo_agendamentos_ad AFTER DELETE ON agendamentos BEGIN
+               UPDATE resumo_agendamentos SET total = total - 1
+                WHERE data_agendamento = old.data_agendamento AND tipo_operacao = old.tipo_operacao;
+           END''',
+        '''CREATE TRIGGER resumo_agendamentos_au
+           AFTER UPDATE OF data_agendamento, tipo_operacao ON agendamentos BEGIN
+               UPDATE resumo_agendamentos SET total = total - 1
+                WHERE data_agendamento = old.data_agendamento AND tipo_operacao = old.tipo_operacao;
+               INSERT INTO resumo_agendamentos VALUES (new.data_agendamento, new.tipo_operacao, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        """INSERT INTO resumo_containers
+           SELECT 'status', status, COUNT(*) FROM containers GROUP BY status""",
+        """INSERT INTO resumo_containers
+           SELECT 'tipo_container', tipo_container, COUNT(*) FROM containers GROUP BY tipo_container""",
+        """INSERT INTO resumo_containers
+           SELECT 'origem', origem, COUNT(*) FROM containers GROUP BY origem""",
+        """INSERT INTO resumo_containers
+           SELECT 'destino', destino, COUNT(*) FROM containers GROUP BY destino""",
+        '''INSERT INTO resumo_agendamentos
+           SELECT data_agendamento, tipo_operacao, COUNT(*) FROM agendamentos
+            GROUP BY data_agendamento, tipo_operacao''',
+    ),
+    # 8: histórico de eventos dos containers (somente inserção, ver eventos.py).
+    # Sem chave estrangeira: o histórico sobrevive à remoção do container.
+    (
+        '''CREATE TABLE eventos_container (
+               id INTEGER PRIMARY KEY,
+               container_id TEXT NOT NULL,
+               ts INTEGER NOT NULL,
+               tipo INTEGER NOT NULL,
+               valor INTEGER,
+               detalhe TEXT)''',
+        "CREATE INDEX idx_eventos_container_ts ON eventos_container(container_id, ts)",
+    ),
+    # 9: dados separados por empresa (CNPJ do usuário dono). Registros
+    # antigos ficam com a única empresa cadastrada, se houver só uma; do
+    # contrário ficam sem dono até "cli.py atribuir-empresa". Os índices e
+    # os resumos passam a começar por cnpj, então as consultas de uma
+    # empresa percorrem apenas o trecho dela.
+    (
+        "ALTER TABLE containers ADD COLUMN cnpj TEXT",
+        "ALTER TABLE agendamentos ADD COLUMN cnpj TEXT",
+        "ALTER TABLE eventos_container ADD COLUMN cnpj TEXT",
+        '''UPDATE containers SET cnpj = (SELECT cnpj FROM usuarios)
+           WHERE (SELECT COUNT(*) FROM usuarios) = 1''',
+        '''UPDATE agendamentos
+           SET cnpj = (SELECT c.cnpj FROM containers c WHERE c.id = agendamentos.container_id)''',
+        '''UPDATE eventos_container
+           SET cnpj = (SELECT c.cnpj FROM containers c WHERE c.id = eventos_container.container_id)''',
+        "DROP INDEX idx_containers_status",
+        "DROP INDEX idx_containers_tipo",
+        "DROP INDEX idx_containers_origem",
+        "DROP INDEX idx_containers_destino",
+        "DROP INDEX idx_containers_entrada",
+        "DROP INDEX idx_agendamentos_data",
+        "CREATE INDEX idx_containers_cnpj ON containers(cnpj, id)",
+        "CREATE INDEX idx_containers_status ON containers(cnpj, status, id)",
+        "CREATE INDEX idx_containers_tipo ON containers(cnpj, tipo_container, id)",
+        "CREATE INDEX idx_containers_origem ON containers(cnpj, origem COLLATE NOCASE, id)",
+        "CREATE INDEX idx_containers_destino ON containers(cnpj, destino COLLATE NOCASE, id)",
+        "CREATE INDEX idx_containers_entrada ON containers(cnpj, data_entrada)",
+        "CREATE INDEX idx_agendamentos_cnpj ON agendamentos(cnpj, id)",
+        "CREATE INDEX idx_agendamentos_data ON agendamentos(cnpj, data_agendamento)",
+        "DROP TRIGGER resumo_containers_ai",
+        "DROP TRIGGER resumo_containers_ad",
+        "DROP TRIGGER resumo_containers_au",
+        "DROP TRIGGER resumo_agendamentos_ai",
+        "DROP TRIGGER resumo_agendamentos_ad",
+        "DROP TRIGGER resumo_agendamentos_au",
+        "DROP TABLE resumo_containers",
+        "DROP TABLE resumo_agendamentos",
+        '''CREATE TABLE resumo_containers (
+               cnpj TEXT NOT NULL,
+               dimensao TEXT NOT NULL,
+               valor TEXT,
+               total INTEGER NOT NULL,
+               PRIMARY KEY (cnpj, dimensao, valor)) WITHOUT ROWID''',
+        '''CREATE TABLE resumo_agendamentos (
+               cnpj TEXT NOT NULL,
+               data_agendamento TEXT NOT NULL,
+               tipo_operacao TEXT NOT NULL,
+               total INTEGER NOT NULL,
+               PRIMARY KEY (cnpj, data_agendamento, tipo_operacao)) WITHOUT ROWID''',
+        '''CREATE TRIGGER resumo_containers_ai AFTER INSERT ON containers BEGIN
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'status', new.status, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'tipo_container', new.tipo_container, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'origem', new.origem, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'destino', new.destino, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER resumo_containers_ad AFTER DELETE ON containers BEGIN
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'status' AND valor = old.status;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'tipo_container' AND valor = old.tipo_container;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'origem' AND valor = old.origem;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'destino' AND valor = old.destino;
+           END''',
+        '''CREATE TRIGGER resumo_containers_au
+           AFTER UPDATE OF status, tipo_container, origem, destino, cnpj ON containers BEGIN
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'status' AND valor = old.status;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'tipo_container' AND valor = old.tipo_container;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'origem' AND valor = old.origem;
+               UPDATE resumo_containers SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND dimensao = 'destino' AND valor = old.destino;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'status', new.status, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'tipo_container', new.tipo_container, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'origem', new.origem, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+               INSERT INTO resumo_containers VALUES (coalesce(new.cnpj, ''), 'destino', new.destino, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER resumo_agendamentos_ai AFTER INSERT ON agendamentos BEGIN
+               INSERT INTO resumo_agendamentos
+               VALUES (coalesce(new.cnpj, ''), new.data_agendamento, new.tipo_operacao, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER resumo_agendamentos_ad AFTER DELETE ON agendamentos BEGIN
+               UPDATE resumo_agendamentos SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND data_agendamento = old.data_agendamento
+                  AND tipo_operacao = old.tipo_operacao;
+           END''',
+        '''CREATE TRIGGER resumo_agendamentos_au
+           AFTER UPDATE OF data_agendamento, tipo_operacao, cnpj ON agendamentos BEGIN
+               UPDATE resumo_agendamentos SET total = total - 1
+                WHERE cnpj = coalesce(old.cnpj, '') AND data_agendamento = old.data_agendamento
+                  AND tipo_operacao = old.tipo_operacao;
+               INSERT INTO resumo_agendamentos
+               VALUES (coalesce(new.cnpj, ''), new.data_agendamento, new.tipo_operacao, 1)
+                   ON CONFLICT DO UPDATE SET total = total + 1;
+           END''',
+        """INSERT INTO resumo_containers
+           SELECT coalesce(cnpj, ''), 'status', status, COUNT(*) FROM containers GROUP BY 1, 3""",
+        """INSERT INTO resumo_containers
+           SELECT coalesce(cnpj, ''), 'tipo_container', tipo_container, COUNT(*) FROM containers GROUP BY 1, 3""",
+        """INSERT INTO resumo_containers
+           SELECT coalesce(cnpj, ''), 'origem', origem, COUNT(*) FROM containers GROUP BY 1, 3""",
+        """INSERT INTO resumo_containers
+           SELECT coalesce(cnpj, ''), 'destino', destino, COUNT(*) FROM containers GROUP BY 1, 3""",
+        '''INSERT INTO resumo_agendamentos
+           SELECT coalesce(cnpj, ''), data_agendamento, tipo_operacao, COUNT(*) FROM agendamentos
+            GROUP BY 1, 2, 3''',
+    ),
+    # 10: sincronização com um banco central. O terminal acumula suas
+    # alterações em fila_sincronizacao até o envio; o central guarda as
+    # aplicadas em registro_sincronizacao, de onde os outros terminais as
+    # recebem. Os dois lados mantêm em versoes_sincronizacao o instante da
+    # última alteração de cada registro, usado na resolução de conflitos.
+    (
+        '''CREATE TABLE fila_sincronizacao (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               ts REAL NOT NULL,
+               cnpj TEXT,
+               tabela TEXT NOT NULL,
+               operacao TEXT NOT NULL,
+               chave TEXT NOT NULL,
+               dados TEXT)''',
+        "CREATE INDEX idx_fila_sincronizacao_cnpj ON fila_sincronizacao(cnpj, id)",
+        '''CREATE TABLE registro_sincronizacao (
+               seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               origem TEXT NOT NULL,
+               ts REAL NOT NULL,
+               cnpj TEXT,
+               tabela TEXT NOT NULL,
+               operacao TEXT NOT NULL,
+               chave TEXT NOT NULL,
+               dados TEXT)''',
+        "CREATE INDEX idx_registro_sincronizacao_cnpj ON registro_sincronizacao(cnpj, seq)",
+        '''CREATE TABLE versoes_sincronizacao (
+               tabela TEXT NOT NULL,
+               chave TEXT NOT NULL,
+               ts REAL NOT NULL,
+               PRIMARY KEY (tabela, chave)) WITHOUT ROWID''',
+        '''CREATE TABLE estado_sincronizacao (
+               nome TEXT PRIMARY KEY,
+               valor TEXT) WITHOUT ROWID''',
+    ),
+    # 11: o ID é gravado como digitado; a busca por prefixo (filtro e
+    # autocompletar) ignora maiúsculas e minúsculas pela faixa em NOCASE
+    (
+        "CREATE INDEX idx_containers_id_nocase ON containers(id COLLATE NOCASE)",
+        "CREATE INDEX idx_containers_cnpj_id_nocase ON containers(cnpj, id COLLATE NOCASE)",
+    ),
+)
+
+FORMATO_DATA = '%d/%m/%Y'
+
+
+def data_para_iso(data_str):
+    """Converte 'DD/MM/AAAA' para o formato armazenado ('AAAA-MM-DD')"""
+    return datetime.strptime(data_str, FORMATO_DATA).date().isoformat()
+
+
+def data_para_exibicao(data_iso):
+    """Converte a data armazenada ('AAAA-MM-DD') para 'DD/MM/AAAA'"""
+    try:
+        return datetime.strptime(data_iso, '%Y-%m-%d').strftime(FORMATO_DATA)
+    except (TypeError, ValueError):
+        return data_iso
+
+
+# Alteração pontual em uma linha, aplicada diretamente às visualizações
+# sem recarregar a tabela inteira (chave = id do container/agendamento)
+Alteracao = namedtuple('Alteracao', 'tabela operacao chave linha')
+INSERIR = 'inserir'
+ATUALIZAR = 'atualizar'
+REMOVER = 'remover'
+
+
+class Database:
+    """Pool pequeno de conexões SQLite persistentes.
+
+    As conexões são abertas sob demanda (até ``tamanho_pool``), configuradas
+    uma única vez com os PRAGMAS acima e reaproveitadas entre as chamadas.
+    Cada conexão mantém um cache de statements preparados
+    (``cached_statements``), então o mesmo SQL não é recompilado a cada uso.
+    Dentro de uma mesma thread, chamadas aninhadas reutilizam a conexão já
+    em uso, o que permite agrupar várias operações em ``transacao()``.
+
+    Com ``metricas`` (metricas.Metricas) cada comando tem a duração e o
+    número de linhas registrados, e os lentos vão para o log com o plano.
+    """
+
+    def __init__(self, caminho=DB_PATH, tamanho_pool=4, cached_statements=256, metricas=None):
+        self.caminho = caminho
+        self.tamanho_pool = tamanho_pool
+        self.cached_statements = cached_statements
+        self.metricas = metricas
+        self._livres = queue.LifoQueue()
+        self._todas = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _abrir_conexao(self):
+        conn = sqlite3.connect(self.caminho,
+                               isolation_level=None,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _obter(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._todas) < self.tamanho_pool:
+                conn = self._abrir_conexao()
+                self._todas.append(conn)
+                return conn
+
+        # Pool esgotado: aguardar uma conexão ser devolvida
+        return self._livres.get()
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão do pool para a thread atual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._obter()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._livres.put(conn)
+
+    @contextmanager
+    def transacao(self):
+        """Agrupa as operações do bloco em uma única transação"""
+        with self.conexao() as conn:
+            if conn.in_transaction:
+                # Transação já aberta mais acima na pilha: apenas participa dela
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _registrar(self, conn, sql, params, inicio, linhas):
+        self.metricas.sql_executado(conn, sql, params,
+                                    (time.perf_counter() - inicio) * 1000, linhas)
+
+    def executar(self, sql, params=()):
+        """Executa um comando e retorna o cursor (rowcount/lastrowid)"""
+        with self.conexao() as conn:
+            if self.metricas is None:
+                return conn.execute(sql, params)
+            inicio = time.perf_counter()
+            cursor = conn.execute(sql, params)
+            self._registrar(conn, sql, params, inicio, cursor.rowcount)
+            return cursor
+
+    def executar_muitos(self, sql, seq_params):
+        with self.conexao() as conn:
+            if self.metricas is None:
+                return conn.executemany(sql, seq_params)
+            inicio = time.perf_counter()
+            cursor = conn.executemany(sql, seq_params)
+            # Uma amostra dos parâmetros permite mostrar o plano no log
+            amostra = seq_params[0] if isinstance(seq_params, list) and seq_params else None
+            self._registrar(conn, sql, amostra, inicio, cursor.rowcount)
+            return cursor
+
+    def consultar(self, sql, params=()):
+        with self.conexao() as conn:
+            if self.metricas is None:
+                return conn.execute(sql, params).fetchall()
+            inicio = time.perf_counter()
+            linhas = conn.execute(sql, params).fetchall()
+            self._registrar(conn, sql, params, inicio, len(linhas))
+            return linhas
+
+    def consultar_um(self, sql, params=()):
+        with self.conexao() as conn:
+            if self.metricas is None:
+                return conn.execute(sql, params).fetchone()
+            inicio = time.perf_counter()
+            linha = conn.execute(sql, params).fetchone()
+            self._registrar(conn, sql, params, inicio, 1 if linha else 0)
+            return linha
+
+    def iterar(self, sql, params=(), tamanho_lote=1000):
+        """Gera as linhas da consulta em lotes com fetchmany.
+
+        A conexão fica emprestada até o gerador ser esgotado ou fechado, e no
+        máximo ``tamanho_lote`` linhas ficam em memória por vez.
+        """
+        with self.conexao() as conn:
+            # Nas métricas entra só o tempo gasto no SQLite, não o de quem consome
+            gasto, total = 0.0, 0
+            inicio = time.perf_counter()
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    lote = cursor.fetchmany(tamanho_lote)
+                    gasto += time.perf_counter() - inicio
+                    if not lote:
+                        break
+                    total += len(lote)
+                    yield from lote
+                    inicio = time.perf_counter()
+            finally:
+                cursor.close()
+                if self.metricas is not None:
+                    self.metricas.sql_executado(conn, sql, params, gasto * 1000, total)
+
+    def consultar_pagina(self, tabela, chave='id', apos=None, antes=None,
+                         limite=200, colunas='*', filtro='', params=(), params_tabela=(),
+                         valor='?', desempate=None, valor_desempate='?'):
+        """Busca uma página ordenada pela chave usando paginação keyset.
+
+        Com ``apos`` retorna as linhas seguintes à chave informada; com
+        ``antes`` retorna as linhas anteriores (já em ordem crescente). Sem
+        nenhum dos dois retorna a primeira página. A consulta percorre apenas
+        ``limite`` entradas do índice da chave, independente do tamanho da
+        tabela.
+
+        ``valor`` é a expressão que converte ``apos``/``antes`` no valor da
+        chave (ex.: o rowid da linha com aquele ID). Para chaves que podem se
+        repetir, ``desempate`` (ex.: 'rowid') completa a ordem, com o valor
+        da linha de referência dado por ``valor_desempate``. ``params_tabela``
+        são os parâmetros de ``tabela`` quando ela é uma junção.
+        """
+        referencia = apos if apos is not None else antes
+        condicoes = []
+        argumentos = list(params_tabela)
+        ordem = 'ASC' if antes is None or apos is not None else 'DESC'
+        if referencia is not None:
+            operador = '>' if ordem == 'ASC' else '<'
+            # Primeiro na condição: o SQLite usa o primeiro limite encontrado
+            # para a faixa do índice, e o da página é o mais estreito
+            if desempate is None:
+                condicoes.append(f"{chave} {operador} {valor}")
+                argumentos.append(referencia)
+            else:
+                condicoes.append(f"{chave} {operador}= {valor} AND ({chave} {operador} {valor} "
+                                 f"OR {desempate} {operador} {valor_desempate})")
+                argumentos.extend((referencia, referencia, referencia))
+        if filtro:
+            condicoes.append(f"({filtro})")
+        argumentos.extend(params)
+
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+        ordenacao = ', '.join(f"{expressao} {ordem}" for expressao in (chave, desempate)
+                              if expressao is not None)
+        argumentos.append(limite)
+        linhas = self.consultar(f"SELECT {colunas} FROM {tabela} {where} "
+                                f"ORDER BY {ordenacao} LIMIT ?", argumentos)
+        if ordem == 'DESC':
+            linhas.reverse()
+        return linhas
+
+    def inicializar_schema(self):
+        """Aplica as migrações pendentes, cada uma em sua própria transação"""
+        with self.conexao() as conn:
+            # Reconstruções de tabela exigem as chaves estrangeiras desligadas,
+            # e o PRAGMA não tem efeito dentro de uma transação
+            conn.execute("PRAGMA foreign_keys=OFF")
+            try:
+                versao = conn.execute("PRAGMA user_version").fetchone()[0]
+                for numero in range(versao + 1, len(MIGRACOES) + 1):
+                    with self.transacao():
+                        for comando in MIGRACOES[numero - 1]:
+                            conn.execute(comando)
+                        conn.execute(f"PRAGMA user_version={numero}")
+            finally:
+                conn.execute("PRAGMA foreign_keys=ON")
+
+    def fechar(self):
+        with self._lock:
+            for conn in self._todas:
+                conn.close()
+            self._todas.clear()
+        self._livres = queue.LifoQueue()
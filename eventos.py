@@ -0,0 +1,86 @@
+"""Histórico de eventos dos containers (tabela eventos_container, só inserção).
+
+Cada evento ocupa poucos bytes: o tipo é um código inteiro, o instante é um
+timestamp Unix em segundos e ``valor`` guarda o índice do status ou da
+operação nas tuplas de validacao. ``detalhe`` só é preenchido quando há
+texto livre (portos, data agendada, posição no pátio). As consultas por
+container e intervalo de tempo usam o índice (container_id, ts). ``cnpj`` é
+a empresa dona do container quando o evento ocorreu.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from validacao import STATUS_CONTAINER, TIPOS_OPERACAO
+
+# Códigos gravados na coluna tipo (não renumerar: o histórico é permanente)
+CRIADO = 1
+STATUS = 2
+MOVIMENTO = 3
+ALOCADO = 4
+EDITADO = 5
+AGENDADO = 6
+AGENDAMENTO_CANCELADO = 7
+OPERACAO_CONCLUIDA = 8
+REMOVIDO = 9
+
+NOMES_EVENTOS = {
+    CRIADO: "Cadastrado",
+    STATUS: "Mudança de status",
+    MOVIMENTO: "Mudança de origem/destino",
+    ALOCADO: "Posição no pátio",
+    EDITADO: "Dados alterados",
+    AGENDADO: "Operação agendada",
+    AGENDAMENTO_CANCELADO: "Agendamento cancelado",
+    OPERACAO_CONCLUIDA: "Operação concluída",
+    REMOVIDO: "Removido",
+}
+
+# Eventos cujo ``valor`` indexa STATUS_CONTAINER ou TIPOS_OPERACAO
+_VALORES = {CRIADO: STATUS_CONTAINER, STATUS: STATUS_CONTAINER,
+            AGENDADO: TIPOS_OPERACAO, AGENDAMENTO_CANCELADO: TIPOS_OPERACAO,
+            OPERACAO_CONCLUIDA: TIPOS_OPERACAO}
+
+Evento = namedtuple('Evento', 'container_id ts tipo valor detalhe cnpj', defaults=(None,))
+
+
+def evento(container_id, tipo, valor=None, detalhe=None, ts=None, cnpj=None):
+    """Cria um Evento; ``valor`` pode ser o texto do status/operação"""
+    if isinstance(valor, str):
+        valor = _VALORES[tipo].index(valor)
+    return Evento(container_id, int(time.time()) if ts is None else ts, tipo, valor, detalhe,
+                  cnpj)
+
+
+def gravar_eventos(db, eventos):
+    """Grava os eventos com um único executemany (na transação corrente, se houver)"""
+    eventos = list(eventos)
+    if eventos:
+        db.executar_muitos("""INSERT INTO eventos_container (container_id, ts, tipo, valor,
+                                                           detalhe, cnpj)
+                              VALUES (?, ?, ?, ?, ?, ?)""", eventos)
+    return len(eventos)
+
+
+def consultar_eventos(db, container_id, de=None, ate=None, cnpj=None):
+    """Eventos do container em ordem cronológica, opcionalmente entre dois
+    timestamps e só os registrados para a empresa ``cnpj``"""
+    params = [container_id, 0 if de is None else de, 2 ** 62 if ate is None else ate]
+    empresa = ''
+    if cnpj is not None:
+        empresa = 'AND cnpj = ?'
+        params.append(cnpj)
+    return [Evento(*linha) for linha in db.consultar(
+        f"""SELECT container_id, ts, tipo, valor, detalhe, cnpj FROM eventos_container
+            WHERE container_id = ? AND ts BETWEEN ? AND ? {empresa}
+            ORDER BY ts, id""", params)]
+
+
+def descrever(evento):
+    """(data/hora, nome do evento, descrição) para exibição"""
+    texto = None
+    if evento.valor is not None and evento.tipo in _VALORES:
+        texto = _VALORES[evento.tipo][evento.valor]
+    descricao = ' - '.join(parte for parte in (texto, evento.detalhe) if parte)
+    return (datetime.fromtimestamp(evento.ts).strftime('%d/%m/%Y %H:%M:%S'),
+            NOMES_EVENTOS.get(evento.tipo, str(evento.tipo)), descricao)
@@ -0,0 +1,106 @@
+"""Exportação de containers e agendamentos para CSV ou JSON Lines."""
+import csv
+import gzip
+import json
+
+from validacao import OperacaoInvalida, ler_data
+
+COLUNAS = {
+    'containers': ('id', 'tipo_container', 'altura', 'largura', 'comprimento',
+                   'status', 'origem', 'destino', 'data_entrada'),
+    'agendamentos': ('id', 'container_id', 'data_agendamento', 'tipo_operacao'),
+}
+
+FORMATOS = ('csv', 'jsonl')
+
+
+def montar_consulta(tabela, status=None, tipo_container=None, data_inicio=None,
+                    data_fim=None, tipo_operacao=None, cnpj=None):
+    """Monta o SELECT parametrizado da exportação com os filtros informados.
+
+    Em agendamentos, status e tipo_container se referem ao container
+    agendado e o intervalo de datas à data do agendamento; em containers, à
+    data de entrada. Com ``cnpj`` saem apenas os registros da empresa.
+    """
+    if tabela not in COLUNAS:
+        raise OperacaoInvalida(f"Tabela desconhecida: {tabela}")
+
+    condicoes, params = [], []
+    if tabela == 'containers':
+        origem = 'containers c'
+        coluna_data = 'c.data_entrada'
+    else:
+        origem = 'agendamentos a'
+        coluna_data = 'a.data_agendamento'
+        if status or tipo_container:
+            origem += ' JOIN containers c ON c.id = a.container_id'
+        if tipo_operacao:
+            condicoes.append('a.tipo_operacao = ?')
+            params.append(tipo_operacao)
+
+    if cnpj:
+        condicoes.append(f"{origem.split()[1]}.cnpj = ?")
+        params.append(cnpj)
+    if status:
+        condicoes.append('c.status = ?')
+        params.append(status)
+    if tipo_container:
+        condicoes.append('c.tipo_container = ?')
+        params.append(tipo_container)
+    if data_inicio:
+        condicoes.append(f'{coluna_data} >= ?')
+        params.append(ler_data(data_inicio).isoformat())
+    if data_fim:
+        condicoes.append(f'{coluna_data} <= ?')
+        params.append(ler_data(data_fim).isoformat())
+
+    apelido = origem.split()[1]
+    colunas = ', '.join(f'{apelido}.{coluna}' for coluna in COLUNAS[tabela])
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ''
+    return f"SELECT {colunas} FROM {origem}{where} ORDER BY {apelido}.id", params
+
+
+def _formato_do_arquivo(caminho):
+    nome = caminho.lower()
+    compactado = nome.endswith('.gz')
+    if compactado:
+        nome = nome[:-3]
+    formato = 'jsonl' if nome.endswith(('.jsonl', '.ndjson')) else 'csv'
+    return formato, compactado
+
+
+def exportar(db, tabela, caminho, formato=None, compactar=None, tamanho_lote=1000,
+             **filtros):
+    """Grava as linhas da tabela em ``caminho`` e retorna quantas foram escritas.
+
+    As linhas são lidas do banco com fetchmany e escritas uma a uma, então a
+    memória usada não depende do volume exportado. Formato e compactação
+    gzip são deduzidos da extensão (.csv, .jsonl, com ou sem .gz) quando não
+    informados.
+    """
+    formato_arquivo, compactado_arquivo = _formato_do_arquivo(caminho)
+    formato = formato or formato_arquivo
+    compactar = compactado_arquivo if compactar is None else compactar
+    if formato not in FORMATOS:
+        raise OperacaoInvalida(f"Formato de exportação não suportado: {formato}")
+
+    sql, params = montar_consulta(tabela, **filtros)
+    colunas = COLUNAS[tabela]
+    abrir = gzip.open if compactar else open
+    total = 0
+
+    with abrir(caminho, 'wt', encoding='utf-8', newline='') as arquivo:
+        linhas = db.iterar(sql, params, tamanho_lote)
+        if formato == 'csv':
+            escritor = csv.writer(arquivo)
+            escritor.writerow(colunas)
+            for linha in linhas:
+                escritor.writerow(linha)
+                total += 1
+        else:
+            for linha in linhas:
+                arquivo.write(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False))
+                arquivo.write('\n')
+                total += 1
+
+    return total
@@ -0,0 +1,198 @@
+"""Filtros da lista de containers traduzidos para SQL parametrizado."""
+import re
+import string
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from database import data_para_iso
+
+
+# Minúsculas como a colação NOCASE do SQLite, que só converte o ASCII
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def sem_caixa(texto):
+    return texto.translate(_NOCASE)
+
+
+def faixa_prefixo(prefixo):
+    """Retorna (inicio, fim) tal que inicio <= valor < fim equivale ao prefixo.
+
+    Uma comparação por faixa usa o índice da coluna, ao contrário de LIKE
+    com a colação padrão (BINARY). Para comparar em NOCASE passe o prefixo
+    por sem_caixa(): o fim da faixa precisa estar na ordem das minúsculas.
+    """
+    return prefixo, prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+
+def consulta_fts(texto):
+    """Converte o texto livre em uma consulta FTS5 (todos os termos, por prefixo)"""
+    termos = re.findall(r'\w+', texto)
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+# Busca por texto paginada pelo FTS: o MATCH percorre o índice em ordem de
+# rowid a partir do da página anterior (só a coluna achado fica visível, sem
+# conflitar com as colunas de containers)
+_JUNCAO_FTS = ("(SELECT rowid AS achado FROM containers_fts WHERE containers_fts MATCH ?) "
+               "JOIN containers ON containers.rowid = achado")
+_ROWID_DO_ID = "(SELECT rowid FROM containers WHERE id = ?)"
+
+
+def _palavras(texto):
+    """Palavras em minúsculas e sem acentos, como no tokenizador do FTS5"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return re.findall(r'\w+', ''.join(c for c in texto if not unicodedata.combining(c)))
+
+
+class FiltroContainers:
+    """Critérios da barra de pesquisa da aba de containers.
+
+    ``sql()`` gera a condição WHERE, apoiada nos índices de containers e na
+    tabela FTS5 containers_fts, e ``paginacao()`` os argumentos de
+    consultar_pagina para a lista; ``aceita()`` avalia os mesmos critérios
+    sobre uma linha já em memória, para decidir se uma alteração pontual
+    deve aparecer na lista filtrada.
+    """
+
+    CAMPOS = ('texto', 'prefixo_id', 'tipo_container', 'status', 'origem',
+              'destino', 'entrada_de', 'entrada_ate')
+
+    def __init__(self, **valores):
+        for campo in self.CAMPOS:
+            valor = (valores.get(campo) or '').strip()
+            setattr(self, campo, valor)
+        # Datas chegam da interface em DD/MM/AAAA
+        self.entrada_de = data_para_iso(self.entrada_de) if self.entrada_de else ''
+        self.entrada_ate = data_para_iso(self.entrada_ate) if self.entrada_ate else ''
+
+    def sql(self, texto=True):
+        """Condição e parâmetros; sem ``texto`` a busca FTS fica de fora"""
+        condicoes, params = [], []
+        if self.prefixo_id:
+            # IDs gravados como digitados: faixa em NOCASE (idx_containers_id_nocase)
+            condicoes.append("id >= ? COLLATE NOCASE AND id < ? COLLATE NOCASE")
+            params.extend(faixa_prefixo(sem_caixa(self.prefixo_id)))
+        for campo in ('tipo_container', 'status'):
+            if getattr(self, campo):
+                condicoes.append(f"{campo} = ?")
+                params.append(getattr(self, campo))
+        for campo in ('origem', 'destino'):
+            if getattr(self, campo):
+                condicoes.append(f"{campo} = ? COLLATE NOCASE")
+                params.append(getattr(self, campo))
+        if self.entrada_de:
+            condicoes.append("data_entrada >= ?")
+            params.append(self.entrada_de)
+        if self.entrada_ate:
+            condicoes.append("data_entrada <= ?")
+            params.append(self.entrada_ate)
+        consulta = consulta_fts(self.texto) if texto else ''
+        if consulta:
+            condicoes.append("rowid IN (SELECT rowid FROM containers_fts "
+                             "WHERE containers_fts MATCH ?)")
+            params.append(consulta)
+        return ' AND '.join(condicoes), params
+
+    def paginacao(self):
+        """Argumentos de consultar_pagina (tabela, ordem e condição); apos/antes são IDs.
+
+        Sem texto nem prefixo a ordem é a do ID. Com prefixo, a do ID em
+        NOCASE desempatada pelo rowid, que os índices idx_containers_*id_nocase
+        servem junto com a faixa, sem ordenar as linhas encontradas. Com
+        texto, a ordem de cadastro (rowid): o FTS conduz a junção e cada
+        página continua do rowid da anterior, sem refazer o conjunto inteiro.
+        """
+        condicao, params = self.sql(texto=False)
+        argumentos = {'tabela': 'containers', 'filtro': condicao, 'params': params}
+        consulta = consulta_fts(self.texto)
+        if consulta:
+            argumentos.update(tabela=_JUNCAO_FTS, params_tabela=(consulta,), chave='achado',
+                              valor=_ROWID_DO_ID)
+        elif self.prefixo_id:
+            argumentos.update(chave='id COLLATE NOCASE', desempate='rowid',
+                              valor_desempate=_ROWID_DO_ID)
+        return argumentos
+
+    def ordem(self, container_id):
+        """Posição do ID na ordem de paginacao(); None na busca por texto (ordem de cadastro)"""
+        if consulta_fts(self.texto):
+            return None
+        if self.prefixo_id:
+            return sem_caixa(container_id), container_id
+        return container_id
+
+    def aceita(self, linha):
+        (container_id, tipo_container, _altura, _largura, _comprimento,
+         status, origem, destino, data_entrada) = linha[:9]
+        if self.prefixo_id and not sem_caixa(container_id).startswith(sem_caixa(self.prefixo_id)):
+            return False
+        if self.tipo_container and tipo_container != self.tipo_container:
+            return False
+        if self.status and status != self.status:
+            return False
+        if self.origem and origem.lower() != self.origem.lower():
+            return False
+        if self.destino and destino.lower() != self.destino.lower():
+            return False
+        if self.entrada_de and data_entrada < self.entrada_de:
+            return False
+        if self.entrada_ate and data_entrada > self.entrada_ate:
+            return False
+        if self.texto:
+            # Aproximação da busca FTS: cada termo é prefixo de alguma palavra
+            palavras = _palavras(f"{container_id} {origem} {destino}")
+            for termo in _palavras(self.texto):
+                if not any(palavra.startswith(termo) for palavra in palavras):
+                    return False
+        return True
+
+
+class IndiceIds:
+    """Cópia em memória, ordenada, dos IDs de containers para busca por prefixo.
+
+    Carregada uma vez e mantida pelas operações de escrita do serviço
+    (``adicionar``/``remover``), de modo que o autocompletar não consulta o
+    banco a cada tecla: cada busca são duas bisseções mais a fatia pedida.
+    A ordem e a busca ignoram maiúsculas e minúsculas, como o filtro por
+    prefixo; cada item é (sem_caixa(id), id).
+    """
+
+    def __init__(self, ids=()):
+        self._itens = sorted((sem_caixa(container_id), container_id) for container_id in ids)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def __contains__(self, container_id):
+        item = (sem_caixa(container_id), container_id)
+        with self._lock:
+            posicao = bisect_left(self._itens, item)
+            return posicao < len(self._itens) and self._itens[posicao] == item
+
+    def adicionar(self, container_id):
+        item = (sem_caixa(container_id), container_id)
+        with self._lock:
+            posicao = bisect_left(self._itens, item)
+            if posicao == len(self._itens) or self._itens[posicao] != item:
+                self._itens.insert(posicao, item)
+
+    def remover(self, container_id):
+        item = (sem_caixa(container_id), container_id)
+        with self._lock:
+            posicao = bisect_left(self._itens, item)
+            if posicao < len(self._itens) and self._itens[posicao] == item:
+                del self._itens[posicao]
+
+    def buscar(self, prefixo, limite=50):
+        """Até ``limite`` IDs que começam com ``prefixo`` (sem distinguir caixa), em ordem"""
+        prefixo = sem_caixa(prefixo.strip())
+        with self._lock:
+            if not prefixo:
+                return [container_id for _, container_id in self._itens[:limite]]
+            inicio, fim = faixa_prefixo(prefixo)
+            primeiro = bisect_left(self._itens, (inicio,))
+            ultimo = min(bisect_left(self._itens, (fim,)), primeiro + limite)
+            return [container_id for _, container_id in self._itens[primeiro:ultimo]]
@@ -0,0 +1,203 @@
+"""Importação em lote de containers a partir de manifestos CSV ou JSON."""
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import date
+from itertools import islice
+
+from eventos import CRIADO, EDITADO, MOVIMENTO, STATUS
+from validacao import CAMPOS_CONTAINER, OperacaoInvalida, STATUS_CONTAINER, validar_container
+
+TAMANHO_LOTE = 5000
+
+ResultadoImportacao = namedtuple('ResultadoImportacao', 'lidos gravados ignorados erros')
+
+_INSERIR = (f"INSERT INTO containers ({', '.join(CAMPOS_CONTAINER)}, data_entrada, cnpj) "
+            f"VALUES ({', '.join('?' * (len(CAMPOS_CONTAINER) + 2))}) "
+            "ON CONFLICT(id) DO NOTHING")
+# Só atualiza containers da mesma empresa; os de outra contam como ignorados
+_INSERIR_OU_ATUALIZAR = (_INSERIR.replace(" DO NOTHING", " DO UPDATE SET ") +
+                         ', '.join(f"{campo}=excluded.{campo}"
+                                   for campo in CAMPOS_CONTAINER[1:]) +
+                         " WHERE containers.cnpj IS excluded.cnpj")
+
+# Histórico por conjunto, como no cadastro manual: o lote gravado é comparado
+# com a cópia dos mesmos containers feita antes (importacao_anteriores).
+# ``valor`` é o índice do status, procurado em STATUS_CONTAINER passado como JSON.
+_EVENTOS_CRIADOS = """INSERT INTO eventos_container (container_id, ts, tipo, valor, detalhe, cnpj)
+                      SELECT c.id, ?, ?, (SELECT key FROM json_each(?) WHERE value = c.status),
+                             NULL, c.cnpj
+                      FROM containers c
+                      WHERE c.id IN (SELECT value FROM json_each(?))
+                        AND c.id NOT IN (SELECT id FROM importacao_anteriores)"""
+_EVENTOS_STATUS = """INSERT INTO eventos_container (container_id, ts, tipo, valor, detalhe, cnpj)
+                     SELECT c.id, ?, ?, (SELECT key FROM json_each(?) WHERE value = c.status),
+                            NULL, c.cnpj
+                     FROM importacao_anteriores a JOIN containers c ON c.id = a.id
+                     WHERE c.status IS NOT a.status"""
+_EVENTOS_MOVIMENTO = """INSERT INTO eventos_container (container_id, ts, tipo, valor, detalhe, cnpj)
+                        SELECT c.id, ?, ?, NULL, c.origem || ' → ' || c.destino, c.cnpj
+                        FROM importacao_anteriores a JOIN containers c ON c.id = a.id
+                        WHERE c.origem IS NOT a.origem OR c.destino IS NOT a.destino"""
+_EDITAVEIS = ('tipo_container', 'altura', 'largura', 'comprimento')
+# detalhe: "campo: valor" dos alterados, separados por vírgula (substr tira o primeiro ', ')
+_EVENTOS_EDITADOS = (
+    """INSERT INTO eventos_container (container_id, ts, tipo, valor, detalhe, cnpj)
+       SELECT c.id, ?, ?, NULL, substr(""" +
+    ' || '.join(f"CASE WHEN c.{campo} IS NOT a.{campo} THEN ', {campo}: ' || c.{campo} ELSE '' END"
+                for campo in _EDITAVEIS) +
+    """, 3), c.cnpj
+       FROM importacao_anteriores a JOIN containers c ON c.id = a.id
+       WHERE """ + ' OR '.join(f"c.{campo} IS NOT a.{campo}" for campo in _EDITAVEIS))
+# Para a fila de sincronização: os do lote inseridos ou alterados pela importação
+_GRAVADOS = ("""cnpj IS ? AND id IN (SELECT value FROM json_each(?))
+                 AND NOT EXISTS (SELECT 1 FROM importacao_anteriores a
+                                 WHERE a.id = containers.id AND """ +
+             ' AND '.join(f"a.{campo} IS containers.{campo}" for campo in CAMPOS_CONTAINER[1:]) +
+             ")")
+
+
+def _ler_csv(arquivo):
+    amostra = arquivo.read(4096)
+    arquivo.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(arquivo, dialect=dialeto)
+    for registro in leitor:
+        yield leitor.line_num, registro
+
+
+def _ler_json_linhas(arquivo):
+    for numero, linha in enumerate(arquivo, start=1):
+        if not linha.strip():
+            continue
+        try:
+            yield numero, json.loads(linha)
+        except ValueError:
+            # Reportado como erro da linha, sem interromper a importação
+            yield numero, None
+
+
+def _ler_json_array(arquivo, tamanho_bloco=65536):
+    """Lê um array JSON de objetos sem carregar o arquivo inteiro"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    posicao = 0
+    numero = 0
+    dentro = False
+    fim_arquivo = False
+
+    while True:
+        # Pular espaços, vírgulas e o colchete de abertura
+        while posicao < len(buffer) and buffer[posicao] in ' \t\r\n,[':
+            if buffer[posicao] == '[':
+                dentro = True
+            posicao += 1
+        if posicao < len(buffer) and buffer[posicao] == ']' and dentro:
+            return
+
+        try:
+            if posicao >= len(buffer):
+                raise ValueError
+            objeto, fim = decoder.raw_decode(buffer, posicao)
+        except ValueError:
+            if fim_arquivo:
+                if buffer[posicao:].strip():
+                    raise ValueError("Manifesto JSON malformado")
+                return
+            bloco = arquivo.read(tamanho_bloco)
+            fim_arquivo = not bloco
+            buffer = buffer[posicao:] + bloco
+            posicao = 0
+            continue
+
+        numero += 1
+        posicao = fim
+        yield numero, objeto
+
+
+def ler_manifesto(caminho):
+    """Gera (número da linha/registro, dicionário) para cada item do manifesto.
+
+    O formato é deduzido da extensão: .csv, .jsonl/.ndjson (um objeto por
+    linha) ou .json (array de objetos). Os registros são lidos sob demanda.
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
+    with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+        if extensao == '.csv':
+            yield from _ler_csv(arquivo)
+        elif extensao in ('.jsonl', '.ndjson'):
+            yield from _ler_json_linhas(arquivo)
+        elif extensao == '.json':
+            yield from _ler_json_array(arquivo)
+        else:
+            raise OperacaoInvalida(f"Formato de manifesto não suportado: {extensao}")
+
+
+def importar_manifesto(db, caminho, atualizar=False, tamanho_lote=TAMANHO_LOTE, cnpj=None,
+                       fila=None):
+    """Importa um manifesto para a tabela containers em uma única transação.
+
+    Cada registro passa pelas mesmas regras do cadastro manual; os inválidos
+    são reportados em ``erros`` como (linha, mensagem) e não impedem a
+    importação dos demais. Containers já existentes são ignorados, ou
+    atualizados quando ``atualizar`` é verdadeiro. Os novos pertencem à
+    empresa ``cnpj``. O histórico recebe o cadastro dos novos e, na
+    atualização, as mudanças de status, origem/destino e dados, como no
+    cadastro manual. Com ``fila`` (sincronizacao.fila_do_banco) os gravados
+    são registrados para sincronização.
+    """
+    sql = _INSERIR_OU_ATUALIZAR if atualizar else _INSERIR
+    data_entrada = date.today().isoformat()
+    erros = []
+    lidos = 0
+    validos = 0
+
+    def linhas_validas(registros):
+        nonlocal lidos, validos
+        for numero, registro in registros:
+            lidos += 1
+            try:
+                if not isinstance(registro, dict):
+                    raise OperacaoInvalida("Registro inválido: esperado um objeto JSON")
+                linha = validar_container(registro, data_entrada)
+            except OperacaoInvalida as e:
+                erros.append((numero, str(e)))
+                continue
+            validos += 1
+            yield linha + (cnpj,)
+
+    linhas = linhas_validas(ler_manifesto(caminho))
+    gravados = 0
+    ts = int(time.time())
+    status = json.dumps(STATUS_CONTAINER, ensure_ascii=False)
+    with db.transacao():
+        db.executar(f"""CREATE TEMP TABLE IF NOT EXISTS importacao_anteriores
+                        ({', '.join(('id TEXT PRIMARY KEY',) + CAMPOS_CONTAINER[1:])}) WITHOUT ROWID""")
+        try:
+            while True:
+                lote = list(islice(linhas, tamanho_lote))
+                if not lote:
+                    break
+                ids = json.dumps([linha[0] for linha in lote])
+                db.executar(f"""INSERT OR IGNORE INTO importacao_anteriores
+                                SELECT {', '.join(CAMPOS_CONTAINER)} FROM containers
+                                WHERE id IN (SELECT value FROM json_each(?))""", (ids,))
+                # rowcount não inclui as linhas alteradas pelos triggers (FTS e resumos)
+                gravados += db.executar_muitos(sql, lote).rowcount
+                db.executar(_EVENTOS_CRIADOS, (ts, CRIADO, status, ids))
+                if atualizar:
+                    db.executar(_EVENTOS_STATUS, (ts, STATUS, status))
+                    db.executar(_EVENTOS_MOVIMENTO, (ts, MOVIMENTO))
+                    db.executar(_EVENTOS_EDITADOS, (ts, EDITADO))
+                if fila is not None:
+                    fila.registrar_containers(_GRAVADOS, (cnpj, ids))
+                db.executar("DELETE FROM importacao_anteriores")
+        finally:
+            db.executar("DELETE FROM importacao_anteriores")
+
+    return ResultadoImportacao(lidos, gravados, validos - gravados, erros)
@@ -0,0 +1,156 @@
+"""Métricas de latência dos caminhos críticos (handlers, tarefas e SQL).
+
+Cada medição cai em um histograma de faixas fixas em escala logarítmica, então
+registrar custa uma busca binária e algumas somas, sem guardar as amostras.
+Os percentis são estimados pelo limite superior da faixa. Comandos SQL acima
+de ``limite_lento_ms`` vão para o log 'containererp.sql_lento' junto com o
+EXPLAIN QUERY PLAN.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Limites superiores das faixas em ms (a última faixa vai até o infinito)
+FAIXAS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+             1000, 2500, 5000, 10000)
+
+log_sql_lento = logging.getLogger('containererp.sql_lento')
+
+
+class Histograma:
+    __slots__ = ('contagens', 'total', 'soma_ms', 'maximo_ms', 'linhas')
+
+    def __init__(self):
+        self.contagens = [0] * (len(FAIXAS_MS) + 1)
+        self.total = 0
+        self.soma_ms = 0.0
+        self.maximo_ms = 0.0
+        self.linhas = 0
+
+    def registrar(self, ms, linhas=None):
+        self.contagens[bisect_left(FAIXAS_MS, ms)] += 1
+        self.total += 1
+        self.soma_ms += ms
+        if ms > self.maximo_ms:
+            self.maximo_ms = ms
+        if linhas is not None and linhas > 0:
+            self.linhas += linhas
+
+    def percentil(self, fracao):
+        """Limite superior da faixa que contém o percentil (o máximo na última)"""
+        alvo = fracao * self.total
+        acumulado = 0
+        for indice, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if contagem and acumulado >= alvo:
+                return FAIXAS_MS[indice] if indice < len(FAIXAS_MS) else self.maximo_ms
+        return 0.0
+
+    def resumo(self):
+        return {
+            'total': self.total,
+            'media_ms': round(self.soma_ms / self.total, 3) if self.total else 0.0,
+            'p50_ms': self.percentil(0.5),
+            'p95_ms': self.percentil(0.95),
+            'p99_ms': self.percentil(0.99),
+            'maximo_ms': round(self.maximo_ms, 3),
+            'linhas': self.linhas,
+        }
+
+
+def normalizar_sql(sql):
+    """Texto do comando em uma linha, usado como nome da métrica"""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class Metricas:
+    """Histogramas por (categoria, nome), seguros para várias threads.
+
+    Categorias usadas: 'handler' (ações da interface e rotas da API), 'tarefa',
+    'interface' e 'resposta' (ver tarefas.ExecutorTarefas) e 'sql'.
+    """
+
+    def __init__(self, limite_lento_ms=100.0):
+        self.limite_lento_ms = limite_lento_ms
+        self._histogramas = {}
+        self._nomes_sql = {}
+        self._lock = threading.Lock()
+        self._inicio = time.time()
+
+    def registrar(self, categoria, nome, ms, linhas=None):
+        chave = (categoria, nome)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma()
+            histograma.registrar(ms, linhas)
+
+    @contextmanager
+    def medir(self, categoria, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(categoria, nome, (time.perf_counter() - inicio) * 1000)
+
+    def instrumentar(self, funcao, categoria='handler', nome=None):
+        """Envolve ``funcao`` registrando a duração de cada chamada"""
+        nome = nome or funcao.__name__
+
+        @wraps(funcao)
+        def instrumentada(*args, **kwargs):
+            with self.medir(categoria, nome):
+                return funcao(*args, **kwargs)
+        return instrumentada
+
+    def sql_executado(self, conn, sql, params, ms, linhas=None):
+        """Registra o comando e, se passou do limite, grava no log com o plano.
+
+        ``params`` None indica executemany sem uma amostra dos parâmetros.
+        """
+        nome = self._nomes_sql.get(sql)
+        if nome is None:
+            if len(self._nomes_sql) > 2000:  # SQL montado dinamicamente demais
+                self._nomes_sql.clear()
+            nome = self._nomes_sql[sql] = normalizar_sql(sql)
+        self.registrar('sql', nome, ms, linhas)
+        if self.limite_lento_ms is None or ms < self.limite_lento_ms:
+            return
+        if params is None:
+            plano = "  (plano indisponível: parâmetros em lote)"
+        else:
+            try:
+                plano = '\n'.join(f"  {linha[-1]}" for linha in
+                                  conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+            except sqlite3.Error as e:  # comandos sem plano, como PRAGMA
+                plano = f"  (plano indisponível: {e})"
+        log_sql_lento.warning("%.1f ms: %s\n%s", ms, nome, plano)
+
+    def resumo(self):
+        """Lista de dicts (categoria, nome e estatísticas), maior tempo acumulado primeiro"""
+        with self._lock:
+            itens = [dict(categoria=categoria, nome=nome, **histograma.resumo())
+                     for (categoria, nome), histograma in self._histogramas.items()]
+        itens.sort(key=lambda item: (item['categoria'], -item['media_ms'] * item['total']))
+        return itens
+
+    def salvar(self, caminho):
+        """Grava o resumo em JSON e retorna quantas métricas foram escritas"""
+        itens = self.resumo()
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({'inicio': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._inicio)),
+                       'fim': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'faixas_ms': FAIXAS_MS, 'metricas': itens},
+                      arquivo, ensure_ascii=False, indent=1)
+        return len(itens)
+
+    def zerar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self._inicio = time.time()
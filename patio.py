@@ -0,0 +1,203 @@
+"""Modelo do pátio (blocos, baias, fileiras e níveis) e alocação de containers.
+
+O planejamento usa a heurística first-fit decreasing: os containers são
+ordenados do mais restritivo para o menos (reefers primeiro, depois por
+comprimento, altura e largura decrescentes) e cada um vai para a primeira
+pilha compatível, na ordem bloco/baia/fileira. Pilhas abertas e posições de
+chão livres ficam em heaps indexados por energização e por classe de
+comprimento (pilhas) ou bloco (chão), então só se percorrem as pilhas da
+mesma classe: abrir uma pilha custa O(log n) e empilhar O((k + 1) log n),
+sendo k as pilhas abertas à frente da escolhida em que o container não cabe
+(altura livre ou comprimento da base). Com o pátio quase cheio k cresce e o
+pior caso se aproxima de O(n log n) por container.
+"""
+import heapq
+import time
+from collections import defaultdict, namedtuple
+
+from eventos import ALOCADO, evento, gravar_eventos
+
+Bloco = namedtuple('Bloco', 'nome baias fileiras niveis fileiras_energizadas '
+                            'comprimento_max largura_max altura_max')
+Bloco.__doc__ = """Bloco do pátio; as primeiras ``fileiras_energizadas`` de cada baia
+têm tomadas para reefers e ``altura_max`` limita a altura total da pilha."""
+
+ContainerPatio = namedtuple('ContainerPatio', 'id tipo_container altura largura comprimento cnpj',
+                            defaults=(None,))
+Alocacao = namedtuple('Alocacao', 'container_id bloco baia fileira nivel')
+Plano = namedtuple('Plano', 'alocacoes nao_alocados utilizacao')
+
+
+def classe_comprimento(comprimento):
+    """Classe de comprimento (20, 40 ou 45 pés); só se empilha a mesma classe"""
+    if comprimento <= 6.1:
+        return 20
+    if comprimento <= 12.2:
+        return 40
+    return 45
+
+
+class _Pilha:
+    __slots__ = ('ordem', 'bloco', 'baia', 'fileira', 'comprimento_base',
+                 'niveis_livres', 'altura_livre', 'proximo_nivel')
+
+    def __init__(self, ordem, bloco, baia, fileira, comprimento_base):
+        self.ordem = ordem
+        self.bloco = bloco
+        self.baia = baia
+        self.fileira = fileira
+        self.comprimento_base = comprimento_base
+        self.niveis_livres = bloco.niveis
+        self.altura_livre = bloco.altura_max
+        self.proximo_nivel = 1
+
+    def comporta(self, container):
+        return (self.niveis_livres > 0 and
+                container.altura <= self.altura_livre and
+                container.comprimento <= self.comprimento_base and
+                container.largura <= self.bloco.largura_max)
+
+    def empilhar(self, container):
+        alocacao = Alocacao(container.id, self.bloco.nome, self.baia, self.fileira,
+                            self.proximo_nivel)
+        self.niveis_livres -= 1
+        self.altura_livre -= container.altura
+        self.proximo_nivel += 1
+        return alocacao
+
+
+class PlanejadorPatio:
+    """Aloca containers em pilhas do pátio por first-fit decreasing"""
+
+    def __init__(self, blocos):
+        self.blocos = list(blocos)
+        # Posições de chão livres por (energizada, bloco), em heaps ordenados
+        # por baia/fileira; percorrer os blocos em ordem e pegar o topo do
+        # primeiro heap compatível dá a primeira posição livre do pátio
+        self._chao = {}
+        for indice, bloco in enumerate(self.blocos):
+            for energizada in (True, False):
+                fileiras = (range(1, bloco.fileiras_energizadas + 1) if energizada else
+                            range(bloco.fileiras_energizadas + 1, bloco.fileiras + 1))
+                self._chao[(energizada, indice)] = [(baia, fileira)
+                                                    for baia in range(1, bloco.baias + 1)
+                                                    for fileira in fileiras]
+        # Pilhas iniciadas com espaço livre: (energizada, classe) -> heap
+        self._abertas = defaultdict(list)
+
+    def _empilhar_em_aberta(self, heap, container):
+        """Empilha na primeira pilha aberta do heap em que o container cabe.
+
+        As que não comportam saem do heap durante a busca e voltam no fim:
+        O(log n) por pilha examinada, não só pela escolhida.
+        """
+        descartadas = []
+        try:
+            while heap:
+                _, pilha = heap[0]
+                if pilha.comporta(container):
+                    alocacao = pilha.empilhar(container)
+                    if pilha.niveis_livres == 0:
+                        heapq.heappop(heap)
+                    return alocacao
+                entrada = heapq.heappop(heap)
+                if pilha.niveis_livres > 0:
+                    descartadas.append(entrada)
+            return None
+        finally:
+            for entrada in descartadas:
+                heapq.heappush(heap, entrada)
+
+    def _abrir_pilha(self, energizada, container):
+        for indice, bloco in enumerate(self.blocos):
+            livres = self._chao[(energizada, indice)]
+            if (not livres or container.comprimento > bloco.comprimento_max or
+                    container.largura > bloco.largura_max or
+                    container.altura > bloco.altura_max):
+                continue
+            baia, fileira = heapq.heappop(livres)
+            ordem = (indice, baia, fileira)
+            pilha = _Pilha(ordem, bloco, baia, fileira, container.comprimento)
+            alocacao = pilha.empilhar(container)
+            if pilha.niveis_livres > 0:
+                chave = (energizada, classe_comprimento(container.comprimento))
+                heapq.heappush(self._abertas[chave], (ordem, pilha))
+            return alocacao
+        return None
+
+    def alocar(self, container):
+        """Aloca um container e retorna a Alocacao, ou None se não houver espaço"""
+        reefer = container.tipo_container == 'Reefer'
+        classe = classe_comprimento(container.comprimento)
+        # Reefers só em posições energizadas; os demais as usam apenas se não
+        # houver outra opção, deixando as tomadas livres para reefers
+        for energizada in ((True,) if reefer else (False, True)):
+            alocacao = (self._empilhar_em_aberta(self._abertas[(energizada, classe)], container) or
+                        self._abrir_pilha(energizada, container))
+            if alocacao:
+                return alocacao
+        return None
+
+    def planejar(self, containers):
+        ordenados = sorted(containers, key=lambda c: (c.tipo_container != 'Reefer',
+                                                      -c.comprimento, -c.altura,
+                                                      -c.largura, c.id))
+        alocacoes, nao_alocados = [], []
+        for container in ordenados:
+            alocacao = self.alocar(container)
+            if alocacao:
+                alocacoes.append(alocacao)
+            else:
+                nao_alocados.append(container.id)
+        return Plano(alocacoes, nao_alocados, utilizacao(self.blocos, alocacoes))
+
+
+def utilizacao(blocos, alocacoes):
+    """Ocupação por bloco e total: {nome: (ocupados, capacidade, percentual)}"""
+    ocupados = defaultdict(int)
+    for alocacao in alocacoes:
+        ocupados[alocacao.bloco] += 1
+
+    resultado = {}
+    for bloco in blocos:
+        capacidade = bloco.baias * bloco.fileiras * bloco.niveis
+        resultado[bloco.nome] = (ocupados[bloco.nome], capacidade,
+                                 100.0 * ocupados[bloco.nome] / capacidade if capacidade else 0.0)
+    total_ocupados = sum(ocupados.values())
+    total_capacidade = sum(capacidade for _, capacidade, _ in resultado.values())
+    resultado['total'] = (total_ocupados, total_capacidade,
+                          100.0 * total_ocupados / total_capacidade if total_capacidade else 0.0)
+    return resultado
+
+
+# Persistência
+
+def carregar_blocos(db):
+    return [Bloco(*linha) for linha in db.consultar(
+        f"SELECT {', '.join(Bloco._fields)} FROM patio_blocos ORDER BY nome")]
+
+
+def salvar_bloco(db, bloco):
+    db.executar(f"INSERT OR REPLACE INTO patio_blocos ({', '.join(Bloco._fields)}) "
+                f"VALUES ({', '.join('?' * len(Bloco._fields))})", bloco)
+
+
+def replanejar_patio(db):
+    """Recalcula a alocação de todos os containers e grava em alocacoes"""
+    blocos = carregar_blocos(db)
+    # O pátio é do terminal: o plano considera os containers de todas as empresas
+    containers = {linha[0]: ContainerPatio(*linha) for linha in db.iterar(
+        "SELECT id, tipo_container, altura, largura, comprimento, cnpj FROM containers")}
+    plano = PlanejadorPatio(blocos).planejar(containers.values())
+
+    with db.transacao():
+        anteriores = {linha[0]: linha[1:] for linha in db.iterar("SELECT * FROM alocacoes")}
+        db.executar("DELETE FROM alocacoes")
+        db.executar_muitos("INSERT INTO alocacoes VALUES (?, ?, ?, ?, ?)", plano.alocacoes)
+        # Histórico apenas dos containers que mudaram de posição
+        agora = int(time.time())
+        gravar_eventos(db, (evento(a.container_id, ALOCADO, ts=agora,
+                                   detalhe=f"{a.bloco}/{a.baia}/{a.fileira}/{a.nivel}",
+                                   cnpj=containers[a.container_id].cnpj)
+                            for a in plano.alocacoes if anteriores.get(a.container_id) != a[1:]))
+    return plano
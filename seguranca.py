@@ -0,0 +1,113 @@
+"""Hash de senhas com KDF de custo configurável e cache de sessões em memória."""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+# Custo do scrypt (N deve ser potência de 2; r e p seguem a recomendação usual).
+# Pode ser ajustado ao hardware pelas variáveis de ambiente; hashes antigos
+# são refeitos com o custo novo no próximo login.
+SCRYPT_N = int(os.environ.get('CONTAINERERP_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('CONTAINERERP_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('CONTAINERERP_SCRYPT_P', 1))
+# Usado apenas quando o OpenSSL do Python não oferece scrypt
+PBKDF2_ITERACOES = int(os.environ.get('CONTAINERERP_PBKDF2_ITERACOES', 600000))
+
+SESSAO_TTL = int(os.environ.get('CONTAINERERP_SESSAO_TTL', 8 * 3600))
+
+TEM_SCRYPT = hasattr(hashlib, 'scrypt')
+
+
+def _b64(dados):
+    return base64.b64encode(dados).decode('ascii')
+
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(senha.encode('utf-8'), salt=sal, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+def _pbkdf2(senha, sal, iteracoes):
+    return hashlib.pbkdf2_hmac('sha256', senha.encode('utf-8'), sal, iteracoes)
+
+
+def gerar_hash(senha):
+    """Retorna 'algoritmo$parâmetros$sal$hash', pronto para a coluna senha"""
+    sal = os.urandom(16)
+    if TEM_SCRYPT:
+        chave = _scrypt(senha, sal, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(chave)}"
+    chave = _pbkdf2(senha, sal, PBKDF2_ITERACOES)
+    return f"pbkdf2_sha256${PBKDF2_ITERACOES}${_b64(sal)}${_b64(chave)}"
+
+
+def verificar_senha(senha, armazenado):
+    """Compara a senha com o valor armazenado (hash ou texto puro legado)"""
+    if not armazenado:
+        return False
+    partes = armazenado.split('$')
+    if partes[0] == 'scrypt' and len(partes) == 6:
+        n, r, p = (int(valor) for valor in partes[1:4])
+        calculado = _scrypt(senha, base64.b64decode(partes[4]), n, r, p)
+        return hmac.compare_digest(calculado, base64.b64decode(partes[5]))
+    if partes[0] == 'pbkdf2_sha256' and len(partes) == 4:
+        calculado = _pbkdf2(senha, base64.b64decode(partes[2]), int(partes[1]))
+        return hmac.compare_digest(calculado, base64.b64decode(partes[3]))
+    # Senha legada gravada em texto puro
+    return hmac.compare_digest(senha.encode('utf-8'), armazenado.encode('utf-8'))
+
+
+def precisa_rehash(armazenado):
+    """Verdadeiro para senhas legadas ou com custo diferente do configurado"""
+    if TEM_SCRYPT:
+        return not armazenado.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not armazenado.startswith(f"pbkdf2_sha256${PBKDF2_ITERACOES}$")
+
+
+class CacheSessoes:
+    """Tokens de sessão em memória, com expiração.
+
+    Depois do login (que paga o custo do KDF uma única vez) as requisições
+    se identificam pelo token, validado com uma consulta a um dicionário.
+    """
+
+    def __init__(self, ttl=SESSAO_TTL, maximo=10000):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._sessoes = {}          # token -> (usuario, expira_em)
+        self._lock = threading.Lock()
+
+    def criar(self, usuario):
+        token = secrets.token_urlsafe(32)
+        expira_em = time.time() + self.ttl
+        with self._lock:
+            if len(self._sessoes) >= self.maximo:
+                self._remover_expiradas()
+            if len(self._sessoes) >= self.maximo:
+                # Cache cheio: descartar a sessão mais antiga
+                del self._sessoes[next(iter(self._sessoes))]
+            self._sessoes[token] = (usuario, expira_em)
+        return token, expira_em
+
+    def validar(self, token):
+        """Retorna o usuário da sessão ou None se o token for inválido/expirado"""
+        with self._lock:
+            sessao = self._sessoes.get(token)
+            if sessao is None:
+                return None
+            if sessao[1] < time.time():
+                del self._sessoes[token]
+                return None
+            return sessao[0]
+
+    def revogar(self, token):
+        with self._lock:
+            self._sessoes.pop(token, None)
+
+    def _remover_expiradas(self):
+        agora = time.time()
+        for token in [t for t, (_, expira) in self._sessoes.items() if expira < agora]:
+            del self._sessoes[token]
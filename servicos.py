@@ -0,0 +1,775 @@
+"""Regras de negócio de containers e agendamentos, sem dependência de interface.
+
+Usado pela interface Tk, pela API HTTP e pelas rotinas de linha de comando.
+As operações de escrita retornam a lista de Alteracao produzida, para que
+quem chamou atualize suas visualizações sem recarregar as tabelas.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from agenda import CalendarioAgendamentos
+from arquivamento import consultar_arquivo
+from database import Alteracao, ATUALIZAR, Database, INSERIR, REMOVER
+from eventos import (AGENDADO, AGENDAMENTO_CANCELADO, CRIADO, EDITADO, MOVIMENTO,
+                     OPERACAO_CONCLUIDA, REMOVIDO, STATUS, consultar_eventos, evento,
+                     gravar_eventos)
+from exportacao import COLUNAS
+from filtros import FiltroContainers, IndiceIds
+from seguranca import CacheSessoes, gerar_hash, precisa_rehash, verificar_senha
+from validacao import (CAMPOS_CONTAINER, OperacaoInvalida, TIPOS_OPERACAO, ler_data,
+                       validar_cnpj, validar_container)
+
+
+# Limite de ocorrências geradas por uma regra recorrente (containers x datas)
+MAXIMO_OCORRENCIAS = 500000
+
+ResultadoRecorrencia = namedtuple('ResultadoRecorrencia', 'ocorrencias criados conflitos sem_vaga')
+
+# Operação da fila de sincronização para a baixa de agendamento (as demais
+# são as mesmas de Alteracao)
+CONCLUIR = 'concluir'
+
+
+class NaoEncontrado(OperacaoInvalida):
+    """O registro pedido não existe"""
+
+
+class Conflito(OperacaoInvalida):
+    """A operação conflita com dados já existentes"""
+
+
+class PossuiAgendamentos(Conflito):
+    """O container tem agendamentos e a remoção não foi confirmada em cascata"""
+
+
+class NaoAutenticado(OperacaoInvalida):
+    """Token de sessão ausente, inválido ou expirado"""
+
+
+class ServicoContainers:
+    """Operações sobre os dados de uma empresa.
+
+    Com ``cnpj`` o serviço só enxerga e grava os containers, agendamentos e
+    eventos daquela empresa, e as consultas usam os índices que começam por
+    cnpj. Sem ``cnpj`` (linha de comando, administração) vê o terminal todo.
+
+    Com ``fila`` (sincronizacao.fila_do_banco) cada alteração também é
+    registrada, na mesma transação: no terminal, para envio ao banco central;
+    no central, para distribuição aos terminais.
+    """
+
+    def __init__(self, db, sessoes=None, calendario=None, cnpj=None, fila=None):
+        self.db = db
+        self.sessoes = sessoes or CacheSessoes()
+        self.cnpj = cnpj
+        self.fila = fila
+        self._calendario = calendario
+        self._ids = None
+        # Índice de IDs (ver indice_ids): o anterior responde enquanto o novo
+        # carrega, e as escritas durante a carga são reaplicadas nele
+        self._ids_anterior = None
+        self._escritas_ids = None
+        self._geracao_ids = 0
+        self._central = None
+        self._lock_caches = threading.Lock()
+        self._lock_carga_ids = threading.Lock()
+
+    def _derivado(self, cnpj, fila):
+        servico = ServicoContainers(self.db, self.sessoes, cnpj=cnpj, fila=fila)
+        servico._central = self._central or self
+        return servico
+
+    def da_empresa(self, cnpj):
+        """Serviço restrito a ``cnpj`` no mesmo banco, com as mesmas sessões.
+
+        O calendário continua sendo o deste serviço: a capacidade das
+        operações é do terminal, somando os agendamentos de todas as empresas.
+        """
+        return self._derivado(cnpj, self.fila)
+
+    def sem_fila(self):
+        """O mesmo serviço sem registrar na fila (para aplicar alterações recebidas)"""
+        return self._derivado(self.cnpj, None)
+
+    def _enfileirar(self, mudancas):
+        """Registra (tabela, operacao, chave, dados) na fila de sincronização, se houver"""
+        if self.fila is not None:
+            self.fila.registrar(self.cnpj, mudancas)
+
+    @staticmethod
+    def _mudanca_agendamento(operacao, container_id, data, tipo_operacao):
+        # Na sincronização o agendamento é identificado por container e data,
+        # pois cada banco numera os seus
+        return ('agendamentos', operacao, f"{container_id}|{data}",
+                {'container_id': container_id, 'data_agendamento': data,
+                 'tipo_operacao': tipo_operacao})
+
+    def _escopo(self, condicao='', params=(), coluna='cnpj'):
+        """Acrescenta à condição SQL o filtro da empresa do serviço, se houver"""
+        params = list(params)
+        if self.cnpj is None:
+            return condicao, params
+        condicoes = [f"{coluna} = ?"] + ([f"({condicao})"] if condicao else [])
+        return ' AND '.join(condicoes), [self.cnpj] + params
+
+    @property
+    def calendario(self):
+        """Calendário de agendamentos, carregado do banco no primeiro uso"""
+        if self._central is not None:
+            return self._central.calendario
+        if self._calendario is None:
+            with self._lock_caches:
+                if self._calendario is None:
+                    self._calendario = CalendarioAgendamentos.carregar(self.db)
+        return self._calendario
+
+    @property
+    def ids_containers(self):
+        """Índice ordenado dos IDs de containers, carregado no primeiro uso"""
+        return self.indice_ids()
+
+    def indice_ids(self, esperar=True):
+        """O índice de IDs; sem ``esperar`` não consulta o banco nem aguarda a carga.
+
+        Sem esperar (na thread da interface) devolve o índice carregado ou,
+        enquanto outra thread o recarrega após invalidar_ids(), o anterior;
+        None se nunca foi carregado. A carga roda sem _lock_caches: as
+        escritas feitas durante ela são reaplicadas no índice novo.
+        """
+        while True:
+            indice = self._ids
+            if indice is not None:
+                return indice
+            if not esperar:
+                return self._ids_anterior
+            with self._lock_carga_ids:
+                if self._ids is not None:
+                    continue
+                with self._lock_caches:
+                    geracao = self._geracao_ids
+                    self._escritas_ids = []
+                condicao, params = self._escopo()
+                where = f"WHERE {condicao}" if condicao else ''
+                indice = IndiceIds(linha[0] for linha in self.db.iterar(
+                    f"SELECT id FROM containers {where} ORDER BY id", params,
+                    tamanho_lote=10000))
+                with self._lock_caches:
+                    escritas, self._escritas_ids = self._escritas_ids, None
+                    if geracao == self._geracao_ids:
+                        # Adicionar/remover são idempotentes: reaplicar na ordem
+                        for operacao, container_id in escritas:
+                            operacao(indice, container_id)
+                        self._ids, self._ids_anterior = indice, None
+
+    def _atualizar_ids(self, operacao, container_id):
+        with self._lock_caches:
+            for indice in (self._ids, self._ids_anterior):
+                if indice is not None:
+                    operacao(indice, container_id)
+            if self._escritas_ids is not None:
+                self._escritas_ids.append((operacao, container_id))
+
+    def _descartar_ids(self):
+        # Chamado com _lock_caches
+        if self._ids is not None:
+            self._ids_anterior = self._ids
+        self._ids = None
+        self._geracao_ids += 1
+
+    def invalidar_ids(self):
+        """Descarta só o índice de IDs, para recarregá-lo na próxima consulta.
+
+        Não espera uma carga em andamento: ela é descartada e o índice atual
+        fica como anterior até a próxima carga.
+        """
+        with self._lock_caches:
+            self._descartar_ids()
+        if self._central is not None:
+            self._central.invalidar_ids()
+
+    def invalidar_caches(self):
+        """Descarta os caches após escritas feitas fora do serviço (ex.: importação).
+
+        O calendário é recriado do banco: chame fora de uma escrita em
+        andamento (na interface, pela thread de escrita ou após ela), senão
+        as reservas da transação se perdem.
+        """
+        with self._lock_caches:
+            self._calendario = None
+            self._descartar_ids()
+        if self._central is not None:
+            self._central.invalidar_caches()
+
+    # Usuários
+
+    def autenticar(self, cnpj, senha):
+        """Retorna (razao_social, cnpj) do usuário ou lança NaoAutenticado.
+
+        Senhas legadas em texto puro, ou com custo de KDF diferente do
+        configurado, são regravadas com o hash atual após a verificação.
+        """
+        usuario = self.db.consultar_um(
+            "SELECT razao_social, cnpj, senha FROM usuarios WHERE cnpj=?", (cnpj,))
+        if not usuario or not verificar_senha(senha, usuario[2]):
+            raise NaoAutenticado("Credenciais inválidas")
+
+        if precisa_rehash(usuario[2]):
+            self.db.executar("UPDATE usuarios SET senha=? WHERE cnpj=? AND senha=?",
+                             (gerar_hash(senha), cnpj, usuario[2]))
+        return usuario[:2]
+
+    def iniciar_sessao(self, cnpj, senha):
+        """Autentica e retorna (token, expira_em) para as próximas requisições"""
+        return self.sessoes.criar(self.autenticar(cnpj, senha))
+
+    def usuario_da_sessao(self, token):
+        """Retorna (razao_social, cnpj) do dono do token sem recalcular o hash"""
+        usuario = self.sessoes.validar(token) if token else None
+        if usuario is None:
+            raise NaoAutenticado("Sessão inválida ou expirada")
+        return usuario
+
+    def encerrar_sessao(self, token):
+        self.sessoes.revogar(token)
+
+    def cadastrar_usuario(self, razao_social, cnpj, senha):
+        if not all([razao_social, cnpj, senha]):
+            raise OperacaoInvalida("Todos os campos são obrigatórios")
+        validar_cnpj(cnpj)
+
+        # O KDF é calculado fora da transação para não segurar o lock de escrita
+        senha_hash = gerar_hash(senha)
+        with self.db.transacao():
+            # Verificar se CNPJ já existe
+            if self.db.consultar_um("SELECT 1 FROM usuarios WHERE cnpj=?", (cnpj,)):
+                raise Conflito("CNPJ já cadastrado")
+
+            self.db.executar("INSERT INTO usuarios VALUES (?, ?, ?)",
+                             (razao_social, cnpj, senha_hash))
+
+    # Containers
+
+    def listar_containers(self, filtro=None, apos=None, antes=None, limite=200):
+        """Página de containers na ordem do filtro (paginação keyset; ver paginacao())"""
+        pagina = (filtro or FiltroContainers()).paginacao()
+        pagina['filtro'], pagina['params'] = self._escopo(pagina['filtro'], pagina['params'])
+        return self.db.consultar_pagina(pagina.pop('tabela'), apos=apos, antes=antes,
+                                        limite=limite, colunas=', '.join(COLUNAS['containers']),
+                                        **pagina)
+
+    def buscar_ids(self, prefixo, limite=50, esperar=True):
+        """IDs que começam com ``prefixo``, para autocompletar.
+
+        Sem ``esperar`` usa indice_ids(esperar=False): vazio se o índice
+        ainda não foi carregado.
+        """
+        indice = self.indice_ids(esperar)
+        return indice.buscar(prefixo, limite) if indice is not None else []
+
+    def obter_container(self, container_id):
+        condicao, params = self._escopo('id = ?', (container_id,))
+        container = self.db.consultar_um(
+            f"SELECT {', '.join(COLUNAS['containers'])} FROM containers WHERE {condicao}", params)
+        if not container:
+            raise NaoEncontrado("Container não encontrado")
+        return container
+
+    def adicionar_container(self, valores, data_entrada=None):
+        """Valida e cadastra um container (``valores`` indexado por CAMPOS_CONTAINER).
+
+        Sem ``data_entrada`` (ISO) a entrada é registrada com a data de hoje.
+        """
+        linha = validar_container(valores, data_entrada)
+
+        with self.db.transacao():
+            # Verificar se ID já existe (em qualquer empresa: o ID é do container físico)
+            if self.db.consultar_um("SELECT 1 FROM containers WHERE id=?", (linha[0],)):
+                raise Conflito("Container ID já existe")
+
+            self.db.executar(f"INSERT INTO containers ({', '.join(COLUNAS['containers'])}, cnpj) "
+                             f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", linha + (self.cnpj,))
+            gravar_eventos(self.db, [evento(linha[0], CRIADO, linha[5], cnpj=self.cnpj)])
+            self._enfileirar([('containers', INSERIR, linha[0],
+                               dict(zip(COLUNAS['containers'], linha)))])
+
+        self._atualizar_ids(IndiceIds.adicionar, linha[0])
+        return [Alteracao('containers', INSERIR, linha[0], linha)]
+
+    def atualizar_container(self, container_id, valores):
+        """Altera os dados do container (o ID e a data de entrada não mudam).
+
+        Cada diferença vira um evento no histórico: status, origem/destino
+        e demais dados (tipo e dimensões).
+        """
+        with self.db.transacao():
+            anterior = self.obter_container(container_id)
+            linha = validar_container(dict(valores, id=container_id), anterior[-1])
+
+            self.db.executar("""UPDATE containers SET tipo_container=?, altura=?, largura=?,
+                                       comprimento=?, status=?, origem=?, destino=?
+                                WHERE id=?""", linha[1:8] + (container_id,))
+
+            antes, depois = dict(zip(CAMPOS_CONTAINER, anterior)), dict(zip(CAMPOS_CONTAINER, linha))
+            eventos = []
+            if antes['status'] != depois['status']:
+                eventos.append(evento(container_id, STATUS, depois['status'], cnpj=self.cnpj))
+            if (antes['origem'], antes['destino']) != (depois['origem'], depois['destino']):
+                eventos.append(evento(container_id, MOVIMENTO, cnpj=self.cnpj,
+                                      detalhe=f"{depois['origem']} → {depois['destino']}"))
+            alterados = [campo for campo in ('tipo_container', 'altura', 'largura', 'comprimento')
+                         if antes[campo] != depois[campo]]
+            if alterados:
+                eventos.append(evento(container_id, EDITADO, cnpj=self.cnpj, detalhe=', '.join(
+                    f"{campo}: {depois[campo]}" for campo in alterados)))
+            gravar_eventos(self.db, eventos)
+            self._enfileirar([('containers', ATUALIZAR, container_id,
+                               dict(zip(COLUNAS['containers'], linha)))])
+
+        return [Alteracao('containers', ATUALIZAR, container_id, linha)]
+
+    def remover_container(self, container_id, cascata=False):
+        """Remove o container; com agendamentos exige ``cascata`` verdadeiro"""
+        with self.db.transacao():
+            condicao, params = self._escopo('id = ?', (container_id,))
+            if not self.db.consultar_um(f"SELECT 1 FROM containers WHERE {condicao}", params):
+                raise NaoEncontrado("Container não encontrado")
+
+            agendamentos = self.db.consultar(
+                "SELECT id, data_agendamento, tipo_operacao FROM agendamentos WHERE container_id=?",
+                (container_id,))
+            if agendamentos and not cascata:
+                raise PossuiAgendamentos("Existem agendamentos para este container")
+
+            # Os agendamentos são removidos em cascata (ON DELETE CASCADE)
+            self.db.executar("DELETE FROM containers WHERE id=?", (container_id,))
+            gravar_eventos(self.db, [evento(container_id, AGENDAMENTO_CANCELADO, tipo_operacao,
+                                            detalhe=data, cnpj=self.cnpj)
+                                     for _, data, tipo_operacao in agendamentos] +
+                                    [evento(container_id, REMOVIDO, cnpj=self.cnpj)])
+            self._enfileirar([('containers', REMOVER, container_id, None)])
+
+        self._atualizar_ids(IndiceIds.remover, container_id)
+        alteracoes = []
+        for agendamento_id, data, tipo_operacao in agendamentos:
+            self.calendario.registrar(tipo_operacao, date.fromisoformat(data), -1)
+            alteracoes.append(Alteracao('agendamentos', REMOVER, agendamento_id, None))
+        alteracoes.append(Alteracao('containers', REMOVER, container_id, None))
+        return alteracoes
+
+    # Painel
+
+    def resumo_painel(self, dias=14, maximo_portos=10):
+        """Totais do painel lidos das tabelas de resumo mantidas por triggers.
+
+        Retorna um dict com listas (valor, total) para status, tipo_container,
+        origem e destino (portos limitados aos ``maximo_portos`` maiores),
+        o total de containers e as operações dos próximos ``dias`` como
+        (data, tipo_operacao, total).
+        """
+        # Com empresa, lê só o trecho dela na chave (cnpj, ...); sem, soma todas
+        condicao, params = self._escopo('total > 0')
+        resumo = {dimensao: [] for dimensao in ('status', 'tipo_container', 'origem', 'destino')}
+        for dimensao, valor, total in self.db.consultar(
+                f"""SELECT dimensao, valor, SUM(total) AS soma FROM resumo_containers
+                    WHERE {condicao} GROUP BY dimensao, valor
+                    ORDER BY dimensao, soma DESC, valor""", params):
+            resumo[dimensao].append((valor, total))
+        resumo['origem'] = resumo['origem'][:maximo_portos]
+        resumo['destino'] = resumo['destino'][:maximo_portos]
+        resumo['total_containers'] = sum(total for _, total in resumo['status'])
+
+        hoje = date.today()
+        condicao, params = self._escopo(
+            'data_agendamento BETWEEN ? AND ? AND total > 0',
+            (hoje.isoformat(), (hoje + timedelta(days=dias - 1)).isoformat()))
+        resumo['operacoes'] = self.db.consultar(
+            f"""SELECT data_agendamento, tipo_operacao, SUM(total) FROM resumo_agendamentos
+                WHERE {condicao} GROUP BY data_agendamento, tipo_operacao
+                ORDER BY data_agendamento, tipo_operacao""", params)
+        return resumo
+
+    # Agendamentos
+
+    def listar_agendamentos(self, container_id=None, apos=None, antes=None, limite=200):
+        filtro, params = self._escopo(*(("container_id = ?", [container_id])
+                                        if container_id else ('', [])))
+        return self.db.consultar_pagina('agendamentos', apos=apos, antes=antes, limite=limite,
+                                        colunas=', '.join(COLUNAS['agendamentos']),
+                                        filtro=filtro, params=params)
+
+    def _validar_agendamento(self, data, tipo_operacao):
+        """Valida tipo e data ('DD/MM/AAAA' ou 'AAAA-MM-DD') e retorna a data"""
+        if tipo_operacao not in TIPOS_OPERACAO:
+            raise OperacaoInvalida(f"Tipo de operação inválido: {tipo_operacao}")
+        data_obj = ler_data(data)
+        if data_obj < date.today():
+            raise OperacaoInvalida("Data não pode ser no passado")
+        return data_obj
+
+    @contextmanager
+    def _transacao_agenda(self):
+        """Transação que devolve ao calendário as vagas reservadas se falhar"""
+        reservas = []
+        try:
+            with self.db.transacao():
+                yield reservas
+        except BaseException:
+            for tipo_operacao, data, quantidade in reservas:
+                self.calendario.registrar(tipo_operacao, data, -quantidade)
+            raise
+
+    def _inserir_agendamento(self, reservas, container_id, data, tipo_operacao):
+        """Insere na transação corrente se houver vaga e reserva no calendário.
+
+        Duplicidade é detectada pelo índice único container/data e container
+        inexistente (ou de outra empresa) pelo INSERT ... SELECT não inserir
+        nada, sem SELECT prévio. O agendamento herda o cnpj do container.
+        """
+        if not self.calendario.disponivel(tipo_operacao, data):
+            raise Conflito(f"Capacidade diária de {tipo_operacao} esgotada em "
+                           f"{data.strftime('%d/%m/%Y')}")
+        condicao, params = self._escopo('id = ?', (container_id,))
+        try:
+            cursor = self.db.executar(f"""INSERT INTO agendamentos (container_id, data_agendamento,
+                                                                    tipo_operacao, cnpj)
+                                          SELECT id, ?, ?, cnpj FROM containers WHERE {condicao}""",
+                                      [data.isoformat(), tipo_operacao] + params)
+        except sqlite3.IntegrityError as e:
+            if 'UNIQUE' in str(e):
+                raise Conflito("Já existe um agendamento para este container nesta data")
+            raise
+        if not cursor.rowcount:
+            raise NaoEncontrado("Container não encontrado")
+
+        self.calendario.registrar(tipo_operacao, data)
+        reservas.append((tipo_operacao, data, 1))
+        return (cursor.lastrowid, container_id, data.isoformat(), tipo_operacao)
+
+    def criar_agendamento(self, container_id, data, tipo_operacao):
+        """Agenda uma operação; ``data`` em 'DD/MM/AAAA' ou 'AAAA-MM-DD'"""
+        container_id = (container_id or '').strip()
+        data = (data or '').strip()
+        tipo_operacao = (tipo_operacao or '').strip()
+        if not all([container_id, data, tipo_operacao]):
+            raise OperacaoInvalida("Todos os campos são obrigatórios")
+        data_obj = self._validar_agendamento(data, tipo_operacao)
+
+        with self._transacao_agenda() as reservas:
+            linha = self._inserir_agendamento(reservas, container_id, data_obj, tipo_operacao)
+            gravar_eventos(self.db, [evento(container_id, AGENDADO, tipo_operacao, linha[2],
+                                            cnpj=self.cnpj)])
+            self._enfileirar([self._mudanca_agendamento(INSERIR, *linha[1:])])
+        return [Alteracao('agendamentos', INSERIR, linha[0], linha)]
+
+    def _gravar_agendamento_aceito(self, container_id, data, tipo_operacao):
+        """Grava um agendamento já aceito pelo banco central, substituindo o do mesmo
+        container e data.
+
+        Sem as regras do cadastro (data passada, capacidade do dia): quem
+        decide é o central, e o terminal só acompanha a decisão.
+        """
+        if tipo_operacao not in TIPOS_OPERACAO:
+            raise OperacaoInvalida(f"Tipo de operação inválido: {tipo_operacao}")
+        data_obj = ler_data(data)
+
+        with self._transacao_agenda() as reservas:
+            condicao, params = self._escopo('container_id = ? AND data_agendamento = ?',
+                                            (container_id, data_obj.isoformat()))
+            anterior = self.db.consultar_um(
+                f"SELECT id, tipo_operacao FROM agendamentos WHERE {condicao}", params)
+            if anterior and anterior[1] == tipo_operacao:
+                return []
+            if anterior:
+                self.db.executar("UPDATE agendamentos SET tipo_operacao=? WHERE id=?",
+                                 (tipo_operacao, anterior[0]))
+                self.calendario.registrar(anterior[1], data_obj, -1)
+                reservas.append((anterior[1], data_obj, -1))
+                agendamento_id, operacao = anterior[0], ATUALIZAR
+            else:
+                condicao, params = self._escopo('id = ?', (container_id,))
+                cursor = self.db.executar(f"""INSERT INTO agendamentos (container_id, data_agendamento,
+                                                                        tipo_operacao, cnpj)
+                                              SELECT id, ?, ?, cnpj FROM containers WHERE {condicao}""",
+                                          [data_obj.isoformat(), tipo_operacao] + params)
+                if not cursor.rowcount:
+                    raise NaoEncontrado("Container não encontrado")
+                agendamento_id, operacao = cursor.lastrowid, INSERIR
+            self.calendario.registrar(tipo_operacao, data_obj)
+            reservas.append((tipo_operacao, data_obj, 1))
+            linha = (agendamento_id, container_id, data_obj.isoformat(), tipo_operacao)
+            gravar_eventos(self.db, [evento(container_id, AGENDADO, tipo_operacao, linha[2],
+                                            cnpj=self.cnpj)])
+            self._enfileirar([self._mudanca_agendamento(INSERIR, *linha[1:])])
+        return [Alteracao('agendamentos', operacao, agendamento_id, linha)]
+
+    def agendar_em_lote(self, container_ids, data, tipo_operacao, ajustar=False):
+        """Agenda a mesma operação para vários containers numa única transação.
+
+        Com ``ajustar`` cada container vai para o primeiro dia com vaga a
+        partir de ``data``; sem ele, os que não couberem no dia são
+        rejeitados. Retorna (alteracoes, rejeitados), onde rejeitados são
+        pares (container_id, motivo).
+        """
+        data_obj = self._validar_agendamento((data or '').strip(), (tipo_operacao or '').strip())
+        tipo_operacao = tipo_operacao.strip()
+        alteracoes, rejeitados = [], []
+
+        with self._transacao_agenda() as reservas:
+            for container_id in container_ids:
+                container_id = (container_id or '').strip()
+                dia = (self.calendario.proxima_data(tipo_operacao, data_obj)
+                       if ajustar else data_obj)
+                try:
+                    if dia is None:
+                        raise Conflito(f"Operação {tipo_operacao} sem capacidade")
+                    linha = self._inserir_agendamento(reservas, container_id, dia, tipo_operacao)
+                except OperacaoInvalida as e:
+                    rejeitados.append((container_id, str(e)))
+                    continue
+                alteracoes.append(Alteracao('agendamentos', INSERIR, linha[0], linha))
+
+            gravar_eventos(self.db, (evento(a.linha[1], AGENDADO, tipo_operacao, a.linha[2],
+                                            cnpj=self.cnpj)
+                                     for a in alteracoes))
+            self._enfileirar([self._mudanca_agendamento(INSERIR, *a.linha[1:])
+                              for a in alteracoes])
+        return alteracoes, rejeitados
+
+    def agendar_recorrente(self, tipo_operacao, inicio, fim, intervalo_dias, filtro=None):
+        """Agenda a operação a cada ``intervalo_dias`` entre ``inicio`` e ``fim``
+        para todos os containers do filtro (ex.: manutenção dos reefers a cada 30 dias).
+
+        As datas são calculadas por aritmética de ordinais e tudo o mais é
+        feito por conjuntos numa única transação: os containers e as datas vão
+        para tabelas temporárias, os conflitos com agendamentos existentes saem
+        de um NOT EXISTS no índice container/data e a capacidade diária é
+        respeitada numerando os candidatos de cada dia (ROW_NUMBER). Quem não
+        couber no dia fica de fora (sem_vaga), sem remanejamento.
+        """
+        if tipo_operacao not in TIPOS_OPERACAO:
+            raise OperacaoInvalida(f"Tipo de operação inválido: {tipo_operacao}")
+        inicio, fim = ler_data(inicio), ler_data(fim)
+        intervalo_dias = int(intervalo_dias)
+        if inicio < date.today():
+            raise OperacaoInvalida("Data não pode ser no passado")
+        if fim < inicio:
+            raise OperacaoInvalida("A data final deve ser igual ou posterior à inicial")
+        if intervalo_dias < 1:
+            raise OperacaoInvalida("O intervalo deve ser de pelo menos 1 dia")
+        datas = [date.fromordinal(dia)
+                 for dia in range(inicio.toordinal(), fim.toordinal() + 1, intervalo_dias)]
+        condicao, params = self._escopo(*(filtro or FiltroContainers()).sql())
+
+        with self._transacao_agenda() as reservas:
+            self.db.executar("""CREATE TEMP TABLE IF NOT EXISTS recorrencia_containers
+                                (id TEXT PRIMARY KEY, cnpj TEXT) WITHOUT ROWID""")
+            self.db.executar("""CREATE TEMP TABLE IF NOT EXISTS recorrencia_datas
+                                (data TEXT PRIMARY KEY, vagas INTEGER) WITHOUT ROWID""")
+            try:
+                containers = self.db.executar(
+                    f"""INSERT INTO recorrencia_containers
+                        SELECT id, cnpj FROM containers {f'WHERE {condicao}' if condicao else ''}""",
+                    params).rowcount
+                ocorrencias = containers * len(datas)
+                if ocorrencias > MAXIMO_OCORRENCIAS:
+                    raise OperacaoInvalida(f"A regra gera {ocorrencias} agendamentos; o máximo "
+                                           f"é {MAXIMO_OCORRENCIAS}")
+                # vagas NULL: operação sem limite diário
+                self.db.executar_muitos("INSERT INTO recorrencia_datas VALUES (?, ?)",
+                                        [(data.isoformat(), self.calendario.vagas(tipo_operacao, data))
+                                         for data in datas])
+
+                conflitos = self.db.consultar_um(
+                    """SELECT COUNT(*) FROM recorrencia_datas d
+                       JOIN agendamentos a ON a.data_agendamento = d.data
+                       JOIN recorrencia_containers c ON c.id = a.container_id""")[0]
+                ultimo_id = self.db.consultar_um("SELECT coalesce(MAX(id), 0) FROM agendamentos")[0]
+                criados = self.db.executar(
+                    """INSERT INTO agendamentos (container_id, data_agendamento, tipo_operacao, cnpj)
+                       SELECT id, data, ?, cnpj FROM (
+                           SELECT c.id, c.cnpj, d.data, d.vagas,
+                                  ROW_NUMBER() OVER (PARTITION BY d.data ORDER BY c.id) AS ordem
+                           FROM recorrencia_datas d CROSS JOIN recorrencia_containers c
+                           WHERE NOT EXISTS (SELECT 1 FROM agendamentos a
+                                             WHERE a.container_id = c.id
+                                               AND a.data_agendamento = d.data))
+                       WHERE vagas IS NULL OR ordem <= vagas
+                       ORDER BY data, id""", (tipo_operacao,)).rowcount
+            finally:
+                self.db.executar("DELETE FROM recorrencia_containers")
+                self.db.executar("DELETE FROM recorrencia_datas")
+
+            # Histórico e calendário também por conjunto: os novos ids são os maiores
+            self.db.executar("""INSERT INTO eventos_container (container_id, ts, tipo, valor,
+                                                               detalhe, cnpj)
+                                SELECT container_id, ?, ?, ?, data_agendamento, cnpj
+                                FROM agendamentos WHERE id > ?""",
+                             (int(time.time()), AGENDADO, TIPOS_OPERACAO.index(tipo_operacao),
+                              ultimo_id))
+            if self.fila is not None:
+                self.fila.registrar_agendamentos('id > ?', (ultimo_id,))
+            for data, quantidade in self.db.consultar(
+                    """SELECT data_agendamento, COUNT(*) FROM agendamentos
+                       WHERE id > ? GROUP BY data_agendamento""", (ultimo_id,)):
+                data = date.fromisoformat(data)
+                self.calendario.registrar(tipo_operacao, data, quantidade)
+                reservas.append((tipo_operacao, data, quantidade))
+
+        return ResultadoRecorrencia(ocorrencias, criados, conflitos,
+                                    ocorrencias - conflitos - criados)
+
+    def proxima_data_disponivel(self, tipo_operacao, a_partir=None):
+        """Primeira data ISO com vaga para a operação (hoje ou depois), ou None"""
+        if tipo_operacao not in TIPOS_OPERACAO:
+            raise OperacaoInvalida(f"Tipo de operação inválido: {tipo_operacao}")
+        a_partir = max(ler_data(a_partir) if a_partir else date.today(), date.today())
+        data = self.calendario.proxima_data(tipo_operacao, a_partir)
+        return data.isoformat() if data else None
+
+    def definir_capacidade(self, tipo_operacao, limite_diario):
+        """Define o limite diário da operação (None remove o limite).
+
+        A capacidade é do terminal e vale para todas as empresas, então só o
+        serviço sem ``cnpj`` (linha de comando, administração) pode alterá-la.
+        """
+        if self.cnpj is not None:
+            raise OperacaoInvalida("A capacidade é do terminal: altere-a pela administração "
+                                   "(cli.py capacidade)")
+        if tipo_operacao not in TIPOS_OPERACAO:
+            raise OperacaoInvalida(f"Tipo de operação inválido: {tipo_operacao}")
+        if limite_diario is not None:
+            limite_diario = int(limite_diario)
+            if limite_diario < 0:
+                raise OperacaoInvalida("Capacidade não pode ser negativa")
+        with self.db.transacao():
+            self._gravar_capacidade(tipo_operacao, limite_diario)
+            self._enfileirar([('capacidade_operacoes', ATUALIZAR, tipo_operacao,
+                               {'limite_diario': limite_diario})])
+
+    def _gravar_capacidade(self, tipo_operacao, limite_diario):
+        """Grava a capacidade já validada (também a recebida do banco central)"""
+        if limite_diario is not None:
+            self.db.executar("INSERT OR REPLACE INTO capacidade_operacoes VALUES (?, ?)",
+                             (tipo_operacao, limite_diario))
+        else:
+            self.db.executar("DELETE FROM capacidade_operacoes WHERE tipo_operacao=?",
+                             (tipo_operacao,))
+        self.calendario.definir_capacidade(tipo_operacao, limite_diario)
+
+    def _excluir_agendamento(self, agendamento_id, tipo_evento):
+        with self.db.transacao():
+            condicao, params = self._escopo('id = ?', (agendamento_id,))
+            agendamento = self.db.consultar_um(
+                f"SELECT container_id, data_agendamento, tipo_operacao FROM agendamentos "
+                f"WHERE {condicao}", params)
+            if not agendamento:
+                raise NaoEncontrado("Agendamento não encontrado")
+            container_id, data, tipo_operacao = agendamento
+            self.db.executar("DELETE FROM agendamentos WHERE id=?", (agendamento_id,))
+            gravar_eventos(self.db, [evento(container_id, tipo_evento, tipo_operacao, data,
+                                            cnpj=self.cnpj)])
+            operacao = CONCLUIR if tipo_evento == OPERACAO_CONCLUIDA else REMOVER
+            self._enfileirar([self._mudanca_agendamento(operacao, container_id, data,
+                                                        tipo_operacao)])
+
+        self.calendario.registrar(tipo_operacao, date.fromisoformat(data), -1)
+        return [Alteracao('agendamentos', REMOVER, agendamento_id, None)]
+
+    def remover_agendamento(self, agendamento_id):
+        """Cancela o agendamento"""
+        return self._excluir_agendamento(agendamento_id, AGENDAMENTO_CANCELADO)
+
+    def concluir_agendamento(self, agendamento_id):
+        """Dá baixa no agendamento como operação realizada (fica no histórico)"""
+        return self._excluir_agendamento(agendamento_id, OPERACAO_CONCLUIDA)
+
+    # Histórico
+
+    def historico_container(self, container_id, de=None, ate=None):
+        """Eventos do container (também dos já removidos), de/ate em timestamp Unix"""
+        return consultar_eventos(self.db, container_id, de, ate, self.cnpj)
+
+    def consultar_arquivo(self, container_id):
+        """Agendamentos e eventos do container já arquivados (ver arquivamento.py)"""
+        return consultar_arquivo(self.db, container_id, self.cnpj)
+
+    # Empresas
+
+    def atribuir_sem_empresa(self, cnpj):
+        """Passa para ``cnpj`` os registros ainda sem empresa (dados anteriores à
+        separação por CNPJ); retorna quantos containers foram atribuídos"""
+        if not self.db.consultar_um("SELECT 1 FROM usuarios WHERE cnpj=?", (cnpj,)):
+            raise NaoEncontrado("CNPJ não cadastrado")
+        with self.db.transacao():
+            ids = json.dumps([linha[0] for linha in self.db.consultar(
+                "SELECT id FROM containers WHERE cnpj IS NULL")])
+            total = self.db.executar("UPDATE containers SET cnpj=? WHERE cnpj IS NULL",
+                                     (cnpj,)).rowcount
+            self.db.executar("""UPDATE agendamentos SET cnpj=?
+                                WHERE cnpj IS NULL
+                                  AND container_id IN (SELECT id FROM containers WHERE cnpj=?)""",
+                             (cnpj, cnpj))
+            self.db.executar("""UPDATE eventos_container SET cnpj=?
+                                WHERE cnpj IS NULL
+                                  AND container_id IN (SELECT id FROM containers WHERE cnpj=?)""",
+                             (cnpj, cnpj))
+            if self.fila is not None:
+                # Só agora, com empresa, os registros podem ir para o banco central
+                self.fila.registrar_containers("id IN (SELECT value FROM json_each(?))", (ids,))
+                self.fila.registrar_agendamentos(
+                    "container_id IN (SELECT value FROM json_each(?))", (ids,))
+        self.invalidar_caches()
+        return total
+
+
+class Empresas:
+    """Serviço de cada empresa, criado no primeiro uso e reaproveitado.
+
+    Por padrão as empresas compartilham o banco do serviço central e cada uma
+    recebe a visão filtrada por CNPJ. Com ``diretorio`` cada empresa tem o
+    próprio arquivo SQLite (empresa_<cnpj>.db), e o banco central guarda só
+    os usuários; nesse modo a capacidade diária das operações vale por
+    arquivo.
+    """
+
+    def __init__(self, central, diretorio=None, criar_fila=None):
+        self.central = central
+        self.diretorio = diretorio
+        # Fila de sincronização de cada banco próprio (ex.: sincronizacao.fila_do_banco)
+        self.criar_fila = criar_fila
+        self._servicos = {}
+        self._lock = threading.Lock()
+
+    def caminho(self, cnpj):
+        digitos = re.sub(r'\D', '', cnpj)
+        return os.path.join(self.diretorio, f"empresa_{digitos}.db")
+
+    def servico(self, cnpj):
+        with self._lock:
+            servico = self._servicos.get(cnpj)
+            if servico is None:
+                if self.diretorio:
+                    os.makedirs(self.diretorio, exist_ok=True)
+                    db = Database(self.caminho(cnpj), metricas=self.central.db.metricas)
+                    db.inicializar_schema()
+                    servico = ServicoContainers(db, self.central.sessoes, cnpj=cnpj,
+                                                fila=self.criar_fila(db) if self.criar_fila else None)
+                else:
+                    servico = self.central.da_empresa(cnpj)
+                self._servicos[cnpj] = servico
+            return servico
+
+    def fechar(self):
+        """Fecha os bancos próprios das empresas (o central fica com quem o abriu)"""
+        with self._lock:
+            if self.diretorio:
+                for servico in self._servicos.values():
+                    servico.db.fechar()
+            self._servicos.clear()
@@ -0,0 +1,507 @@
+"""Sincronização dos terminais com um banco central pela API HTTP.
+
+Cada terminal continua gravando no próprio arquivo SQLite e, na mesma
+transação, acrescenta a alteração em fila_sincronizacao (FilaSincronizacao).
+O Sincronizador envia a fila em lotes para o central (POST /sincronizacao),
+que aplica cada lote numa única transação pelo ServicoContainers da empresa
+e registra as alterações aceitas em registro_sincronizacao; depois recebe o
+que os outros terminais enviaram (GET /sincronizacao) e aplica localmente.
+Os terminais só disputam o lock de escrita do próprio banco e, no central,
+um único processo serializa as escritas.
+
+Todo escritor usa a fila devolvida por fila_do_banco(): nos terminais, a
+FilaSincronizacao; no central (marcar_central), o RegistroSincronizacao, de
+modo que também as alterações feitas diretamente no central (API, linha de
+comando) chegam aos terminais. Um banco que não é central nem terminal
+(nenhum central configurado e nunca sincronizado) fica sem fila, para não
+acumular alterações que ninguém vai confirmar. Registros sem empresa só entram na fila
+quando atribuídos a uma (atribuir-empresa). A capacidade diária é do
+terminal: a definida no central vale para todos os terminais.
+
+Resolução de conflitos (igual nos dois lados):
+    - cada registro tem em versoes_sincronizacao o instante da última
+      alteração aplicada; alteração mais antiga que ela é descartada
+      ('obsoleta'), então a última escrita vence (pelos relógios dos
+      terminais);
+    - container: o ID é do container físico. Cadastrar e atualizar gravam
+      os dados completos: um ID que já existe na mesma empresa é atualizado
+      e um removido há menos tempo que a alteração volta a existir (a
+      remoção também deixa versão); em outra empresa é conflito. Remover um
+      inexistente é ignorado;
+    - agendamento: identificado por container e data. O primeiro a chegar
+      ao central fica com a data; o outro (ou o que exceder a capacidade do
+      dia) é conflito;
+    - em todo conflito o central devolve o estado atual do registro e o
+      terminal de origem volta a ele (ou apaga a cópia, se o central não a
+      tem). No terminal, as alterações recebidas do central não passam
+      pelas regras do cadastro (data passada, capacidade): o central já as
+      aceitou.
+"""
+import json
+import logging
+import secrets
+import sqlite3
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from functools import partial
+
+from database import ATUALIZAR, INSERIR, REMOVER
+from exportacao import COLUNAS
+from servicos import CONCLUIR, Conflito, NaoAutenticado, NaoEncontrado
+from validacao import OperacaoInvalida
+
+TAMANHO_LOTE = 500
+CENTRAL = 'central'
+
+# Resultado de cada alteração aplicada por mesclar()
+APLICADA = 'aplicada'
+OBSOLETA = 'obsoleta'
+IGNORADA = 'ignorada'
+CONFLITO = 'conflito'
+
+Mudanca = namedtuple('Mudanca', 'id ts tabela operacao chave dados')
+# ``atual``: no conflito, o registro como está no banco (None se não existe)
+ResultadoMudanca = namedtuple('ResultadoMudanca', 'resultado erro atual')
+ResultadoSincronizacao = namedtuple('ResultadoSincronizacao', 'enviadas recebidas conflitos')
+
+log_sincronizacao = logging.getLogger('containererp.sincronizacao')
+
+
+def ler_mudanca(registro):
+    """Mudanca a partir do JSON; identificação inválida é OperacaoInvalida.
+
+    Os dados são conferidos por alteração em mesclar(), para que uma só mal
+    formada vire conflito sem recusar o lote inteiro.
+    """
+    mudanca = Mudanca(registro.get('id'), float(registro['ts']), registro['tabela'],
+                      registro['operacao'], registro['chave'], registro.get('dados'))
+    if not all(isinstance(valor, str) for valor in mudanca[2:5]):
+        raise OperacaoInvalida("Alteração mal formada: tabela, operacao e chave devem ser texto")
+    return mudanca
+
+
+class FilaSincronizacao:
+    """Alterações locais ainda não confirmadas pelo central, em ordem de gravação"""
+
+    DESTINO = 'fila_sincronizacao (ts, cnpj, tabela, operacao, chave, dados)'
+    # Tabelas cujas alterações sem empresa (cnpj NULL) também são registradas
+    TABELAS_DO_TERMINAL = ()
+
+    def __init__(self, db):
+        self.db = db
+        self._fixos = ()
+
+    def registrar(self, cnpj, mudancas, ts=None):
+        """Acrescenta (tabela, operacao, chave, dados) na transação corrente"""
+        agora = time.time() if ts is None else ts
+        linhas = [self._fixos + (agora, cnpj, tabela, operacao, chave,
+                                 None if dados is None else json.dumps(dados, ensure_ascii=False))
+                  for tabela, operacao, chave, dados in mudancas
+                  if cnpj is not None or tabela in self.TABELAS_DO_TERMINAL]
+        if not linhas:
+            return
+        self.db.executar_muitos(f"INSERT INTO {self.DESTINO} "
+                                f"VALUES ({', '.join('?' * len(linhas[0]))})", linhas)
+        self.db.executar_muitos(_GRAVAR_VERSAO, [(linha[-4], linha[-2], agora)
+                                                 for linha in linhas])
+
+    def _registrar_conjunto(self, tabela, chave, dados, condicao, params):
+        agora = time.time()
+        marcadores = '?, ' * len(self._fixos)
+        self.db.executar(f"""INSERT INTO {self.DESTINO}
+                             SELECT {marcadores}?, cnpj, '{tabela}', ?, {chave}, {dados}
+                             FROM {tabela} WHERE cnpj IS NOT NULL AND ({condicao})
+                             ORDER BY rowid""",
+                         self._fixos + (agora, INSERIR) + tuple(params))
+        self.db.executar(f"""INSERT INTO versoes_sincronizacao (tabela, chave, ts)
+                             SELECT '{tabela}', {chave}, ? FROM {tabela}
+                             WHERE cnpj IS NOT NULL AND ({condicao})
+                             {_SUFIXO_VERSAO}""", (agora,) + tuple(params))
+
+    def registrar_containers(self, condicao, params=()):
+        """Enfileira por conjunto, como cadastro, os containers que atendem à condição SQL
+        (cada um com a empresa dele)"""
+        self._registrar_conjunto('containers', 'id', _JSON_CONTAINER, condicao, params)
+
+    def registrar_agendamentos(self, condicao, params=()):
+        """Enfileira por conjunto os agendamentos que atendem à condição SQL"""
+        self._registrar_conjunto(
+            'agendamentos', "container_id || '|' || data_agendamento",
+            """json_object('container_id', container_id, 'data_agendamento', data_agendamento,
+                           'tipo_operacao', tipo_operacao)""",
+            condicao, params)
+
+    def pendentes(self, cnpj, limite=TAMANHO_LOTE):
+        return [Mudanca(id_, ts, tabela, operacao, chave, json.loads(dados) if dados else None)
+                for id_, ts, tabela, operacao, chave, dados in self.db.consultar(
+                    """SELECT id, ts, tabela, operacao, chave, dados FROM fila_sincronizacao
+                       WHERE cnpj IS ? ORDER BY id LIMIT ?""", (cnpj, limite))]
+
+    def confirmar(self, cnpj, ate_id):
+        """Retira da fila as alterações já processadas pelo central"""
+        self.db.executar("DELETE FROM fila_sincronizacao WHERE cnpj IS ? AND id <= ?",
+                         (cnpj, ate_id))
+
+    def total(self, cnpj):
+        return self.db.consultar_um("SELECT COUNT(*) FROM fila_sincronizacao WHERE cnpj IS ?",
+                                    (cnpj,))[0]
+
+
+class RegistroSincronizacao(FilaSincronizacao):
+    """No central: alterações aplicadas, distribuídas aos terminais por ler_registro().
+
+    ``origem`` identifica quem as fez (o terminal, ou CENTRAL para as feitas
+    no próprio central); cada terminal não recebe de volta as suas.
+    """
+
+    DESTINO = 'registro_sincronizacao (origem, ts, cnpj, tabela, operacao, chave, dados)'
+    TABELAS_DO_TERMINAL = ('capacidade_operacoes',)
+
+    def __init__(self, db, origem=CENTRAL):
+        super().__init__(db)
+        self._fixos = (origem,)
+
+
+def _estado(db, nome):
+    linha = db.consultar_um("SELECT valor FROM estado_sincronizacao WHERE nome=?", (nome,))
+    return linha[0] if linha else None
+
+
+def _gravar_estado(db, nome, valor):
+    db.executar("INSERT OR REPLACE INTO estado_sincronizacao VALUES (?, ?)", (nome, str(valor)))
+    return str(valor)
+
+
+def marcar_central(db):
+    """Faz do banco o central: daqui em diante as escritas vão para o registro"""
+    _gravar_estado(db, 'papel', CENTRAL)
+
+
+def fila_do_banco(db, terminal=False):
+    """O RegistroSincronizacao, no central; a FilaSincronizacao, nos terminais.
+
+    Terminal é o banco com um central configurado (``terminal``) ou que já
+    sincronizou; nos demais não há fila (None).
+    """
+    if _estado(db, 'papel') == CENTRAL:
+        return RegistroSincronizacao(db)
+    if terminal or sincronizado(db):
+        return FilaSincronizacao(db)
+    return None
+
+
+def sincronizado(db):
+    """Se o banco é de um terminal que já sincronizou com um central"""
+    return _estado(db, 'origem') is not None
+
+
+_JSON_CONTAINER = "json_object({})".format(
+    ', '.join(f"'{coluna}', {coluna}" for coluna in COLUNAS['containers']))
+_SUFIXO_VERSAO = "ON CONFLICT(tabela, chave) DO UPDATE SET ts = max(ts, excluded.ts)"
+_GRAVAR_VERSAO = f"INSERT INTO versoes_sincronizacao VALUES (?, ?, ?) {_SUFIXO_VERSAO}"
+
+
+# Aplicação das alterações (no central e nos terminais)
+
+def _gravar_container(servico, container_id, dados):
+    """Atualiza o container com os dados completos ou o cadastra se não existir"""
+    try:
+        servico.atualizar_container(container_id, dados)
+    except NaoEncontrado:
+        try:
+            servico.adicionar_container(dict(dados, id=container_id), dados.get('data_entrada'))
+        except Conflito:
+            raise Conflito("Container ID já existe em outra empresa")
+
+
+def _aplicar(servico, mudanca, do_central):
+    """Aplica uma alteração; ``do_central`` quando ela já foi aceita pelo central"""
+    dados = mudanca.dados or {}
+    if not isinstance(dados, dict):
+        raise OperacaoInvalida("Alteração mal formada: dados deve ser um objeto")
+    if mudanca.tabela == 'containers':
+        if mudanca.operacao in (INSERIR, ATUALIZAR):
+            # A versão já garantiu que a alteração é posterior a uma remoção
+            _gravar_container(servico, mudanca.chave, dados)
+        elif mudanca.operacao == REMOVER:
+            try:
+                servico.remover_container(mudanca.chave, cascata=True)
+            except NaoEncontrado:
+                return IGNORADA
+        else:
+            raise OperacaoInvalida(f"Operação desconhecida: {mudanca.operacao}")
+        return APLICADA
+
+    if mudanca.tabela == 'agendamentos':
+        container_id, _, data = mudanca.chave.partition('|')
+        if mudanca.operacao == INSERIR and do_central:
+            servico._gravar_agendamento_aceito(container_id, data, dados.get('tipo_operacao'))
+            return APLICADA
+        if mudanca.operacao == INSERIR:
+            servico.criar_agendamento(container_id, data, dados.get('tipo_operacao'))
+            return APLICADA
+        if mudanca.operacao not in (REMOVER, CONCLUIR):
+            raise OperacaoInvalida(f"Operação desconhecida: {mudanca.operacao}")
+        agendamento = _agendamento(servico, container_id, data)
+        if agendamento is None:
+            return IGNORADA
+        if mudanca.operacao == CONCLUIR:
+            servico.concluir_agendamento(agendamento[0])
+        else:
+            servico.remover_agendamento(agendamento[0])
+        return APLICADA
+
+    if mudanca.tabela == 'capacidade_operacoes' and do_central:
+        servico._gravar_capacidade(mudanca.chave, dados.get('limite_diario'))
+        return APLICADA
+
+    raise OperacaoInvalida(f"Tabela desconhecida: {mudanca.tabela}")
+
+
+def _agendamento(servico, container_id, data):
+    """(id, tipo_operacao) do agendamento do container na data, ou None"""
+    condicao, params = servico._escopo('container_id = ? AND data_agendamento = ?',
+                                       (container_id, data))
+    return servico.db.consultar_um(
+        f"SELECT id, tipo_operacao FROM agendamentos WHERE {condicao}", params)
+
+
+def _atual(servico, tabela, chave):
+    """Os dados do registro como estão no banco, no formato das alterações, ou None"""
+    if tabela == 'containers':
+        try:
+            return dict(zip(COLUNAS['containers'], servico.obter_container(chave)))
+        except NaoEncontrado:
+            return None
+    if tabela == 'agendamentos':
+        container_id, _, data = chave.partition('|')
+        agendamento = _agendamento(servico, container_id, data)
+        if agendamento is None:
+            return None
+        return servico._mudanca_agendamento(INSERIR, container_id, data, agendamento[1])[3]
+    return None
+
+
+def mesclar(servico, mudancas, origem=None):
+    """Aplica as alterações numa transação e retorna um ResultadoMudanca por alteração.
+
+    ``servico`` deve ser de uma empresa e sem fila (ServicoContainers.sem_fila).
+    Cada alteração roda num SAVEPOINT: a que falhar é desfeita sozinha e
+    vira conflito, com o estado atual do registro. Com ``origem`` (no
+    central) as aplicadas vão para registro_sincronizacao, de onde os outros
+    terminais as recebem; sem ela (no terminal) as alterações vêm do
+    central, já aceitas, e também podem mudar a capacidade das operações.
+    """
+    registro = None if origem is None else RegistroSincronizacao(servico.db, origem)
+    resultados = []
+    try:
+        with servico.db.transacao() as conn:
+            for mudanca in mudancas:
+                versao = servico.db.consultar_um(
+                    "SELECT ts FROM versoes_sincronizacao WHERE tabela=? AND chave=?",
+                    (mudanca.tabela, mudanca.chave))
+                if versao and versao[0] > mudanca.ts:
+                    resultados.append(ResultadoMudanca(OBSOLETA, None, None))
+                    continue
+
+                conn.execute("SAVEPOINT mudanca")
+                try:
+                    resultado = _aplicar(servico, mudanca, do_central=registro is None)
+                except (OperacaoInvalida, TypeError, AttributeError, ValueError,
+                        sqlite3.IntegrityError) as e:
+                    # Inclui valores de tipo errado nos dados (número no lugar de texto)
+                    # e os recusados pelas restrições do banco (CHECK, FOREIGN KEY)
+                    conn.execute("ROLLBACK TO mudanca")
+                    conn.execute("RELEASE mudanca")
+                    resultados.append(ResultadoMudanca(
+                        CONFLITO, str(e), _atual(servico, mudanca.tabela, mudanca.chave)))
+                    continue
+
+                servico.db.executar(_GRAVAR_VERSAO, (mudanca.tabela, mudanca.chave, mudanca.ts))
+                if registro is not None and resultado == APLICADA:
+                    registro.registrar(servico.cnpj, [(mudanca.tabela, mudanca.operacao,
+                                                       mudanca.chave, mudanca.dados)],
+                                       ts=mudanca.ts)
+                conn.execute("RELEASE mudanca")
+                resultados.append(ResultadoMudanca(resultado, None, None))
+    except BaseException:
+        # O calendário já contou as reservas das alterações desfeitas
+        servico.invalidar_caches()
+        raise
+    return resultados
+
+
+def ler_registro(db, cnpj, apos, origem, limite=TAMANHO_LOTE):
+    """Alterações aceitas no central depois de ``apos``, exceto as vindas de ``origem``.
+
+    Inclui as do terminal (sem empresa, como a capacidade das operações).
+    Retorna (mudancas, proximo); ``proximo`` é o cursor para a chamada seguinte.
+    """
+    linhas = db.consultar("""SELECT seq, origem, ts, tabela, operacao, chave, dados FROM (
+                                 SELECT * FROM registro_sincronizacao WHERE cnpj = ? AND seq > ?
+                                 UNION ALL
+                                 SELECT * FROM registro_sincronizacao WHERE cnpj IS NULL AND seq > ?)
+                             ORDER BY seq LIMIT ?""",
+                          (cnpj, apos, apos, limite))
+    mudancas = [Mudanca(seq, ts, tabela, operacao, chave, json.loads(dados) if dados else None)
+                for seq, origem_linha, ts, tabela, operacao, chave, dados in linhas
+                if origem_linha != origem]
+    return mudancas, linhas[-1][0] if linhas else apos
+
+
+# Cliente (terminal)
+
+class ClienteCentral:
+    """Chamadas à API do banco central (urllib, sem dependências externas)"""
+
+    def __init__(self, url, tempo_limite=10):
+        self.url = url.rstrip('/')
+        self.tempo_limite = tempo_limite
+        self.token = None
+
+    def _requisitar(self, metodo, caminho, corpo=None):
+        cabecalhos = {'Content-Type': 'application/json'}
+        if self.token:
+            cabecalhos['Authorization'] = f"Bearer {self.token}"
+        requisicao = urllib.request.Request(
+            self.url + caminho, method=metodo, headers=cabecalhos,
+            data=None if corpo is None else json.dumps(corpo, ensure_ascii=False).encode('utf-8'))
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.tempo_limite) as resposta:
+                return json.loads(resposta.read() or b'null')
+        except urllib.error.HTTPError as e:
+            erro = json.loads(e.read() or b'{}').get('erro', str(e))
+            if e.code == 401:
+                self.token = None
+                raise NaoAutenticado(erro)
+            raise OperacaoInvalida(f"Central recusou a requisição: {erro}")
+
+    def entrar(self, cnpj, senha):
+        self.token = self._requisitar('POST', '/sessoes', {'cnpj': cnpj, 'senha': senha})['token']
+
+    def enviar(self, origem, mudancas):
+        resposta = self._requisitar('POST', '/sincronizacao', {
+            'origem': origem, 'alteracoes': [m._asdict() for m in mudancas]})
+        return [ResultadoMudanca(item['resultado'], item.get('erro'), item.get('atual'))
+                for item in resposta['resultados']]
+
+    def receber(self, apos, origem, limite=TAMANHO_LOTE):
+        resposta = self._requisitar(
+            'GET', f"/sincronizacao?apos={int(apos)}&limite={limite}"
+                   f"&origem={urllib.request.quote(origem)}")
+        return [ler_mudanca(item) for item in resposta['alteracoes']], resposta['proximo']
+
+
+class Sincronizador:
+    """Envia a fila local e recebe as alterações dos outros terminais.
+
+    ``servico`` é o serviço da empresa com a fila; ``cnpj``/``senha`` são as
+    credenciais do usuário no central. Sem conexão, sincronizar() lança
+    OSError e as alterações continuam na fila para a próxima rodada.
+    """
+
+    def __init__(self, servico, cliente, senha):
+        self.servico = servico
+        self.cliente = cliente
+        self.senha = senha
+        self.fila = servico.fila or FilaSincronizacao(servico.db)
+        db = servico.db
+        self.origem = _estado(db, 'origem') or _gravar_estado(db, 'origem', secrets.token_hex(8))
+
+    def _chamar(self, funcao, *args):
+        """Chama o central, entrando (de novo) quando o token falta ou expirou"""
+        if self.cliente.token is None:
+            self.cliente.entrar(self.servico.cnpj, self.senha)
+        try:
+            return funcao(*args)
+        except NaoAutenticado:
+            self.cliente.entrar(self.servico.cnpj, self.senha)
+            return funcao(*args)
+
+    def _desfazer(self, mudanca, erro, atual):
+        """Conflito no central: a cópia local volta a ``atual``, o estado do central"""
+        log_sincronizacao.warning("conflito em %s %s (%s): %s", mudanca.tabela, mudanca.chave,
+                                  mudanca.operacao, erro)
+        db = self.servico.db
+        local = self.servico.sem_fila()
+        # Sem a versão local, a cópia do central não é descartada como obsoleta
+        db.executar("DELETE FROM versoes_sincronizacao WHERE tabela=? AND chave=?",
+                    (mudanca.tabela, mudanca.chave))
+        with db.conexao() as conn:
+            conn.execute("SAVEPOINT desfazer")
+            try:
+                if atual is not None:
+                    _aplicar(local, mudanca._replace(operacao=INSERIR, dados=atual),
+                             do_central=True)
+                elif mudanca.tabela == 'containers':
+                    _aplicar(local, mudanca._replace(operacao=REMOVER), do_central=True)
+                elif mudanca.tabela == 'agendamentos':
+                    agendamento = _agendamento(local, *mudanca.chave.split('|', 1))
+                    if agendamento is not None:
+                        local.remover_agendamento(agendamento[0])
+            except OperacaoInvalida as e:
+                # Fica a cópia local; a próxima alteração do registro a corrige
+                conn.execute("ROLLBACK TO desfazer")
+                log_sincronizacao.error("não foi possível desfazer %s %s: %s",
+                                        mudanca.tabela, mudanca.chave, e)
+            conn.execute("RELEASE desfazer")
+
+    def _confirmar_envio(self, lote, resultados):
+        """Desfaz os conflitos do lote enviado e o tira da fila; retorna os conflitos"""
+        conflitos = 0
+        with self.servico.db.transacao():
+            for mudanca, (resultado, erro, atual) in zip(lote, resultados):
+                if resultado == CONFLITO:
+                    conflitos += 1
+                    self._desfazer(mudanca, erro, atual)
+            self.fila.confirmar(self.servico.cnpj, lote[-1].id)
+        return conflitos
+
+    def _aplicar_recebidas(self, mudancas, proximo):
+        """Aplica as alterações recebidas do central; retorna os conflitos"""
+        # Cursor gravado na mesma transação: uma rodada interrompida não reaplica nada
+        with self.servico.db.transacao():
+            resultados = mesclar(self.servico.sem_fila(), mudancas)
+            _gravar_estado(self.servico.db, 'ultimo_seq', proximo)
+        conflitos = 0
+        for mudanca, (resultado, erro, _) in zip(mudancas, resultados):
+            if resultado == CONFLITO:
+                conflitos += 1
+                log_sincronizacao.error("alteração do central não aplicada em %s %s (%s): %s",
+                                        mudanca.tabela, mudanca.chave, mudanca.operacao, erro)
+        return conflitos
+
+    def sincronizar(self, escrever=None):
+        """Uma rodada completa: envia toda a fila e recebe o que houver.
+
+        Só as gravações locais passam por ``escrever(funcao)``, que deve
+        executá-las e devolver o resultado (a interface as manda para a thread
+        de escrita); as chamadas ao central rodam na thread de quem chamou.
+        """
+        escrever = escrever or (lambda funcao: funcao())
+        cnpj = self.servico.cnpj
+        enviadas = conflitos = recebidas = 0
+
+        while True:
+            lote = self.fila.pendentes(cnpj)
+            if not lote:
+                break
+            resultados = self._chamar(self.cliente.enviar, self.origem, lote)
+            conflitos += escrever(partial(self._confirmar_envio, lote, resultados))
+            enviadas += len(lote)
+
+        apos = int(_estado(self.servico.db, 'ultimo_seq') or 0)
+        while True:
+            mudancas, proximo = self._chamar(self.cliente.receber, apos, self.origem)
+            if proximo == apos:
+                break
+            conflitos += escrever(partial(self._aplicar_recebidas, mudancas, proximo))
+            recebidas += len(mudancas)
+            apos = proximo
+
+        if recebidas or conflitos:
+            # Na thread de escrita, para não trocar o calendário no meio de uma transação
+            escrever(self.servico.invalidar_caches)
+        return ResultadoSincronizacao(enviadas, recebidas, conflitos)
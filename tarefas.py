@@ -0,0 +1,132 @@
+"""Fila de tarefas em segundo plano com entrega de resultados no loop do Tk."""
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class ExecutorTarefas:
+    """Executa acessos ao banco fora da thread da interface.
+
+    As funções submetidas rodam em um pool de threads e o resultado (ou a
+    exceção) é entregue aos callbacks na thread do Tk, por meio de um
+    polling com ``root.after`` ativo apenas enquanto houver tarefas
+    pendentes. Tarefas submetidas com a mesma ``chave`` se substituem: ao
+    chegar uma nova, a anterior é cancelada se ainda não começou e, se já
+    estiver rodando, seu resultado é descartado.
+
+    Escritas usam uma thread exclusiva para que sejam aplicadas no banco na
+    mesma ordem em que foram pedidas. Chamadas de rede (``rede=True``) têm
+    outra thread própria, para que uma resposta lenta não segure as escritas
+    nem ocupe as leituras; o que elas gravam vai para a thread de escrita por
+    meio de escrever().
+
+    Com ``metricas`` cada tarefa registra o tempo de execução ('tarefa'), o
+    do callback que atualiza a tela ('interface') e o total desde o pedido
+    até a tela atualizada ('resposta').
+    """
+
+    INTERVALO_MS = 16
+
+    def __init__(self, root, threads_leitura=2, ao_mudar_ocupado=None, metricas=None):
+        self.root = root
+        self.ao_mudar_ocupado = ao_mudar_ocupado
+        self.metricas = metricas
+        self._leitura = ThreadPoolExecutor(threads_leitura, thread_name_prefix='db-leitura')
+        self._escrita = ThreadPoolExecutor(1, thread_name_prefix='db-escrita')
+        self._rede = ThreadPoolExecutor(1, thread_name_prefix='rede')
+        self._resultados = queue.SimpleQueue()
+        self._ultimas = {}          # chave -> future mais recente
+        self._pendentes = 0
+        self._polling = None
+
+    def submeter(self, funcao, ao_concluir=None, ao_falhar=None, chave=None, escrita=False,
+                 rede=False):
+        """Agenda ``funcao()`` em segundo plano e retorna o Future"""
+        executor = self._rede if rede else self._escrita if escrita else self._leitura
+        nome = None
+        if self.metricas is not None:
+            nome = _nome_tarefa(funcao, chave)
+            funcao = self.metricas.instrumentar(funcao, 'tarefa', nome)
+        enviada = time.perf_counter()
+        future = executor.submit(funcao)
+
+        if chave is not None:
+            anterior = self._ultimas.get(chave)
+            if anterior is not None:
+                anterior.cancel()
+            self._ultimas[chave] = future
+
+        self._pendentes += 1
+        if self._pendentes == 1 and self.ao_mudar_ocupado:
+            self.ao_mudar_ocupado(True)
+
+        future.add_done_callback(
+            lambda f: self._resultados.put((f, chave, ao_concluir, ao_falhar, nome, enviada)))
+        if self._polling is None:
+            self._polling = self.root.after(self.INTERVALO_MS, self._processar)
+        return future
+
+    def escrever(self, funcao):
+        """Roda ``funcao()`` na thread de escrita e espera o resultado.
+
+        Para tarefas em segundo plano (nunca na thread do Tk): a gravação entra
+        na fila das escritas da interface, sem callbacks.
+        """
+        return self._escrita.submit(funcao).result()
+
+    def _processar(self):
+        self._polling = None
+        while True:
+            try:
+                future, chave, ao_concluir, ao_falhar, nome, enviada = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+
+            self._pendentes -= 1
+            if chave is not None:
+                if self._ultimas.get(chave) is not future:
+                    # Substituída por uma tarefa mais nova: resultado obsoleto
+                    continue
+                del self._ultimas[chave]
+            if future.cancelled():
+                continue
+
+            erro = future.exception()
+            if erro is not None:
+                if ao_falhar:
+                    ao_falhar(erro)
+                else:
+                    self.root.report_callback_exception(type(erro), erro, erro.__traceback__)
+            elif ao_concluir:
+                inicio = time.perf_counter()
+                ao_concluir(future.result())
+                if nome is not None:
+                    agora = time.perf_counter()
+                    self.metricas.registrar('interface', nome, (agora - inicio) * 1000)
+                    self.metricas.registrar('resposta', nome, (agora - enviada) * 1000)
+
+        if self._polling is not None:
+            # Um callback já submeteu nova tarefa e reagendou o polling
+            return
+        if self._pendentes:
+            self._polling = self.root.after(self.INTERVALO_MS, self._processar)
+        elif self.ao_mudar_ocupado:
+            self.ao_mudar_ocupado(False)
+
+    def encerrar(self):
+        if self._polling is not None:
+            self.root.after_cancel(self._polling)
+            self._polling = None
+        self._leitura.shutdown(wait=True, cancel_futures=True)
+        # A rede sai antes: uma rodada em andamento ainda pode pedir escritas
+        self._rede.shutdown(wait=True, cancel_futures=True)
+        self._escrita.shutdown(wait=True)
+
+
+def _nome_tarefa(funcao, chave):
+    """Nome da função submetida (sem os partial), ou a chave se for um lambda"""
+    while isinstance(funcao, partial):
+        funcao = funcao.func
+    nome = getattr(funcao, '__name__', type(funcao).__name__)
+    return str(chave) if nome == '<lambda>' and chave is not None else nome
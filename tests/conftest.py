@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Custo baixo do KDF: os testes cadastram e autenticam muitos usuários
+os.environ.setdefault('CONTAINERERP_SCRYPT_N', str(2 ** 10))
+os.environ.setdefault('CONTAINERERP_PBKDF2_ITERACOES', '1000')
+
+from database import Database  # noqa: E402
+from servicos import ServicoContainers  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = Database(str(tmp_path / 'containers.db'))
+    banco.inicializar_schema()
+    yield banco
+    banco.fechar()
+
+
+@pytest.fixture
+def servico(db):
+    return ServicoContainers(db)
+
+
+@pytest.fixture
+def container():
+    """Dados de um container válido, com os campos informados substituídos"""
+    def criar(container_id, **campos):
+        return dict({'id': container_id, 'tipo_container': 'Dry', 'altura': '2.6',
+                     'largura': '2.4', 'comprimento': '6', 'status': 'Disponível',
+                     'origem': 'Santos', 'destino': 'Rio de Janeiro'}, **campos)
+    return criar
@@ -0,0 +1,143 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from agenda import CalendarioAgendamentos
+from servicos import Conflito
+
+DIA = date(2030, 1, 10)
+
+
+def dias(*deslocamentos):
+    return [DIA + timedelta(days=d) for d in deslocamentos]
+
+
+def lotados(calendario, tipo='Carregamento'):
+    return [(date.fromordinal(inicio), date.fromordinal(fim))
+            for inicio, fim in calendario._lotados[tipo]]
+
+
+def test_dias_lotados_consecutivos_formam_um_intervalo():
+    calendario = CalendarioAgendamentos({'Carregamento': 1})
+    for dia in dias(0, 2, 1):
+        calendario.registrar('Carregamento', dia)
+    assert lotados(calendario) == [(DIA, DIA + timedelta(days=2))]
+
+
+def test_liberar_o_meio_divide_o_intervalo():
+    calendario = CalendarioAgendamentos({'Carregamento': 1})
+    for dia in dias(0, 1, 2, 3):
+        calendario.registrar('Carregamento', dia)
+    calendario.registrar('Carregamento', DIA + timedelta(days=1), -1)
+    assert lotados(calendario) == [(DIA, DIA), (DIA + timedelta(days=2), DIA + timedelta(days=3))]
+    calendario.registrar('Carregamento', DIA, -1)
+    calendario.registrar('Carregamento', DIA + timedelta(days=3), -1)
+    assert lotados(calendario) == [(DIA + timedelta(days=2), DIA + timedelta(days=2))]
+
+
+def test_proxima_data_pula_o_intervalo_lotado():
+    calendario = CalendarioAgendamentos({'Carregamento': 2})
+    for dia in dias(0, 0, 1, 1, 2):
+        calendario.registrar('Carregamento', dia)
+    assert calendario.proxima_data('Carregamento', DIA) == DIA + timedelta(days=2)
+    assert calendario.vagas('Carregamento', DIA + timedelta(days=2)) == 1
+    assert calendario.proxima_data('Carregamento', DIA - timedelta(days=1)) == DIA - timedelta(days=1)
+
+
+def test_sem_limite_nunca_lota():
+    calendario = CalendarioAgendamentos()
+    for _ in range(100):
+        calendario.registrar('Manutenção', DIA)
+    assert calendario.vagas('Manutenção', DIA) is None
+    assert calendario.disponivel('Manutenção', DIA)
+    assert calendario.proxima_data('Manutenção', DIA) == DIA
+
+
+def test_limite_zero_nao_tem_data_disponivel():
+    calendario = CalendarioAgendamentos({'Carregamento': 0})
+    assert not calendario.disponivel('Carregamento', DIA)
+    assert calendario.proxima_data('Carregamento', DIA) is None
+
+
+def test_mudar_a_capacidade_recalcula_os_intervalos():
+    calendario = CalendarioAgendamentos({'Carregamento': 2})
+    for dia in dias(0, 1, 1):
+        calendario.registrar('Carregamento', dia)
+    assert lotados(calendario) == [(DIA + timedelta(days=1), DIA + timedelta(days=1))]
+    calendario.definir_capacidade('Carregamento', 1)
+    assert lotados(calendario) == [(DIA, DIA + timedelta(days=1))]
+    calendario.definir_capacidade('Carregamento', None)
+    assert lotados(calendario) == []
+
+
+def test_remocao_alem_do_total_nao_fica_negativa():
+    calendario = CalendarioAgendamentos({'Carregamento': 1})
+    calendario.registrar('Carregamento', DIA, -3)
+    assert calendario.total('Carregamento', DIA) == 0
+    assert lotados(calendario) == []
+
+
+def test_intervalos_conferem_com_as_contagens_em_sequencia_aleatoria():
+    aleatorio = random.Random(13)
+    calendario = CalendarioAgendamentos({'Carregamento': 2})
+    for _ in range(2000):
+        dia = DIA + timedelta(days=aleatorio.randrange(30))
+        calendario.registrar('Carregamento', dia, aleatorio.choice((1, 1, -1)))
+        # Os intervalos mantidos passo a passo devem ser os recalculados do zero
+        esperado = CalendarioAgendamentos({'Carregamento': 2})
+        esperado._contagens['Carregamento'].update(calendario._contagens['Carregamento'])
+        esperado._recalcular_lotados('Carregamento')
+        assert calendario._lotados['Carregamento'] == esperado._lotados['Carregamento']
+
+    for deslocamento in range(30):
+        dia = DIA + timedelta(days=deslocamento)
+        livre = dia
+        while calendario.total('Carregamento', livre) >= 2:
+            livre += timedelta(days=1)
+        assert calendario.proxima_data('Carregamento', dia) == livre
+
+
+def test_carregar_soma_as_empresas_e_ignora_o_passado(servico, container):
+    servico.definir_capacidade('Carregamento', 2)
+    amanha = date.today() + timedelta(days=1)
+    for i, cnpj in enumerate(('11.222.333/0001-81', '11.444.777/0001-61')):
+        empresa = servico.da_empresa(cnpj)
+        empresa.adicionar_container(container(f'ABCU000000{i}'))
+        empresa.criar_agendamento(f'ABCU000000{i}', amanha.isoformat(), 'Carregamento')
+    servico.db.executar("""INSERT INTO agendamentos (container_id, data_agendamento,
+                                                     tipo_operacao, cnpj)
+                           VALUES ('ABCU0000000', '2000-01-01', 'Carregamento', NULL)""")
+
+    calendario = CalendarioAgendamentos.carregar(servico.db)
+    assert calendario.total('Carregamento', amanha) == 2
+    assert calendario.total('Carregamento', date(2000, 1, 1)) == 0
+    assert not calendario.disponivel('Carregamento', amanha)
+
+
+def test_servico_recusa_agendamento_alem_da_capacidade(servico, container):
+    servico.definir_capacidade('Carregamento', 1)
+    amanha = (date.today() + timedelta(days=1)).isoformat()
+    for container_id in ('ABCU0000001', 'ABCU0000002'):
+        servico.adicionar_container(container(container_id))
+    servico.criar_agendamento('ABCU0000001', amanha, 'Carregamento')
+    with pytest.raises(Conflito):
+        servico.criar_agendamento('ABCU0000002', amanha, 'Carregamento')
+    # A reserva recusada não fica no calendário
+    assert servico.calendario.total('Carregamento', date.fromisoformat(amanha)) == 1
+
+
+def test_recarregar_os_ids_mantem_as_reservas_do_calendario(servico, container):
+    servico.definir_capacidade('Carregamento', 1)
+    amanha = (date.today() + timedelta(days=1)).isoformat()
+    servico.adicionar_container(container('ABCU0000001'))
+    calendario = servico.calendario
+    with pytest.raises(RuntimeError):
+        with servico._transacao_agenda() as reservas:
+            calendario.registrar('Carregamento', date.fromisoformat(amanha), 1)
+            reservas.append(('Carregamento', date.fromisoformat(amanha), 1))
+            # A lista de IDs recarregada no meio da escrita não troca o calendário
+            servico.invalidar_ids()
+            raise RuntimeError
+    assert servico.calendario is calendario
+    assert servico.calendario.disponivel('Carregamento', date.fromisoformat(amanha))
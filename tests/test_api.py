@@ -0,0 +1,184 @@
+import http.client
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from api import criar_servidor
+from servicos import ServicoContainers
+
+EMPRESA_A = '11.222.333/0001-81'
+EMPRESA_B = '11.444.777/0001-61'
+AMANHA = (date.today() + timedelta(days=1)).isoformat()
+
+
+class Cliente:
+    def __init__(self, porta):
+        self.porta = porta
+        self.token = None
+
+    def requisitar(self, metodo, caminho, corpo=None, bruto=None):
+        """(status, resposta JSON); ``bruto`` envia os bytes sem codificar"""
+        conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=10)
+        cabecalhos = {'Content-Type': 'application/json'}
+        if self.token:
+            cabecalhos['Authorization'] = f"Bearer {self.token}"
+        if corpo is not None:
+            bruto = json.dumps(corpo).encode('utf-8')
+        try:
+            conexao.request(metodo, caminho, body=bruto, headers=cabecalhos)
+            resposta = conexao.getresponse()
+            return resposta.status, json.loads(resposta.read() or b'null')
+        finally:
+            conexao.close()
+
+    def entrar(self, cnpj, senha='senha123'):
+        status, resposta = self.requisitar('POST', '/sessoes', {'cnpj': cnpj, 'senha': senha})
+        assert status == 201
+        self.token = resposta['token']
+        return self
+
+
+@pytest.fixture
+def servidor(servico):
+    for razao_social, cnpj in (('Empresa A', EMPRESA_A), ('Empresa B', EMPRESA_B)):
+        servico.cadastrar_usuario(razao_social, cnpj, 'senha123')
+    servidor = criar_servidor(servico, porta=0)
+    thread = threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def cliente(servidor):
+    return Cliente(servidor.server_address[1]).entrar(EMPRESA_A)
+
+
+@pytest.fixture
+def outra_empresa(servidor):
+    return Cliente(servidor.server_address[1]).entrar(EMPRESA_B)
+
+
+def test_sessao_com_senha_errada_e_401(servidor):
+    cliente = Cliente(servidor.server_address[1])
+    status, resposta = cliente.requisitar('POST', '/sessoes',
+                                          {'cnpj': EMPRESA_A, 'senha': 'errada'})
+    assert status == 401 and 'erro' in resposta
+
+
+def test_sem_token_e_401(servidor):
+    status, _ = Cliente(servidor.server_address[1]).requisitar('GET', '/containers')
+    assert status == 401
+
+
+def test_rota_inexistente_e_404(cliente):
+    assert cliente.requisitar('GET', '/inexistente')[0] == 404
+    # A capacidade é da administração, não das empresas
+    assert cliente.requisitar('POST', '/capacidades',
+                              {'tipo_operacao': 'Carregamento', 'limite_diario': 0})[0] == 404
+
+
+def test_ciclo_do_container(cliente, container):
+    status, criado = cliente.requisitar('POST', '/containers', container('ABCU0000001'))
+    assert status == 201 and criado['id'] == 'ABCU0000001'
+    assert cliente.requisitar('POST', '/containers', container('ABCU0000001'))[0] == 409
+    assert cliente.requisitar('GET', '/containers/ABCU0000001')[0] == 200
+
+    status, atualizado = cliente.requisitar('PUT', '/containers/ABCU0000001',
+                                            container('ABCU0000001', status='Em uso'))
+    assert status == 200 and atualizado['status'] == 'Em uso'
+    status, eventos = cliente.requisitar('GET', '/containers/ABCU0000001/eventos')
+    assert [e['tipo'] for e in eventos['itens']] == [1, 2]
+
+    assert cliente.requisitar('DELETE', '/containers/ABCU0000001')[0] == 200
+    assert cliente.requisitar('GET', '/containers/ABCU0000001')[0] == 404
+
+
+def test_outra_empresa_nao_ve_o_container(cliente, outra_empresa, container):
+    cliente.requisitar('POST', '/containers', container('ABCU0000001'))
+    assert outra_empresa.requisitar('GET', '/containers/ABCU0000001')[0] == 404
+    status, pagina = outra_empresa.requisitar('GET', '/containers')
+    assert status == 200 and pagina['itens'] == []
+    # O ID é do container físico: não pode ser cadastrado por outra empresa
+    assert outra_empresa.requisitar('POST', '/containers', container('ABCU0000001'))[0] == 409
+
+
+def test_remover_com_agendamentos_exige_cascata(cliente, container):
+    cliente.requisitar('POST', '/containers', container('ABCU0000001'))
+    status, _ = cliente.requisitar('POST', '/agendamentos', {
+        'container_id': 'ABCU0000001', 'data': AMANHA, 'tipo_operacao': 'Carregamento'})
+    assert status == 201
+    assert cliente.requisitar('DELETE', '/containers/ABCU0000001')[0] == 409
+    assert cliente.requisitar('DELETE', '/containers/ABCU0000001?cascata=1')[0] == 200
+
+
+@pytest.mark.parametrize('caminho, corpo', [
+    ('/containers', {'id': 'ABCU0000001', 'status': 'Quebrado'}),
+    ('/agendamentos', {'container_id': 'ABCU0000001', 'data': 20300101,
+                       'tipo_operacao': 'Carregamento'}),
+    ('/agendamentos', {'container_id': 'ABCU0000001', 'data': '01/01/2000',
+                       'tipo_operacao': 'Carregamento'}),
+    ('/agendamentos', {'container_id': ['ABCU0000001'], 'data': AMANHA,
+                       'tipo_operacao': 'Carregamento'}),
+    ('/agendamentos/lote', {'container_ids': [1], 'data': AMANHA,
+                            'tipo_operacao': 'Carregamento'}),
+    ('/agendamentos/lote', {'container_ids': 'ABCU0000001', 'data': AMANHA,
+                            'tipo_operacao': 'Carregamento'}),
+    ('/agendamentos/recorrentes', {'tipo_operacao': 'Manutenção', 'inicio': AMANHA,
+                                   'fim': AMANHA, 'intervalo_dias': [7]}),
+    ('/agendamentos/recorrentes', {'tipo_operacao': 'Manutenção', 'inicio': AMANHA,
+                                   'fim': AMANHA, 'intervalo_dias': 'semanal'}),
+    ('/sessoes', {'cnpj': 11222333000181, 'senha': 'senha123'}),
+])
+def test_dados_invalidos_sao_422(cliente, caminho, corpo):
+    status, resposta = cliente.requisitar('POST', caminho, corpo)
+    assert status == 422 and 'erro' in resposta
+
+
+@pytest.mark.parametrize('bruto', [b'[1, 2]', b'{nao e json', b'"texto"'])
+def test_corpo_que_nao_e_objeto_e_422(cliente, bruto):
+    assert cliente.requisitar('POST', '/containers', bruto=bruto)[0] == 422
+
+
+def test_erro_do_banco_e_503(cliente, monkeypatch):
+    def falhar(self, container_id):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(ServicoContainers, 'obter_container', falhar)
+    status, resposta = cliente.requisitar('GET', '/containers/ABCU0000001')
+    assert status == 503 and 'locked' in resposta['erro']
+
+
+def test_conexao_continua_aberta_apos_erro(servidor, container):
+    """Respostas de erro não derrubam a conexão persistente (HTTP/1.1)"""
+    cliente = Cliente(servidor.server_address[1]).entrar(EMPRESA_A)
+    conexao = http.client.HTTPConnection('127.0.0.1', cliente.porta, timeout=10)
+    cabecalhos = {'Authorization': f"Bearer {cliente.token}"}
+    try:
+        for corpo, esperado in (({'container_id': 'X', 'data': 1}, 422),
+                                (container('ABCU0000001'), 201)):
+            caminho = '/agendamentos' if esperado == 422 else '/containers'
+            conexao.request('POST', caminho, body=json.dumps(corpo), headers=cabecalhos)
+            resposta = conexao.getresponse()
+            resposta.read()
+            assert resposta.status == esperado
+    finally:
+        conexao.close()
+
+
+def test_alteracao_de_sincronizacao_mal_formada_vira_conflito(cliente, container):
+    status, resposta = cliente.requisitar('POST', '/sincronizacao', {
+        'origem': 'terminal', 'alteracoes': [
+            {'ts': 1.0, 'tabela': 'containers', 'operacao': 'inserir',
+             'chave': 'ABCU0000009', 'dados': 'lixo'},
+            {'ts': 1.0, 'tabela': 'containers', 'operacao': 'inserir',
+             'chave': 'ABCU0000001', 'dados': container('ABCU0000001')},
+        ]})
+    assert status == 200
+    assert [r['resultado'] for r in resposta['resultados']] == ['conflito', 'aplicada']
+    status, _ = cliente.requisitar('POST', '/sincronizacao', {
+        'origem': 'terminal', 'alteracoes': [{'ts': 'ontem', 'tabela': 'containers'}]})
+    assert status == 422
@@ -0,0 +1,123 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+import database
+from database import Database, MIGRACOES
+from filtros import FiltroContainers
+from servicos import ServicoContainers
+
+
+def criar_banco_legado(caminho, usuarios):
+    """Banco como a versão original gravava: só a migração 1, datas DD/MM/AAAA"""
+    conn = sqlite3.connect(caminho)
+    for comando in MIGRACOES[0]:
+        conn.execute(comando)
+    conn.executemany("INSERT INTO usuarios VALUES (?, ?, 'senha')", usuarios)
+    conn.executemany("INSERT INTO containers VALUES (?, 'Dry', 2.6, 2.4, 6, ?, ?, 'Rio', ?)", [
+        ('ABCU0000001', 'Disponível', 'Santos', '05/03/2024'),
+        ('ABCU0000002', 'Em uso', 'Itajaí', '2024-03-06'),
+        ('ABCU0000003', 'Em uso', 'Santos', '31/12/2023'),
+    ])
+    conn.executemany("INSERT INTO agendamentos VALUES (?, ?, ?, ?)", [
+        (1, 'ABCU0000001', '10/04/2030', 'Carregamento'),
+        (2, 'ABCU0000001', '10/04/2030', 'Descarregamento'),  # duplicado: sai
+        (3, 'ABCU0000002', '2030-04-11', 'Manutenção'),
+        (4, 'XXXU9999999', '12/04/2030', 'Carregamento'),     # órfão: sai
+    ])
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def legado(tmp_path):
+    caminho = str(tmp_path / 'legado.db')
+    criar_banco_legado(caminho, [('Empresa', '11.222.333/0001-81')])
+    banco = Database(caminho)
+    banco.inicializar_schema()
+    yield banco
+    banco.fechar()
+
+
+def test_migra_banco_legado_ate_a_versao_atual(legado):
+    assert legado.consultar_um("PRAGMA user_version")[0] == len(MIGRACOES)
+    assert legado.consultar_um("PRAGMA integrity_check")[0] == 'ok'
+    assert legado.consultar("PRAGMA foreign_key_check") == []
+
+
+def test_agendamentos_em_iso_sem_orfaos_nem_duplicados(legado):
+    assert legado.consultar("SELECT id, container_id, data_agendamento, tipo_operacao "
+                            "FROM agendamentos ORDER BY id") == [
+        (1, 'ABCU0000001', '2030-04-10', 'Carregamento'),
+        (3, 'ABCU0000002', '2030-04-11', 'Manutenção'),
+    ]
+
+
+def test_data_de_entrada_em_iso(legado):
+    assert legado.consultar("SELECT id, data_entrada FROM containers ORDER BY id") == [
+        ('ABCU0000001', '2024-03-05'),
+        ('ABCU0000002', '2024-03-06'),
+        ('ABCU0000003', '2023-12-31'),
+    ]
+
+
+def test_registros_antigos_ficam_com_a_unica_empresa(legado):
+    assert legado.consultar("SELECT DISTINCT cnpj FROM containers") == [('11.222.333/0001-81',)]
+    assert legado.consultar("SELECT DISTINCT cnpj FROM agendamentos") == [('11.222.333/0001-81',)]
+
+
+def test_registros_antigos_sem_dono_com_varias_empresas(tmp_path):
+    caminho = str(tmp_path / 'legado.db')
+    criar_banco_legado(caminho, [('A', '11.222.333/0001-81'), ('B', '11.444.777/0001-61')])
+    banco = Database(caminho)
+    banco.inicializar_schema()
+    try:
+        assert banco.consultar("SELECT DISTINCT cnpj FROM containers") == [(None,)]
+        resumo = ServicoContainers(banco).resumo_painel()
+        assert resumo['total_containers'] == 3
+    finally:
+        banco.fechar()
+
+
+def test_busca_e_resumos_refletem_os_dados_migrados(legado):
+    servico = ServicoContainers(legado).da_empresa('11.222.333/0001-81')
+    encontrados = servico.listar_containers(FiltroContainers(texto='itajai'))
+    assert [linha[0] for linha in encontrados] == ['ABCU0000002']
+
+    resumo = servico.resumo_painel()
+    assert resumo['total_containers'] == 3
+    assert dict(resumo['status']) == {'Em uso': 2, 'Disponível': 1}
+    assert dict(resumo['origem']) == {'Santos': 2, 'Itajaí': 1}
+
+
+def test_calendario_conta_os_agendamentos_migrados(legado):
+    calendario = ServicoContainers(legado).calendario
+    assert calendario.total('Carregamento', date(2030, 4, 10)) == 1
+    assert calendario.total('Descarregamento', date(2030, 4, 10)) == 0
+
+
+def test_inicializar_de_novo_nao_altera_nada(legado):
+    antes = legado.consultar("SELECT * FROM agendamentos ORDER BY id")
+    legado.inicializar_schema()
+    assert legado.consultar_um("PRAGMA user_version")[0] == len(MIGRACOES)
+    assert legado.consultar("SELECT * FROM agendamentos ORDER BY id") == antes
+
+
+def test_migracao_que_falha_e_desfeita_inteira(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'novo.db')
+    quebrada = MIGRACOES + (("CREATE TABLE temporaria (x)", "SELECT * FROM inexistente"),)
+    monkeypatch.setattr(database, 'MIGRACOES', quebrada)
+    banco = Database(caminho)
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            banco.inicializar_schema()
+        assert banco.consultar_um("PRAGMA user_version")[0] == len(MIGRACOES)
+        assert banco.consultar_um(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'temporaria'")[0] == 0
+    finally:
+        banco.fechar()
+
+
+def test_banco_novo_usa_auto_vacuum_incremental(db):
+    assert db.consultar_um("PRAGMA auto_vacuum")[0] == 2
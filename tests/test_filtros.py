@@ -0,0 +1,112 @@
+import itertools
+
+import pytest
+
+from filtros import FiltroContainers, IndiceIds, faixa_prefixo, sem_caixa
+
+IDS = ('ABCU0000001', 'abcu0000002', 'AbZU0000003', 'ABD[0000004', 'XYZU0000005', 'ÁBCU0000006')
+
+
+@pytest.fixture
+def povoado(servico, container):
+    portos = (('Santos', 'Rio de Janeiro'), ('Itajaí', 'Santos'), ('santos', 'Manaus'))
+    for i, container_id in enumerate(IDS):
+        origem, destino = portos[i % len(portos)]
+        servico.adicionar_container(container(
+            container_id, origem=origem, destino=destino,
+            status=('Disponível', 'Em uso')[i % 2],
+            tipo_container=('Dry', 'Reefer', 'Open Top')[i % 3]))
+    servico.db.executar("UPDATE containers SET data_entrada = '2024-0' || (rowid % 3 + 1) || '-15'")
+    return servico
+
+
+CRITERIOS = [
+    {}, {'prefixo_id': 'abc'}, {'prefixo_id': 'ABC'}, {'prefixo_id': 'abz'},
+    {'prefixo_id': 'ABD['}, {'prefixo_id': 'Á'}, {'prefixo_id': 'zz'},
+    {'status': 'Em uso'}, {'tipo_container': 'Reefer'},
+    {'origem': 'SANTOS'}, {'destino': 'santos'},
+    {'entrada_de': '01/02/2024'}, {'entrada_ate': '15/02/2024'},
+    {'texto': 'itajai'}, {'texto': 'sant'}, {'texto': 'abcu0000002'},
+]
+
+
+@pytest.mark.parametrize('criterios', CRITERIOS + [
+    dict(a, **b) for a, b in itertools.combinations(CRITERIOS[1:], 2)
+    if not set(a) & set(b)])
+def test_aceita_concorda_com_sql(povoado, criterios):
+    filtro = FiltroContainers(**criterios)
+    pelo_sql = {linha[0] for linha in povoado.listar_containers(filtro, limite=100)}
+    em_memoria = {linha[0] for linha in povoado.listar_containers(limite=100)
+                  if filtro.aceita(linha)}
+    assert pelo_sql == em_memoria
+
+
+@pytest.mark.parametrize('criterios', CRITERIOS)
+def test_paginas_percorrem_o_filtro_nos_dois_sentidos(povoado, criterios):
+    filtro = FiltroContainers(**criterios)
+    completa = [linha[0] for linha in povoado.listar_containers(filtro, limite=100)]
+    if filtro.ordem(completa[0] if completa else '') is not None:
+        assert completa == sorted(completa, key=filtro.ordem)
+    paginas, pagina = [], povoado.listar_containers(filtro, limite=2)
+    while pagina:
+        paginas += [linha[0] for linha in pagina]
+        pagina = povoado.listar_containers(filtro, apos=paginas[-1], limite=2)
+    assert paginas == completa
+    anteriores = completa[-1:]
+    while anteriores:
+        pagina = povoado.listar_containers(filtro, antes=anteriores[0], limite=2)
+        if not pagina:
+            break
+        anteriores[:0] = [linha[0] for linha in pagina]
+    assert anteriores == completa
+
+
+def test_ids_que_so_diferem_na_caixa_nao_se_perdem_entre_paginas(servico, container):
+    for container_id in ('ABCU0000001', 'abcu0000001', 'AbCu0000001', 'ABCU0000002'):
+        servico.adicionar_container(container(container_id))
+    filtro = FiltroContainers(prefixo_id='abcu')
+    paginas, pagina = [], servico.listar_containers(filtro, limite=1)
+    while pagina:
+        paginas += [linha[0] for linha in pagina]
+        pagina = servico.listar_containers(filtro, apos=paginas[-1], limite=1)
+    assert paginas == ['ABCU0000001', 'abcu0000001', 'AbCu0000001', 'ABCU0000002']
+
+
+def test_prefixo_ignora_maiusculas_e_minusculas(povoado):
+    filtro = FiltroContainers(prefixo_id='ABCU')
+    assert [linha[0] for linha in povoado.listar_containers(filtro)] == [
+        'ABCU0000001', 'abcu0000002']
+
+
+def test_faixa_de_prefixo_em_minusculas_inclui_o_z():
+    inicio, fim = faixa_prefixo(sem_caixa('AZ'))
+    assert inicio <= 'azu0000001' < fim
+
+
+def test_indice_busca_sem_distinguir_caixa():
+    indice = IndiceIds(IDS)
+    assert indice.buscar('abcu') == ['ABCU0000001', 'abcu0000002']
+    assert indice.buscar('AbZ') == ['AbZU0000003']
+    assert indice.buscar('x', limite=1) == ['XYZU0000005']
+    assert indice.buscar('', limite=2) == ['ABCU0000001', 'abcu0000002']
+
+
+def test_indice_adicionar_e_remover():
+    indice = IndiceIds(['ABCU0000001'])
+    indice.adicionar('abcu0000001')
+    indice.adicionar('abcu0000001')
+    assert len(indice) == 2
+    assert 'abcu0000001' in indice and 'ABCU0000001' in indice
+    indice.remover('ABCU0000001')
+    assert 'ABCU0000001' not in indice
+    assert indice.buscar('ABC') == ['abcu0000001']
+
+
+def test_autocompletar_nao_espera_a_carga(servico, container):
+    servico.adicionar_container(container('abcu0000001'))
+    assert servico.buscar_ids('ABC', esperar=False) == []
+    assert servico.buscar_ids('ABC') == ['abcu0000001']
+    servico.invalidar_ids()
+    # Recarga pendente: responde com o índice anterior, mantido pelas escritas
+    servico.adicionar_container(container('ABCU0000002'))
+    assert servico.buscar_ids('abc', esperar=False) == ['abcu0000001', 'ABCU0000002']
@@ -0,0 +1,281 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from api import criar_servidor
+from database import Database, INSERIR
+from importacao import importar_manifesto
+from servicos import ServicoContainers
+from sincronizacao import (APLICADA, CONFLITO, OBSOLETA, ClienteCentral, FilaSincronizacao,
+                           Mudanca, Sincronizador, fila_do_banco, marcar_central, mesclar)
+
+EMPRESA_A = '11.222.333/0001-81'
+EMPRESA_B = '11.444.777/0001-61'
+AMANHA = (date.today() + timedelta(days=1)).isoformat()
+
+
+class Rede:
+    """Um banco central servido pela API e os bancos dos terminais"""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.bancos = []
+        self.central = self.abrir('central.db', central=True)
+        for razao_social, cnpj in (('Empresa A', EMPRESA_A), ('Empresa B', EMPRESA_B)):
+            self.central.cadastrar_usuario(razao_social, cnpj, 'senha123')
+        self.servidor = criar_servidor(self.central, porta=0)
+        threading.Thread(target=self.servidor.serve_forever, args=(0.05,), daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def abrir(self, nome, central=False):
+        db = Database(str(self.pasta / nome))
+        db.inicializar_schema()
+        if central:
+            marcar_central(db)
+        self.bancos.append(db)
+        return ServicoContainers(db, fila=fila_do_banco(db, terminal=not central))
+
+    def terminal(self, nome, cnpj=EMPRESA_A):
+        servico = self.abrir(nome).da_empresa(cnpj)
+        return servico, Sincronizador(servico, ClienteCentral(self.url), 'senha123')
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        for db in self.bancos:
+            db.fechar()
+
+
+@pytest.fixture
+def rede(tmp_path):
+    rede = Rede(tmp_path)
+    yield rede
+    rede.fechar()
+
+
+def ids(servico):
+    return sorted(linha[0] for linha in servico.listar_containers())
+
+
+def agendamentos(servico):
+    return servico.db.consultar("""SELECT container_id, data_agendamento, tipo_operacao
+                                   FROM agendamentos ORDER BY container_id, data_agendamento""")
+
+
+def depois():
+    # Garante instantes distintos entre alterações de terminais diferentes
+    time.sleep(0.01)
+
+
+def test_container_chega_aos_outros_terminais(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    a.adicionar_container(container('ABCU0000001'))
+    assert sa.sincronizar().enviadas == 1
+    assert sb.sincronizar().recebidas == 1
+    assert ids(b) == ['ABCU0000001']
+    assert a.fila.total(EMPRESA_A) == 0
+
+
+def test_escrita_direta_no_central_chega_aos_terminais(rede, container):
+    a, sa = rede.terminal('a.db')
+    rede.central.da_empresa(EMPRESA_A).adicionar_container(container('CENU0000001'))
+    rede.central.definir_capacidade('Carregamento', 7)
+    sa.sincronizar()
+    assert ids(a) == ['CENU0000001']
+    assert a.calendario.capacidades == {'Carregamento': 7}
+
+
+def test_importacao_no_terminal_e_sincronizada(rede, container, tmp_path):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    manifesto = tmp_path / 'manifesto.jsonl'
+    manifesto.write_text('\n'.join(json.dumps(container(f'IMPU000000{i}')) for i in range(3)),
+                         encoding='utf-8')
+    importar_manifesto(a.db, str(manifesto), cnpj=EMPRESA_A, fila=a.fila)
+    sa.sincronizar()
+    sb.sincronizar()
+    assert ids(b) == ['IMPU0000000', 'IMPU0000001', 'IMPU0000002']
+
+
+def test_atualizacao_posterior_vence_remocao_anterior(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    a.adicionar_container(container('ABCU0000001'))
+    sa.sincronizar()
+    sb.sincronizar()
+
+    a.remover_container('ABCU0000001', cascata=True)
+    depois()
+    b.atualizar_container('ABCU0000001', container('ABCU0000001', status='Em uso'))
+    sa.sincronizar()
+    sb.sincronizar()
+    sa.sincronizar()
+
+    for servico in (a, b, rede.central.da_empresa(EMPRESA_A)):
+        assert [linha[5] for linha in servico.listar_containers()] == ['Em uso']
+
+
+def test_remocao_posterior_vence_atualizacao_anterior(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    a.adicionar_container(container('ABCU0000001'))
+    sa.sincronizar()
+    sb.sincronizar()
+
+    b.atualizar_container('ABCU0000001', container('ABCU0000001', status='Em uso'))
+    depois()
+    a.remover_container('ABCU0000001', cascata=True)
+    sa.sincronizar()
+    sb.sincronizar()
+    sa.sincronizar()
+
+    for servico in (a, b, rede.central.da_empresa(EMPRESA_A)):
+        assert ids(servico) == []
+
+
+def test_container_de_outra_empresa_e_desfeito_no_terminal(rede, container):
+    a, sa = rede.terminal('a.db')
+    x, sx = rede.terminal('x.db', EMPRESA_B)
+    a.adicionar_container(container('ABCU0000001'))
+    sa.sincronizar()
+    x.adicionar_container(container('ABCU0000001'))
+    assert sx.sincronizar().conflitos == 1
+    assert ids(x) == []
+    assert ids(rede.central.da_empresa(EMPRESA_B)) == []
+
+
+def test_agendamento_em_conflito_volta_ao_do_central(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    a.adicionar_container(container('ABCU0000001'))
+    sa.sincronizar()
+    sb.sincronizar()
+
+    a.criar_agendamento('ABCU0000001', AMANHA, 'Descarregamento')
+    sa.sincronizar()
+    b.criar_agendamento('ABCU0000001', AMANHA, 'Manutenção')
+    assert sb.sincronizar().conflitos == 1
+    assert agendamentos(b) == [('ABCU0000001', AMANHA, 'Descarregamento')]
+    assert b.calendario.total('Manutenção', date.fromisoformat(AMANHA)) == 0
+
+
+def test_agendamento_sem_vaga_no_central_e_cancelado_no_terminal(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    rede.central.definir_capacidade('Carregamento', 1)
+    for container_id in ('ABCU0000001', 'ABCU0000002'):
+        a.adicionar_container(container(container_id))
+    a.criar_agendamento('ABCU0000001', AMANHA, 'Carregamento')
+    sa.sincronizar()
+    sb.sincronizar()
+
+    # O terminal B ainda não tinha a capacidade ao agendar
+    b.db.executar("DELETE FROM capacidade_operacoes")
+    b.invalidar_caches()
+    b.criar_agendamento('ABCU0000002', AMANHA, 'Carregamento')
+    assert sb.sincronizar().conflitos == 1
+    assert agendamentos(b) == [('ABCU0000001', AMANHA, 'Carregamento')]
+
+
+def test_alteracao_aceita_no_central_ignora_as_regras_locais(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    # B com capacidade local esgotada: o agendamento já aceito pelo central entra mesmo assim
+    b.db.executar("INSERT INTO capacidade_operacoes VALUES ('Carregamento', 0)")
+    b.invalidar_caches()
+    a.adicionar_container(container('ABCU0000001'))
+    a.criar_agendamento('ABCU0000001', AMANHA, 'Carregamento')
+    sa.sincronizar()
+    resultado = sb.sincronizar()
+    assert resultado.conflitos == 0
+    assert agendamentos(b) == [('ABCU0000001', AMANHA, 'Carregamento')]
+
+
+def test_sem_conexao_a_fila_fica_para_a_proxima_rodada(tmp_path, container):
+    db = Database(str(tmp_path / 'a.db'))
+    db.inicializar_schema()
+    try:
+        servico = ServicoContainers(db, fila=FilaSincronizacao(db)).da_empresa(EMPRESA_A)
+        servico.adicionar_container(container('ABCU0000001'))
+        sincronizador = Sincronizador(servico, ClienteCentral('http://127.0.0.1:9', 1), 'x')
+        with pytest.raises(OSError):
+            sincronizador.sincronizar()
+        assert servico.fila.total(EMPRESA_A) == 1
+    finally:
+        db.fechar()
+
+
+def test_mesclar_isola_a_alteracao_mal_formada(servico, container):
+    empresa = servico.da_empresa(EMPRESA_A).sem_fila()
+    agora = time.time()
+    resultados = mesclar(empresa, [
+        Mudanca(1, agora, 'containers', INSERIR, 'ABCU0000009', 'lixo'),
+        Mudanca(2, agora, 'containers', INSERIR, 'ABCU0000008',
+                container('ABCU0000008', altura=[1])),
+        Mudanca(3, agora, 'containers', INSERIR, 'ABCU0000001', container('ABCU0000001')),
+        Mudanca(4, agora - 60, 'containers', INSERIR, 'ABCU0000001',
+                container('ABCU0000001', status='Em uso')),
+    ], origem='terminal')
+    assert [r.resultado for r in resultados] == [CONFLITO, CONFLITO, APLICADA, OBSOLETA]
+    assert ids(empresa) == ['ABCU0000001']
+    assert empresa.obter_container('ABCU0000001')[5] == 'Disponível'
+
+
+def test_so_as_gravacoes_locais_passam_pela_thread_de_escrita(rede, container):
+    a, sa = rede.terminal('a.db')
+    b, sb = rede.terminal('b.db')
+    a.adicionar_container(container('ABCU0000001'))
+    b.adicionar_container(container('ABCU0000002'))
+    sb.sincronizar()
+    escritas = []
+
+    def escrever(funcao):
+        escritas.append(getattr(funcao, 'func', funcao).__name__)
+        return funcao()
+
+    assert sa.sincronizar(escrever) == (1, 1, 0)
+    assert escritas == ['_confirmar_envio', '_aplicar_recebidas', 'invalidar_caches']
+    assert ids(a) == ['ABCU0000001', 'ABCU0000002']
+
+
+def test_banco_sem_central_nao_acumula_fila(db, container):
+    assert fila_do_banco(db) is None
+    ServicoContainers(db, fila=fila_do_banco(db)).da_empresa(EMPRESA_A).adicionar_container(
+        container('ABCU0000001'))
+    assert db.consultar_um("SELECT COUNT(*) FROM versoes_sincronizacao")[0] == 0
+    # Configurado o central, a fila continua mesmo em quem não o informa (linha de comando)
+    Sincronizador(ServicoContainers(db, fila=fila_do_banco(db, terminal=True)),
+                  ClienteCentral('http://127.0.0.1:9'), 'x')
+    assert isinstance(fila_do_banco(db), FilaSincronizacao)
+
+
+def test_mesclar_isola_a_alteracao_recusada_pelo_banco(servico, container):
+    empresa = servico.da_empresa(EMPRESA_A).sem_fila()
+    agora = time.time()
+    resultados = mesclar(empresa, [
+        Mudanca(1, agora, 'capacidade_operacoes', INSERIR, 'Carregamento', {'limite_diario': -1}),
+        Mudanca(2, agora, 'containers', INSERIR, 'ABCU0000001', container('ABCU0000001')),
+    ])
+    assert [r.resultado for r in resultados] == [CONFLITO, APLICADA]
+    assert 'CHECK' in resultados[0].erro
+    assert ids(empresa) == ['ABCU0000001']
+
+
+def test_reimportacao_so_enfileira_o_que_mudou(db, container, tmp_path):
+    fila = FilaSincronizacao(db)
+    manifesto = tmp_path / 'manifesto.jsonl'
+    registros = [container(f'IMPU000000{i}') for i in range(3)]
+    manifesto.write_text('\n'.join(map(json.dumps, registros)), encoding='utf-8')
+    importar_manifesto(db, str(manifesto), cnpj=EMPRESA_A, fila=fila)
+    fila.confirmar(EMPRESA_A, 10 ** 9)
+
+    registros[1]['status'] = 'Em uso'
+    manifesto.write_text('\n'.join(map(json.dumps, registros + [{'id': 'inválido'}])),
+                         encoding='utf-8')
+    for atualizar in (False, True):
+        importar_manifesto(db, str(manifesto), atualizar=atualizar, cnpj=EMPRESA_A, fila=fila)
+    assert [m.chave for m in fila.pendentes(EMPRESA_A)] == ['IMPU0000001']
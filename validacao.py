@@ -0,0 +1,60 @@
+"""Regras de validação compartilhadas entre a interface e as rotinas em lote."""
+import re
+from datetime import date, datetime
+
+TIPOS_CONTAINER = ('Dry', 'Reefer', 'Open Top', 'Flat Rack', 'Tank')
+STATUS_CONTAINER = ('Disponível', 'Em uso', 'Necessita manutenção')
+TIPOS_OPERACAO = ('Carregamento', 'Descarregamento', 'Manutenção')
+
+# Colunas da tabela containers informadas pelo usuário, na ordem do INSERT
+CAMPOS_CONTAINER = ('id', 'tipo_container', 'altura', 'largura', 'comprimento',
+                    'status', 'origem', 'destino')
+DIMENSOES = ('altura', 'largura', 'comprimento')
+
+
+class OperacaoInvalida(Exception):
+    """Regra de negócio violada; a mensagem é exibida ao usuário"""
+
+
+def ler_data(texto):
+    """Aceita datas em 'DD/MM/AAAA' ou 'AAAA-MM-DD' e retorna um date"""
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto.strip(), formato).date()
+        except ValueError:
+            pass
+    raise OperacaoInvalida("Data inválida")
+
+
+def validar_cnpj(cnpj):
+    """Confere se o CNPJ tem 14 dígitos (com ou sem pontuação)"""
+    if len(re.sub(r'[^0-9]', '', cnpj)) != 14:
+        raise OperacaoInvalida("CNPJ inválido")
+
+
+def validar_container(valores, data_entrada=None):
+    """Valida os campos de um container e retorna a linha pronta para o INSERT.
+
+    ``valores`` é um dicionário indexado pelos nomes de CAMPOS_CONTAINER.
+    Sem ``data_entrada`` é usada a data de hoje (datas em ISO-8601).
+    """
+    valores = {campo: str(valores.get(campo) or '').strip() for campo in CAMPOS_CONTAINER}
+
+    if not all(valores.values()):
+        raise OperacaoInvalida("Todos os campos são obrigatórios")
+
+    try:
+        for dim in DIMENSOES:
+            valores[dim] = float(valores[dim].replace(',', '.'))
+    except ValueError:
+        raise OperacaoInvalida("Dimensões devem ser números válidos")
+
+    if valores['tipo_container'] not in TIPOS_CONTAINER:
+        raise OperacaoInvalida(f"Tipo de container inválido: {valores['tipo_container']}")
+    if valores['status'] not in STATUS_CONTAINER:
+        raise OperacaoInvalida(f"Status inválido: {valores['status']}")
+
+    if data_entrada is None:
+        data_entrada = date.today().isoformat()
+
+    return tuple(valores[campo] for campo in CAMPOS_CONTAINER) + (data_entrada,)
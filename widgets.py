@@ -0,0 +1,218 @@
+"""Widgets Tk reutilizáveis do sistema de containers."""
+from bisect import bisect_left
+
+from database import REMOVER
+
+
+class TreeviewPaginada:
+    """Lista virtual sobre um ttk.Treeview, carregada página a página.
+
+    Mantém no Treeview apenas uma janela deslizante de no máximo
+    ``max_paginas`` páginas. Quando a rolagem se aproxima do fim (ou do
+    início) da janela, a próxima página é buscada por keyset a partir da
+    última (ou primeira) chave carregada e a página do lado oposto é
+    descartada, de modo que a memória usada não depende do tamanho da tabela.
+
+    ``buscar_pagina(apos=None, antes=None, limite=N)`` deve devolver as
+    linhas em ordem crescente de chave; ``chave_da_linha`` extrai a chave de
+    uma linha (por padrão a primeira coluna), usada também como iid do item.
+    ``ordem(chave)`` dá a posição da chave na ordem da consulta (por padrão
+    a própria chave), ou None se ela não é conhecida pela chave: então as
+    linhas novas vão para o fim, como na ordem de cadastro.
+    Com um ``executor`` (ExecutorTarefas) as páginas são buscadas em segundo
+    plano e um recarregamento mais novo descarta as buscas anteriores.
+    ``ao_recarregar`` é chamado sempre que uma primeira página é exibida.
+    """
+
+    # Fração da janela a partir da qual a próxima página é buscada
+    MARGEM = 0.15
+
+    def __init__(self, tree, scrollbar, buscar_pagina, tamanho_pagina=200,
+                 max_paginas=3, chave_da_linha=None, formatar=None, executor=None,
+                 ao_recarregar=None, ordem=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.buscar_pagina = buscar_pagina
+        self.tamanho_pagina = tamanho_pagina
+        self.max_linhas = tamanho_pagina * max_paginas
+        self.chave_da_linha = chave_da_linha or (lambda linha: linha[0])
+        self.formatar = formatar or (lambda linha: linha)
+        self.executor = executor
+        self.ao_recarregar = ao_recarregar
+        self.ordem = ordem or (lambda chave: chave)
+
+        self._chaves = []           # chaves carregadas, em ordem
+        self._tem_anteriores = False
+        self._tem_posteriores = False
+        self._agendado = None
+        self._buscando = False
+
+        self.tree.configure(yscrollcommand=self._ao_rolar)
+
+    def _buscar(self, ao_receber, **kwargs):
+        if self.executor is None:
+            ao_receber(self.buscar_pagina(limite=self.tamanho_pagina, **kwargs))
+            return
+
+        def concluido(linhas):
+            self._buscando = False
+            ao_receber(linhas)
+
+        def falhou(erro):
+            self._buscando = False
+            self.tree.report_callback_exception(type(erro), erro, erro.__traceback__)
+
+        self._buscando = True
+        self.executor.submeter(
+            lambda: self.buscar_pagina(limite=self.tamanho_pagina, **kwargs),
+            ao_concluir=concluido, ao_falhar=falhou, chave=self)
+
+    def recarregar(self):
+        """Descarta a janela atual e carrega a primeira página"""
+        self._cancelar_agendado()
+        self._buscar(self._exibir_primeira_pagina)
+
+    def _exibir_primeira_pagina(self, linhas):
+        self.tree.delete(*self.tree.get_children())
+        self._chaves = []
+        self._tem_anteriores = False
+        self._tem_posteriores = len(linhas) == self.tamanho_pagina
+        self._anexar(linhas)
+        if self.ao_recarregar:
+            self.ao_recarregar()
+
+    def aplicar(self, alteracao):
+        """Aplica uma Alteracao à janela carregada sem consultar o banco.
+
+        Linhas removidas saem da lista, linhas atualizadas têm os valores
+        trocados e linhas novas são inseridas na posição ordenada apenas se
+        a chave cair dentro da janela atualmente carregada.
+        """
+        chave = alteracao.chave
+        iid = str(chave)
+        if alteracao.operacao == REMOVER:
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+                self._chaves.remove(chave)
+            return
+
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=self.formatar(alteracao.linha))
+            return
+
+        # Fora da janela carregada: será buscada quando a rolagem chegar lá
+        ordem = self.ordem(chave)
+        if ordem is None:
+            if self._tem_posteriores:
+                return
+            posicao = len(self._chaves)
+        else:
+            ordens = [self.ordem(carregada) for carregada in self._chaves]
+            if ordens and ((ordem < ordens[0] and self._tem_anteriores) or
+                           (ordem > ordens[-1] and self._tem_posteriores)):
+                return
+            posicao = bisect_left(ordens, ordem)
+        self.tree.insert('', posicao, iid=iid, values=self.formatar(alteracao.linha))
+        self._chaves.insert(posicao, chave)
+        if len(self._chaves) > self.max_linhas:
+            self.tree.delete(str(self._chaves.pop()))
+            self._tem_posteriores = True
+
+    def _anexar(self, linhas):
+        for linha in linhas:
+            chave = self.chave_da_linha(linha)
+            self.tree.insert('', 'end', iid=str(chave), values=self.formatar(linha))
+            self._chaves.append(chave)
+
+    def _preceder(self, linhas):
+        for posicao, linha in enumerate(linhas):
+            chave = self.chave_da_linha(linha)
+            self.tree.insert('', posicao, iid=str(chave), values=self.formatar(linha))
+        self._chaves[:0] = [self.chave_da_linha(linha) for linha in linhas]
+
+    def _ao_rolar(self, primeiro, ultimo):
+        self.scrollbar.set(primeiro, ultimo)
+        if self._agendado is not None or self._buscando or not self._chaves:
+            return
+
+        primeiro, ultimo = float(primeiro), float(ultimo)
+        if ultimo >= 1.0 - self.MARGEM and self._tem_posteriores:
+            self._agendado = self.tree.after_idle(self._carregar_posteriores)
+        elif primeiro <= self.MARGEM and self._tem_anteriores:
+            self._agendado = self.tree.after_idle(self._carregar_anteriores)
+
+    def _cancelar_agendado(self):
+        if self._agendado is not None:
+            self.tree.after_cancel(self._agendado)
+            self._agendado = None
+
+    def _item_no_topo(self):
+        primeiro = float(self.tree.yview()[0])
+        indice = min(int(primeiro * len(self._chaves)), len(self._chaves) - 1)
+        return str(self._chaves[indice])
+
+    def _restaurar_topo(self, iid):
+        if self._chaves and self.tree.exists(iid):
+            self.tree.yview_moveto(self.tree.index(iid) / len(self._chaves))
+
+    def _carregar_posteriores(self):
+        self._agendado = None
+        self._buscar(self._exibir_posteriores, apos=self._chaves[-1])
+
+    def _exibir_posteriores(self, linhas):
+        self._tem_posteriores = len(linhas) == self.tamanho_pagina
+        if not linhas:
+            return
+
+        topo = self._item_no_topo()
+        self._anexar(linhas)
+        excesso = len(self._chaves) - self.max_linhas
+        if excesso > 0:
+            self.tree.delete(*(str(chave) for chave in self._chaves[:excesso]))
+            del self._chaves[:excesso]
+            self._tem_anteriores = True
+        self._restaurar_topo(topo)
+
+    def _carregar_anteriores(self):
+        self._agendado = None
+        self._buscar(self._exibir_anteriores, antes=self._chaves[0])
+
+    def _exibir_anteriores(self, linhas):
+        self._tem_anteriores = len(linhas) == self.tamanho_pagina
+        if not linhas:
+            return
+
+        topo = self._item_no_topo()
+        self._preceder(linhas)
+        excesso = len(self._chaves) - self.max_linhas
+        if excesso > 0:
+            self.tree.delete(*(str(chave) for chave in self._chaves[-excesso:]))
+            del self._chaves[-excesso:]
+            self._tem_posteriores = True
+        self._restaurar_topo(topo)
+
+
+class AutocompletarCombobox:
+    """Sugestões por prefixo para um ttk.Combobox editável.
+
+    O Tk não lida bem com listas de centenas de milhares de valores; em vez
+    de carregar todos, a lista do combobox é trocada a cada digitação (e ao
+    abrir o menu) pelas ``limite`` primeiras chaves que começam com o texto
+    digitado, obtidas de ``buscar(prefixo, limite)``.
+    """
+
+    TECLAS_NAVEGACAO = ('Up', 'Down', 'Return', 'Escape', 'Tab')
+
+    def __init__(self, combo, buscar, limite=50):
+        self.combo = combo
+        self.buscar = buscar
+        self.limite = limite
+        combo.configure(postcommand=self.atualizar)
+        combo.bind('<KeyRelease>', self._ao_digitar, add='+')
+
+    def _ao_digitar(self, event):
+        if event.keysym not in self.TECLAS_NAVEGACAO:
+            self.atualizar()
+
+    def atualizar(self):
+        self.combo['values'] = self.buscar(self.combo.get(), self.limite)